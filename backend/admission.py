@@ -0,0 +1,192 @@
+from __future__ import annotations
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+# Přijímání konverzí: omezený počet slotů, krátká fronta s férovým
+# pořadím (round-robin podle klienta) a oddělené pruhy pro platící
+# uživatele, rendice /img/ (anonymní CDN, nesmí předběhnout platící)
+# a free uživatele. Co se do fronty nevejde nebo by čekalo příliš dlouho,
+# se odmítne hned s Retry-After odhadnutým z průměrné doby konverze,
+# případně z odhadu ceny jednotlivých požadavků (estimate.py).
+
+LANES = ("paid", "img", "free")
+
+
+class Rejected(Exception):
+    """status 429 = klient má ve frontě moc požadavků, 503 = server je plný."""
+
+    def __init__(self, status: int, code: str, retry_after: int):
+        super().__init__(code)
+        self.status = status
+        self.code = code
+        self.retry_after = retry_after
+
+
+class Ticket:
+    __slots__ = ("client", "lane", "cost", "granted", "started", "event")
+
+    def __init__(self, client: str, lane: str, cost: float = 0.0):
+        self.client = client
+        self.lane = lane
+        self.cost = cost
+        self.granted = False
+        self.started = 0.0
+        self.event = threading.Event()
+
+
+class AdmissionQueue:
+    """
+    slots      – kolik konverzí běží současně
+    max_depth  – kolik požadavků smí celkem čekat (img a free pruh jen free_depth)
+    per_client – kolik požadavků jednoho klienta smí čekat
+    max_wait   – déle se ve frontě nečeká; když odhad čekání vyjde víc,
+                 odmítne se rovnou
+    weights    – kolik slotů za kolo dostane který pruh, když čekají oba
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        max_depth: Optional[int] = None,
+        free_depth: Optional[int] = None,
+        per_client: int = 2,
+        max_wait: float = 30.0,
+        weights: Optional[Dict[str, int]] = None,
+        initial_estimate: float = 2.0,
+        alpha: float = 0.2,
+    ):
+        self.slots = max(1, int(slots))
+        self.max_depth = self.slots * 4 if max_depth is None else max(0, int(max_depth))
+        self.free_depth = self.max_depth // 2 if free_depth is None else min(self.max_depth, int(free_depth))
+        self.per_client = max(1, int(per_client))
+        self.max_wait = max_wait
+        self.alpha = alpha
+        self.avg_seconds = initial_estimate
+        self.running = 0
+        self.rejected = 0
+        weights = weights or {"paid": 3, "img": 2, "free": 1}
+        self._schedule = [lane for lane in LANES for _ in range(max(1, weights.get(lane, 1)))]
+        self._turn = 0
+        self._lanes: Dict[str, "OrderedDict[str, Deque[Ticket]]"] = {lane: OrderedDict() for lane in LANES}
+        self._depth = {lane: 0 for lane in LANES}
+        self._queued_seconds = 0.0  # součet odhadů čekajících požadavků
+        self._lock = threading.Lock()
+
+    # ── stav ────────────────────────────────────────────────────
+    @property
+    def waiting(self) -> int:
+        return sum(self._depth.values())
+
+    def retry_after(self, ahead: Optional[int] = None) -> int:
+        """Odhad sekund, než se uvolní slot pro požadavek za `ahead` čekajícími."""
+        if ahead is None:
+            return max(1, min(600, math.ceil(self.wait_seconds())))
+        return max(1, min(600, math.ceil(self.avg_seconds * (ahead + 1) / self.slots)))
+
+    def wait_seconds(self) -> float:
+        """Odhad čekání nového požadavku na slot: práce ve frontě + jedna běžící konverze, na slot."""
+        if self.running < self.slots and self.waiting == 0:
+            return 0.0
+        return (self._queued_seconds + self.avg_seconds) / self.slots
+
+    # ── API ─────────────────────────────────────────────────────
+    def acquire(self, client: str, lane: str = "free", cost: Optional[float] = None) -> Ticket:
+        """
+        Vrátí Ticket s přiděleným slotem, nebo vyhodí Rejected.
+        cost – odhad doby konverze v sekundách (None = průměr posledních)
+        """
+        if lane not in self._lanes:
+            raise ValueError(f"unknown lane: {lane!r}")
+        ticket = Ticket(client, lane, self.avg_seconds if cost is None else max(0.0, cost))
+        with self._lock:
+            if self.running < self.slots and self.waiting == 0:
+                self._grant(ticket)
+                return ticket
+            self._check_room(client, lane)
+            queue = self._lanes[lane].setdefault(client, deque())
+            queue.append(ticket)
+            self._depth[lane] += 1
+            self._queued_seconds += ticket.cost
+
+        if ticket.event.wait(self.max_wait):
+            return ticket
+        with self._lock:
+            if ticket.granted:  # slot přišel těsně po timeoutu
+                return ticket
+            self._remove(ticket)
+            self.rejected += 1
+            raise Rejected(503, "queue_timeout", self.retry_after())
+
+    def release(self, ticket: Ticket):
+        with self._lock:
+            if not ticket.granted:
+                return
+            ticket.granted = False
+            elapsed = time.monotonic() - ticket.started
+            self.avg_seconds += self.alpha * (elapsed - self.avg_seconds)
+            self.running -= 1
+            self._dispatch()
+
+    # ── interní (pod zámkem) ────────────────────────────────────
+    def _check_room(self, client: str, lane: str):
+        mine = len(self._lanes[lane].get(client, ()))
+        if mine >= self.per_client:
+            self.rejected += 1
+            raise Rejected(429, "client_queue_full", self.retry_after(mine))
+        limit = self.max_depth if lane == "paid" else self.free_depth
+        ahead = self.waiting
+        if self._depth[lane] >= limit or ahead >= self.max_depth:
+            self.rejected += 1
+            raise Rejected(503, "queue_full", self.retry_after(ahead))
+        if self.wait_seconds() > self.max_wait:
+            self.rejected += 1
+            raise Rejected(503, "queue_full", self.retry_after(ahead))
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        ticket.started = time.monotonic()
+        self.running += 1
+        ticket.event.set()
+
+    def _next_lane(self) -> Optional[str]:
+        for _ in range(len(self._schedule)):
+            lane = self._schedule[self._turn]
+            self._turn = (self._turn + 1) % len(self._schedule)
+            if self._depth[lane]:
+                return lane
+        return None
+
+    def _dispatch(self):
+        while self.running < self.slots:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            clients = self._lanes[lane]
+            client, queue = next(iter(clients.items()))
+            ticket = queue.popleft()
+            # klient jde na konec kola, i když má ve frontě další požadavky
+            if queue:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            self._depth[lane] -= 1
+            self._dequeued(ticket)
+            self._grant(ticket)
+
+    def _remove(self, ticket: Ticket):
+        clients = self._lanes[ticket.lane]
+        queue = clients.get(ticket.client)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del clients[ticket.client]
+        self._depth[ticket.lane] -= 1
+        self._dequeued(ticket)
+
+    def _dequeued(self, ticket: Ticket):
+        # prázdná fronta = přesně nula, bez nasčítané chyby floatů
+        self._queued_seconds = self._queued_seconds - ticket.cost if self.waiting else 0.0
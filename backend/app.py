@@ -4,23 +4,31 @@ import hashlib
 import hmac
 import io
 import os
+import random
 import tempfile
 import threading
 import time
 import uuid
+from contextlib import contextmanager
 from pathlib import Path
 
-import jwt
 from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
 
-from convert import convert_to_webp
+from admission import AdmissionQueue, Rejected
+from chunked_upload import UploadError, UploadStore
+from estimate import CostModel
+from kdf_executor import KdfExecutor
+from memory_budget import MemoryBudget, parse_size
+from renditions import FORMATS, RenditionError, RenditionStore, parse_steps
+from result_cache import ResultCache, is_sha256, save_hashed
+from webhook_inbox import BackgroundApplier
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Webp-Mode", "X-Webp-Metadata", "X-Webp-Color", "X-Webp-Cache", "X-Webp-Rendition", "Retry-After"])
 
 # ===============================
 # CONFIG
@@ -38,9 +46,65 @@ FREE_LIMIT = int(os.environ.get("FREE_LIMIT", "3"))
 
 db = SQLAlchemy(app)
 
-# max paralelních konverzí (CPU ochrana)
+
+def _env_int(name):
+  val = os.environ.get(name, "").strip()
+  return int(val) if val else None
+
+
+# max paralelních konverzí (CPU ochrana) + krátká férová fronta před nimi;
+# co se nevejde, dostane hned 429/503 s Retry-After (viz admission.py)
 MAX_CONCURRENT_CONVERSIONS = int(os.environ.get("MAX_CONCURRENT_CONVERSIONS", "4"))
-conversion_semaphore = threading.Semaphore(MAX_CONCURRENT_CONVERSIONS)
+conversion_queue = AdmissionQueue(
+  MAX_CONCURRENT_CONVERSIONS,
+  max_depth=_env_int("CONVERSION_QUEUE_DEPTH"),
+  free_depth=_env_int("CONVERSION_QUEUE_FREE_DEPTH"),
+  per_client=int(os.environ.get("CONVERSION_QUEUE_PER_CLIENT", "2")),
+  max_wait=float(os.environ.get("CONVERSION_QUEUE_MAX_WAIT", "30")),
+)
+# paměťový rozpočet konverzí na worker (např. "1G", "auto"; prázdné/0 = bez limitu)
+conversion_memory = MemoryBudget(parse_size(os.environ.get("MAX_CONVERSION_MEMORY", "0")))
+# hotové konverze na disku (uploads volume) pro preflight podle hashe
+result_cache = ResultCache(
+  Path(os.environ.get("RESULT_CACHE_DIR", "uploads/.webp-cache")),
+  parse_size(os.environ.get("RESULT_CACHE_MAX", "2G")),
+  JWT_SECRET,
+)
+# origin pro CDN: /img/<id> z originálů na uploads volume, rendice v omezené cache
+renditions = RenditionStore(
+  Path(os.environ.get("IMG_ORIGINALS_DIR", "uploads/originals")),
+  ResultCache(
+    Path(os.environ.get("RENDITION_CACHE_DIR", "uploads/.renditions")),
+    parse_size(os.environ.get("RENDITION_CACHE_MAX", "1G")),
+    JWT_SECRET,
+  ),
+  widths=parse_steps(os.environ.get("IMG_WIDTHS", "320,480,640,800,1024,1280,1600,1920,2560")),
+  qualities=parse_steps(os.environ.get("IMG_QUALITIES", "50,60,72,80,90")) or (72,),
+  lock_timeout=float(os.environ.get("CONVERSION_QUEUE_MAX_WAIT", "30")) + 5,
+)
+IMG_MAX_AGE = int(os.environ.get("IMG_MAX_AGE", str(365 * 24 * 3600)))
+# obnovitelné uploady po částech; opuštěné sessions se mažou po UPLOAD_SESSION_TTL,
+# použité hned po konverzi; na vlastníka nanejvýš UPLOAD_MAX_SESSIONS / UPLOAD_MAX_PENDING
+upload_store = UploadStore(
+  Path(os.environ.get("UPLOAD_SESSION_DIR", "uploads/.chunked")),
+  parse_size(os.environ.get("UPLOAD_MAX_SIZE", "1G")),
+  ttl=float(os.environ.get("UPLOAD_SESSION_TTL", str(24 * 3600))),
+  max_sessions=int(os.environ.get("UPLOAD_MAX_SESSIONS", "8")),
+  max_owner_bytes=parse_size(os.environ.get("UPLOAD_MAX_PENDING", "2G")),
+)
+# odhad doby a velikosti konverze (/api/estimate, ceny požadavků ve frontě);
+# kalibruje se na historii – do ní jde vzorek skutečných konverzí
+cost_model = CostModel(
+  Path(os.environ.get("ESTIMATE_HISTORY", "uploads/.estimates.ndjson")),
+  max_records=int(os.environ.get("ESTIMATE_HISTORY_MAX", "2000")),
+)
+ESTIMATE_RECORD_RATE = float(os.environ.get("ESTIMATE_RECORD_RATE", "0.2"))
+# hashování hesel mimo request vlákna, s vlastním limitem (viz kdf_executor.py)
+kdf = KdfExecutor(
+  workers=int(os.environ.get("KDF_WORKERS", "2")),
+  max_pending=int(os.environ.get("KDF_MAX_PENDING", "32")),
+  timeout=float(os.environ.get("KDF_TIMEOUT", "10")),
+)
 _anon_usage = {}
 _anon_lock = threading.Lock()
 
@@ -99,6 +163,38 @@ class User(db.Model):
     }
 
 
+class ImapCheckpoint(db.Model):
+  """Kam až IMAP worker došel: poslední zpracované UID složky (platí jen pro danou UIDVALIDITY)."""
+  __tablename__ = "imap_checkpoints"
+  folder = db.Column(db.String(255), primary_key=True)
+  uidvalidity = db.Column(db.BigInteger, nullable=False)
+  last_uid = db.Column(db.BigInteger, nullable=False, default=0)
+  updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=now_utc, onupdate=now_utc)
+
+
+class ImapMessage(db.Model):
+  """Idempotence IMAP aktivací: každá zpracovaná platební zpráva má jeden řádek."""
+  __tablename__ = "imap_messages"
+  key = db.Column(db.String(255), primary_key=True)  # Message-ID, jinak folder:uidvalidity:uid
+  folder = db.Column(db.String(255), nullable=False)
+  uid = db.Column(db.BigInteger, nullable=False)
+  email = db.Column(db.String(255), nullable=True)
+  result = db.Column(db.String(20), nullable=False)  # activated | ignored
+  created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=now_utc)
+
+
+class WebhookEvent(db.Model):
+  """Inbox webhooků: uložený a potvrzený event, aplikuje ho až BackgroundApplier."""
+  __tablename__ = "webhook_events"
+  id = db.Column(db.String(128), primary_key=True)  # "bmc:<event_id>", jinak sha256 payloadu
+  event_type = db.Column(db.String(64), nullable=False)
+  email = db.Column(db.String(255), nullable=False)
+  payload = db.Column(db.Text, nullable=False)
+  status = db.Column(db.String(16), nullable=False, default="pending", index=True)  # pending | applied | ignored | failed
+  error = db.Column(db.Text, nullable=True)
+  received_at = db.Column(db.DateTime(timezone=True), nullable=False, default=now_utc)
+  processed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
 with app.app_context():
   db.create_all()
   # If the table already exists (older deployment), ensure new columns are present.
@@ -118,6 +214,19 @@ with app.app_context():
 # ===============================
 # HELPERS
 # ===============================
+# Pillow + NumPy + LittleCMS (convert) a PyJWT se importují až při prvním
+# použití – worker recyklovaný po max_requests je pak připravený dřív
+# a health/webhook requesty je nepotřebují vůbec (viz bench/bench_startup.py).
+def _convert():
+  import convert
+  return convert
+
+
+def _jwt():
+  import jwt
+  return jwt
+
+
 def _to_int(val, default=None, lo=None, hi=None):
   try:
     x = int(val)
@@ -135,7 +244,7 @@ def issue_token(user):
     "sub": user.id,
     "exp": now_utc() + timedelta(hours=JWT_EXPIRES_HOURS),
   }
-  return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGO)
+  return _jwt().encode(payload, JWT_SECRET, algorithm=JWT_ALGO)
 
 
 def _get_token_from_request():
@@ -153,7 +262,7 @@ def get_current_user():
   if not token:
     return None
   try:
-    payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGO])
+    payload = _jwt().decode(token, JWT_SECRET, algorithms=[JWT_ALGO])
   except Exception:
     return None
   user_id = payload.get("sub")
@@ -181,6 +290,33 @@ def normalize_email(email):
   return (email or "").strip().lower()
 
 
+# účty založené platbou (webhook, IMAP) zatím heslo nemají; "!" není platný
+# werkzeug hash, takže check_password_hash ho vždy odmítne – a nepočítá se
+# kvůli tomu KDF (desítky ms CPU) v requestu
+UNUSABLE_PASSWORD = "!"
+
+
+def placeholder_user(email):
+  return User(
+    email=email,
+    password_hash=UNUSABLE_PASSWORD,
+    plan=None,
+    plan_expires_at=None,
+    is_vip=False,
+    conversions_used=0,
+  )
+
+
+def extend_plan(user, days=30):
+  expires = user.plan_expires_at
+  if expires and expires.tzinfo is None:  # SQLite vrací naivní datetime
+    expires = expires.replace(tzinfo=timezone.utc)
+  base = expires if expires and expires > now_utc() else now_utc()
+  user.plan = "monthly"
+  user.plan_expires_at = base + timedelta(days=days)
+  user.is_vip = user.is_vip or False
+
+
 def infer_plan(payload):
   # Only monthly memberships are supported.
   return "monthly"
@@ -230,11 +366,16 @@ def api_register():
   if existing:
     return jsonify({"error": "User already exists"}), 409
 
+  try:
+    password_hash = kdf.hash_password(password)
+  except Rejected as e:
+    return _busy(e)
+
   user = User(
     email=email,
     first_name=first_name,
     last_name=last_name,
-    password_hash=generate_password_hash(password),
+    password_hash=password_hash,
     plan=None,
     plan_expires_at=None,
     is_vip=False,
@@ -257,7 +398,11 @@ def api_login():
     return jsonify({"error": "Email and password are required"}), 400
 
   user = User.query.filter_by(email=email).first()
-  if not user or not check_password_hash(user.password_hash, password):
+  try:
+    ok = user is not None and kdf.check_password(user.password_hash, password)
+  except Rejected as e:
+    return _busy(e)
+  if not ok:
     return jsonify({"error": "Invalid credentials"}), 401
 
   token = issue_token(user)
@@ -349,157 +494,566 @@ def api_webhook_bmc():
   if not email:
     return jsonify({"error": "Missing email"}), 400
 
-  user = User.query.filter_by(email=email).first()
-  if not user:
-    user = User(
-      email=email,
-      password_hash=generate_password_hash(uuid.uuid4().hex),
-      plan=None,
-      plan_expires_at=None,
-      is_vip=False,
-      conversions_used=0,
-    )
-    db.session.add(user)
+  # ===============================
+  # INBOX – uložit a hned potvrdit; opakované doručení téhož eventu se neuloží
+  # ===============================
+  event_id = payload.get("event_id") or payload.get("id")
+  key = f"bmc:{event_id}" if event_id not in (None, "") else "sha256:" + hashlib.sha256(raw_payload).hexdigest()
+  db.session.add(WebhookEvent(
+    id=key[:128],
+    event_type=event_type or "unknown",
+    email=email,
+    payload=raw_payload.decode("utf-8", "replace"),
+  ))
+  try:
     db.session.commit()
+  except IntegrityError:
+    db.session.rollback()
+    return jsonify({"ok": True, "event_id": key, "duplicate": True})
 
-  if event_type not in {"membership.started", "membership.renewed", "donation.created"}:
-    return jsonify({"ok": True, "ignored": event_type or "unknown"})
+  webhook_applier.kick()
+  return jsonify({"ok": True, "event_id": key, "queued": True}), 202
 
-  plan = "monthly"
-  delta = timedelta(days=30)
 
-  base = (
-    user.plan_expires_at
-    if user.plan_expires_at and user.plan_expires_at > now_utc()
-    else now_utc()
-  )
-
-  user.plan = plan
-  user.plan_expires_at = base + delta
-  user.is_vip = user.is_vip or False
+BMC_PLAN_EVENTS = {"membership.started", "membership.renewed", "donation.created"}
 
-  db.session.commit()
-
-  token = issue_token(user)
 
-  return jsonify({
-    "ok": True,
-    "email": user.email,
-    "plan": plan,
-    "plan_active": True,
-    "expires_at": user.plan_expires_at.isoformat(),
-    "token": token,
-  })
+def _apply_webhook_event(event, users):
+  user = users.get(event.email)
+  if user is None:
+    user = users[event.email] = placeholder_user(event.email)
+    db.session.add(user)
+  # podmíněný přechod pending → hotovo: souběžný applier v jiném workeru
+  # tentýž event nezpracuje podruhé (UPDATE počká na jeho commit a vrátí 0)
+  status = "applied" if event.event_type in BMC_PLAN_EVENTS else "ignored"
+  claimed = WebhookEvent.query.filter_by(id=event.id, status="pending").update(
+    {"status": status, "processed_at": now_utc()}, synchronize_session=False)
+  if claimed and status == "applied":
+    extend_plan(user, 30)
+
+
+def apply_webhook_events(limit=50):
+  """Zpracuje až `limit` čekajících eventů v jedné transakci; vrací jejich počet."""
+  with app.app_context():
+    events = (WebhookEvent.query.filter_by(status="pending")
+              .order_by(WebhookEvent.received_at).limit(limit).all())
+    if not events:
+      return 0
+    emails = {e.email for e in events}
+    users = {u.email: u for u in User.query.filter(User.email.in_(emails))}
+    try:
+      for event in events:
+        _apply_webhook_event(event, users)
+      db.session.commit()
+      return len(events)
+    except Exception:
+      db.session.rollback()
+
+    # dávka selhala – po jednom, ať jeden vadný event neblokuje ostatní
+    for event_id in [e.id for e in events]:
+      event = db.session.get(WebhookEvent, event_id)
+      if event is None or event.status != "pending":
+        continue
+      try:
+        _apply_webhook_event(event, {u.email: u for u in User.query.filter_by(email=event.email)})
+        db.session.commit()
+      except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Webhook event {event_id} failed: {e}")
+        WebhookEvent.query.filter_by(id=event_id, status="pending").update(
+          {"status": "failed", "error": str(e)[:2000], "processed_at": now_utc()}, synchronize_session=False)
+        db.session.commit()
+    return len(events)
+
+
+webhook_applier = BackgroundApplier(
+  apply_webhook_events,
+  batch_size=int(os.environ.get("WEBHOOK_APPLY_BATCH", "50")),
+  interval=float(os.environ.get("WEBHOOK_APPLY_INTERVAL", "5")),
+)
 
 
 # ===============================
 # API: /api/convert
 # ===============================
-@app.post("/api/convert")
-def api_convert():
-  user = get_current_user()
-  client_id = (
-    request.headers.get("X-Forwarded-For", "").split(",")[0].strip()
-    or request.headers.get("X-Real-IP", "").strip()
+def _busy(rej):
+  resp = jsonify({"error": "Server busy, try again later", "code": rej.code, "retry_after": rej.retry_after})
+  resp.headers["Retry-After"] = str(rej.retry_after)
+  return resp, rej.status
+
+
+def _client_id():
+  # adresa, kterou nastavil nginx (X-Real-IP = $remote_addr, klientovu hodnotu
+  # přepíše); první položku X-Forwarded-For posílá klient a dá se podvrhnout –
+  # s ní by šlo obejít free limit a číst cizí result_cache / uploady
+  return (
+    request.headers.get("X-Real-IP", "").strip()
     or request.remote_addr
     or "anonymous"
   )
 
-  if "image" not in request.files:
-    return jsonify({"error": "No file uploaded"}), 400
 
+def _conversion_params(src):
+  """Parametry konverze z formuláře nebo JSONu → (params, None) | (None, chybová odpověď)."""
+  conv = _convert()
+  from colorspace import COLORSPACES
+  # keep / minimal / strip – stejná politika jako --metadata v CLI
+  metadata = (str(src.get("metadata") or "keep")).strip().lower()
+  if metadata not in conv.METADATA_POLICIES:
+    return None, (jsonify({"error": "Invalid metadata policy", "allowed": list(conv.METADATA_POLICIES)}), 400)
+  colorspace = (str(src.get("colorspace") or "keep")).strip().lower()
+  if colorspace not in COLORSPACES:
+    return None, (jsonify({"error": "Invalid colorspace", "allowed": list(COLORSPACES)}), 400)
+
+  q = _to_int(src.get("quality"), default=72, lo=1, hi=100)
+  return {
+    "quality": 72 if q is None else q,
+    "max_width": _to_int(src.get("max_width"), default=None, lo=1, hi=12000),
+    "max_fps": _to_int(src.get("max_fps"), default=None, lo=1, hi=100),
+    "metadata": metadata,
+    "colorspace": colorspace,
+  }, None
+
+
+def _owner(user, client_id):
+  # vlastník cache a uploadů: účet, u anonymů IP
+  return user.id if user else f"ip:{client_id}"
+
+
+def _quota_error(user, client_id):
   if user and plan_active(user):
-    pass
-  elif user:
-    used = user.conversions_used or 0
-    if used >= FREE_LIMIT:
-      return jsonify({
-        "error": "Membership required",
-        "code": "free_limit_reached",
-        "remaining": 0,
-      }), 402
-  else:
-    used = get_anon_usage(client_id)
-    if used >= FREE_LIMIT:
-      return jsonify({
-        "error": "Membership required",
-        "code": "free_limit_reached",
-        "remaining": 0,
-      }), 402
+    return None
+  used = (user.conversions_used or 0) if user else get_anon_usage(client_id)
+  if used >= FREE_LIMIT:
+    return jsonify({
+      "error": "Membership required",
+      "code": "free_limit_reached",
+      "remaining": 0,
+    }), 402
+  return None
 
-  acquired = conversion_semaphore.acquire(timeout=600)
-  if not acquired:
-    return jsonify({"error": "Server busy, try again later"}), 429
 
+def _count_conversion(user, client_id):
+  if user and not plan_active(user):
+    try:
+      if user.conversions_used is None:
+        user.conversions_used = 0
+      user.conversions_used += 1
+      db.session.commit()
+    except Exception as e:
+      app.logger.warning(f"failed to update conversions_used: {e}")
+  elif not user:
+    increment_anon_usage(client_id)
+
+
+def _webp_response(path, outname, params, meta, cache_status):
+  with open(path, "rb") as fh:
+    bio = io.BytesIO(fh.read())
+
+  resp = send_file(
+    bio,
+    mimetype="image/webp",
+    as_attachment=True,
+    download_name=outname,
+    max_age=0,
+    conditional=False,
+    etag=False,
+    last_modified=None,
+  )
+  # zvolený režim enkódování (lossless / near-lossless / lossy)
+  resp.headers["X-Webp-Mode"] = meta.get("mode", "lossy")
+  resp.headers["X-Webp-Metadata"] = params["metadata"]
+  if params["colorspace"] == "srgb":
+    # converted / srgb / untagged / unsupported
+    resp.headers["X-Webp-Color"] = meta.get("color", "untagged")
+  resp.headers["X-Webp-Cache"] = cache_status
+  return resp
+
+
+@contextmanager
+def _conversion_slot(owner, lane, in_path, max_width=None, max_height=None):
+  """Slot ve frontě + paměťový rozpočet pro práci nad in_path (konverze i odhad); plno → Rejected."""
+  conv = _convert()
+  try:
+    # cena z hlavičky – fronta podle ní počítá čekání a Retry-After
+    cost = cost_model.quick_seconds(conv.header_info(in_path, max_width, max_height))
+  except Exception:
+    cost = None  # nečitelnou hlavičku ohlásí až konverze
+  ticket = conversion_queue.acquire(owner, lane, cost=cost)
+  try:
+    mem_cost = 0
+    if conversion_memory.enabled:
+      try:
+        mem_cost = conv.estimate_peak_memory(in_path, max_width, max_height)
+      except Exception:
+        mem_cost = 0
+      if not conversion_memory.acquire(mem_cost, timeout=conversion_queue.max_wait):
+        raise Rejected(503, "memory_busy", conversion_queue.retry_after())
+    try:
+      yield
+    finally:
+      conversion_memory.release(mem_cost)
+  finally:
+    conversion_queue.release(ticket)
+
+
+def _admitted_convert(owner, lane, in_path, out_path, params):
+  """convert_to_webp přes frontu a paměťový rozpočet → (ok, chyba, info); plno → Rejected."""
+  conv = _convert()
+  # u části konverzí vzorek pro historii odhadů – z už dekódovaného obrázku, uvnitř slotu
+  sample_side = conv.SAMPLE_SIDE if random.random() < ESTIMATE_RECORD_RATE else None
+  conv_info = {}
+  with _conversion_slot(owner, lane, in_path, params["max_width"]):
+    t0 = time.perf_counter()
+    ok, err_msg = conv.convert_to_webp(in_path, out_path, info=conv_info, sample_side=sample_side, **params)
+    conv_info["seconds"] = time.perf_counter() - t0 - conv_info.get("t_sample", 0.0)
+
+  ok = ok and out_path.exists()
+  if ok and "sample" in conv_info:
+    try:
+      cost_model.record(conv_info["sample"], conv_info["seconds"], out_path.stat().st_size)
+    except OSError as e:
+      app.logger.warning(f"estimate history write failed: {e}")
+  return ok, err_msg, conv_info
+
+
+def _convert_cached(user, client_id, in_path, out_path, outname, params, sha256):
+  """Konverze přes frontu a paměťový rozpočet; výsledek (a originál) jde do result_cache."""
+  owner = _owner(user, client_id)
+
+  # platící mají vlastní pruh; férovost podle účtu, u anonymů podle IP
+  lane = "paid" if user and plan_active(user) else "free"
   start_time = time.time()
-  conversion_ok = False
+  try:
+    ok, err_msg, conv_info = _admitted_convert(owner, lane, in_path, out_path, params)
+  except Rejected as e:
+    return _busy(e)
 
   try:
-    f = request.files["image"]
-    filename = secure_filename(f.filename or "uploaded")
-    stem = Path(filename).stem
-    outname = f"{stem}.webp"
+    if not ok:
+      return jsonify({
+        "error": "Conversion failed",
+        "detail": err_msg
+      }), 500
+
+    _count_conversion(user, client_id)
+    meta = {k: conv_info[k] for k in ("mode", "color") if k in conv_info}
+    meta.update(metadata=params["metadata"], colorspace=params["colorspace"])
+    if result_cache.enabled:
+      try:
+        result_cache.put_result(result_cache.result_key(owner, sha256, params), out_path, meta)
+        result_cache.put_original(result_cache.original_key(owner, sha256), in_path)
+      except OSError as e:
+        app.logger.warning(f"result cache write failed: {e}")
+    return _webp_response(out_path, outname, params, meta, "miss")
 
-    q = _to_int(request.form.get("quality"), default=72, lo=1, hi=100)
-    if q is None:
-      q = 72
+  finally:
+    duration = round(time.time() - start_time, 2)
+    app.logger.info(f"conversion finished in {duration}s user={(user.id if user else f'anon:{client_id}')}")
 
-    max_w = _to_int(request.form.get("max_width"), default=None, lo=1, hi=12000)
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-      tmpdir = Path(tmpdir)
-      in_path = tmpdir / filename
-      out_path = tmpdir / outname
+@app.post("/api/convert")
+def api_convert():
+  user = get_current_user()
+  client_id = _client_id()
+
+  # soubor v multipart těle, nebo odkaz na dokončený upload po částech
+  upload_id = (request.form.get("upload_id") or "").strip()
+  if "image" not in request.files and not upload_id:
+    return jsonify({"error": "No file uploaded"}), 400
+
+  params, err = _conversion_params(request.form)
+  if err:
+    return err
+  err = _quota_error(user, client_id)
+  if err:
+    return err
+
+  owner = _owner(user, client_id)
+  with tempfile.TemporaryDirectory() as tmpdir:
+    if "image" in request.files:
+      f = request.files["image"]
+      filename = secure_filename(f.filename or "uploaded")
+      in_path = Path(tmpdir) / filename
+      # hash se počítá při ukládání – klíč do result_cache bez dalšího čtení
+      sha256, _size = save_hashed(f.stream, in_path)
+    else:
+      try:
+        in_path, done = upload_store.committed_file(upload_id, owner)
+      except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+      filename = secure_filename(done["filename"] or "uploaded")
+      sha256 = done["sha256"]
+    outname = f"{Path(filename).stem}.webp"
+
+    hit = result_cache.get_result(result_cache.result_key(owner, sha256, params))
+    if hit:
+      _count_conversion(user, client_id)
+      res = _webp_response(hit[0], outname, params, hit[1], "hit")
+    else:
+      res = _convert_cached(user, client_id, in_path, Path(tmpdir) / f"out-{outname}", outname, params, sha256)
+
+    # použitý upload už na disku nic nedrží (originál si případně vzala result_cache)
+    if upload_id and getattr(res, "status_code", None) == 200:
+      try:
+        upload_store.delete(upload_id, owner)
+      except UploadError:
+        pass
+    return res
 
+
+# ===============================
+# API: /api/estimate
+# ===============================
+# odhad z hlavičky a zkušebního enkódu vzorku; dekódování (PNG/TIFF celé) jde
+# přes stejnou frontu, paměťový rozpočet a free limit jako konverze, jen se
+# do limitu nepočítá a nic se neukládá
+@app.post("/api/estimate")
+def api_estimate():
+  user = get_current_user()
+  client_id = _client_id()
+
+  upload_id = (request.form.get("upload_id") or "").strip()
+  if "image" not in request.files and not upload_id:
+    return jsonify({"error": "No file uploaded"}), 400
+  params, err = _conversion_params(request.form)
+  if err:
+    return err
+  err = _quota_error(user, client_id)
+  if err:
+    return err
+
+  conv = _convert()
+  owner = _owner(user, client_id)
+  lane = "paid" if user and plan_active(user) else "free"
+  with tempfile.TemporaryDirectory() as tmpdir:
+    if "image" in request.files:
+      f = request.files["image"]
+      in_path = Path(tmpdir) / secure_filename(f.filename or "uploaded")
       f.save(in_path)
+    else:
+      try:
+        in_path, _done = upload_store.committed_file(upload_id, owner)
+      except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    try:
+      with _conversion_slot(owner, lane, in_path, conv.SAMPLE_SIDE, conv.SAMPLE_SIDE):
+        features = conv.sample_encode(
+          in_path, quality=params["quality"], max_width=params["max_width"], metadata=params["metadata"])
+    except Rejected as e:
+      return _busy(e)
+    except Exception as e:
+      return jsonify({"error": "Unsupported image", "detail": repr(e)}), 400
+
+  body = cost_model.estimate(features).as_dict()
+  wait = conversion_queue.wait_seconds()
+  body.update(
+    input={k: features[k] for k in ("width", "height", "format", "frames")},
+    output={"width": features["out_width"], "height": features["out_height"], "mode": features["mode"]},
+    queue={
+      "waiting": conversion_queue.waiting,
+      "wait_seconds": round(wait, 1),
+      "done_seconds": round(wait + body["seconds"]["estimate"], 1),
+    },
+  )
+  return jsonify(body)
 
-      ok, err_msg = convert_to_webp(
-        in_path,
-        out_path,
-        quality=q,
-        max_width=max_w
-      )
-
-      if not ok or not out_path.exists():
-        return jsonify({
-          "error": "Conversion failed",
-          "detail": err_msg
-        }), 500
-
-      with open(out_path, "rb") as fh:
-        data = fh.read()
-
-    conversion_ok = True
-
-    bio = io.BytesIO(data)
-    bio.seek(0)
-
-    return send_file(
-      bio,
-      mimetype="image/webp",
-      as_attachment=True,
-      download_name=outname,
-      max_age=0,
-      conditional=False,
-      etag=False,
-      last_modified=None,
+
+# ===============================
+# API: /api/uploads (upload po částech)
+# ===============================
+def _upload_error(e):
+  return jsonify({"error": str(e)}), e.status
+
+
+@app.post("/api/uploads")
+def api_upload_create():
+  user = get_current_user()
+  client_id = _client_id()
+  # upload je jen cesta ke konverzi – bez zbývajícího limitu nemá smysl ho přijímat
+  err = _quota_error(user, client_id)
+  if err:
+    return err
+  data = request.get_json(silent=True) or {}
+  size = _to_int(data.get("size"), default=None)
+  if size is None:
+    return jsonify({"error": "size is required"}), 400
+  sha256 = str(data.get("sha256") or "").strip().lower() or None
+  if sha256 and not is_sha256(sha256):
+    return jsonify({"error": "Invalid sha256"}), 400
+  try:
+    meta = upload_store.create(
+      _owner(user, client_id),
+      secure_filename(str(data.get("filename") or "uploaded")),
+      size,
+      chunk_size=_to_int(data.get("chunk_size"), default=None),
+      sha256=sha256,
     )
+  except UploadError as e:
+    return _upload_error(e)
+  return jsonify({
+    "upload_id": meta["id"],
+    "chunk_size": meta["chunk_size"],
+    "chunks": meta["chunks"],
+    "expires_in": int(upload_store.ttl),
+  }), 201
+
+
+@app.get("/api/uploads/<upload_id>")
+def api_upload_status(upload_id):
+  try:
+    return jsonify(upload_store.status(upload_id, _owner(get_current_user(), _client_id())))
+  except UploadError as e:
+    return _upload_error(e)
+
+
+@app.put("/api/uploads/<upload_id>/chunks/<int:index>")
+def api_upload_chunk(upload_id, index):
+  try:
+    res = upload_store.put_chunk(
+      upload_id,
+      _owner(get_current_user(), _client_id()),
+      index,
+      request.get_data(cache=False),
+      sha256=request.headers.get("X-Chunk-Sha256"),
+    )
+  except UploadError as e:
+    return _upload_error(e)
+  return jsonify(res)
+
+
+@app.post("/api/uploads/<upload_id>/commit")
+def api_upload_commit(upload_id):
+  try:
+    return jsonify(upload_store.commit(upload_id, _owner(get_current_user(), _client_id())))
+  except UploadError as e:
+    return _upload_error(e)
+
+
+@app.delete("/api/uploads/<upload_id>")
+def api_upload_delete(upload_id):
+  try:
+    upload_store.delete(upload_id, _owner(get_current_user(), _client_id()))
+  except UploadError as e:
+    return _upload_error(e)
+  return "", 204
+
+
+# ===============================
+# API: /api/convert/preflight
+# ===============================
+@app.post("/api/convert/preflight")
+def api_convert_preflight():
+  """
+  Klient pošle SHA-256 a velikost souboru (+ parametry konverze). Když
+  server výsledek nebo originál už má, vrátí rovnou WebP (nebo při
+  "token": true krátkodobý odkaz) a upload odpadá; 204 = nahraj normálně.
+  """
+  user = get_current_user()
+  client_id = _client_id()
+  data = request.get_json(silent=True) or {}
+
+  sha256 = str(data.get("sha256") or "").strip().lower()
+  size = _to_int(data.get("size"), default=None, lo=0)
+  if not is_sha256(sha256) or size is None:
+    return jsonify({"error": "sha256 and size are required"}), 400
+  params, err = _conversion_params(data)
+  if err:
+    return err
+  err = _quota_error(user, client_id)
+  if err:
+    return err
+  if not result_cache.enabled:
+    return "", 204
+
+  owner = _owner(user, client_id)
+  filename = secure_filename(str(data.get("filename") or "uploaded"))
+  outname = f"{Path(filename).stem}.webp"
+  key = result_cache.result_key(owner, sha256, params)
+
+  hit = result_cache.get_result(key)
+  if hit is None:
+    original = result_cache.get_original(result_cache.original_key(owner, sha256), size)
+    if original is None:
+      return "", 204
+    # stejný soubor, jiné parametry → konverze z uloženého originálu
+    with tempfile.TemporaryDirectory() as tmpdir:
+      resp = _convert_cached(user, client_id, original, Path(tmpdir) / f"out-{outname}", outname, params, sha256)
+    if not data.get("token") or isinstance(resp, tuple):
+      return resp
+  else:
+    _count_conversion(user, client_id)
+    if not data.get("token"):
+      return _webp_response(hit[0], outname, params, hit[1], "hit")
+
+  token = result_cache.issue_token(key)
+  return jsonify({
+    "download": f"/api/convert/result/{token}?name={outname}",
+    "expires_in": result_cache.token_ttl,
+  })
+
+
+@app.get("/api/convert/result/<token>")
+def api_convert_result(token):
+  hit = result_cache.resolve_token(token)
+  if hit is None:
+    return jsonify({"error": "Not found or expired"}), 404
+  name = secure_filename(request.args.get("name") or "converted.webp")
+  meta = hit[1]
+  params = {"metadata": meta.get("metadata", "keep"), "colorspace": meta.get("colorspace", "keep")}
+  return _webp_response(hit[0], name, params, meta, "hit")
+
+
+# ===============================
+# /img/<id> – origin pro CDN
+# ===============================
+# rendice pro web: ICC a autorská práva zůstanou, zbytek EXIFu ne
+IMG_CONVERSION = {"max_fps": None, "metadata": "minimal", "colorspace": "keep"}
+
+
+def _build_rendition(src, out, params):
+  # /img/ je anonymní: vlastní pruh – před free konverzemi, ale za platícími;
+  # férovost mezi edge uzly CDN podle adresy z proxy (ne podvrhnutelné hlavičky)
+  ok, err_msg, conv_info = _admitted_convert(f"img:{_client_id()}", "img", src, out, params)
+  if not ok:
+    raise RenditionError(err_msg or "conversion failed")
+  return {k: conv_info[k] for k in ("mode", "color") if k in conv_info}
+
+
+@app.get("/img/<path:original_id>")
+def img_rendition(original_id):
+  src = renditions.original(original_id)
+  if src is None:
+    return jsonify({"error": "Not found"}), 404
+  fmt = (request.args.get("fmt") or "webp").strip().lower()
+  if fmt not in FORMATS:
+    return jsonify({"error": "Invalid format", "allowed": list(FORMATS)}), 400
+
+  # w/q se přichytí na IMG_WIDTHS/IMG_QUALITIES – konečný počet rendic na originál
+  width, quality = renditions.snap(
+    _to_int(request.args.get("w"), default=None, lo=1, hi=12000),
+    _to_int(request.args.get("q"), default=None, lo=1, hi=100),
+  )
+  params = dict(IMG_CONVERSION, quality=quality, max_width=width)
+  try:
+    data, meta, status = renditions.get_or_build(
+      renditions.key(original_id, src, dict(params, fmt=fmt)),
+      lambda out: _build_rendition(src, out, params),
+    )
+  except Rejected as e:
+    return _busy(e)
+  except RenditionError as e:
+    return jsonify({"error": "Conversion failed", "detail": str(e)}), 500
+
+  resp = app.response_class(data, mimetype="image/webp")
+  # ETag = hash bajtů rendice; stejný pro všechna URL, která se přichytí na tutéž rendici
+  resp.set_etag(meta["etag"])
+  resp.headers["Cache-Control"] = f"public, max-age={IMG_MAX_AGE}, immutable"
+  resp.headers["X-Webp-Mode"] = meta.get("mode", "lossy")
+  resp.headers["X-Webp-Cache"] = status
+  resp.headers["X-Webp-Rendition"] = f"w={width or 'orig'},q={quality}"
+  return resp.make_conditional(request)
 
-  finally:
-    if conversion_ok:
-      if user and not plan_active(user):
-        try:
-          if user.conversions_used is None:
-            user.conversions_used = 0
-          user.conversions_used += 1
-          db.session.commit()
-        except Exception as e:
-          app.logger.warning(f"failed to update conversions_used: {e}")
-      elif not user:
-        increment_anon_usage(client_id)
-    conversion_semaphore.release()
-    duration = round(time.time() - start_time, 2)
-    app.logger.info(f"conversion finished in {duration}s user={(user.id if user else f'anon:{client_id}')}")
 
 # ===============================
 # LOCAL DEV (nepoužívá se v Dockeru)
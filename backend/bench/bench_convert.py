@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import argparse
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+# Benchmark konverzí. Každá varianta běží v samostatném procesu, aby
+# ru_maxrss (špička RSS včetně alokací v C části Pillow) patřila jen jí.
+#
+#   python bench/bench_convert.py animated
+#   python bench/bench_convert.py animated --frames 1500
+#   python bench/bench_convert.py png_modes
+#   python bench/bench_convert.py channels
+#   python bench/bench_convert.py icc
+#   python bench/bench_convert.py peakmem --megapixels 100
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import corpus  # noqa: E402
+from convert import BINARY_ALPHA_QUALITY, convert_to_webp, encode_animated  # noqa: E402
+from colorspace import TransformCache, to_srgb  # noqa: E402
+from image_analysis import alpha_usage, reduce_mode  # noqa: E402
+
+
+def _maxrss_bytes() -> int:
+    # VmHWM se po execve nuluje; ru_maxrss by zdědil špičku rodiče
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+# ── varianty (běží v podprocesu) ────────────────────────────────
+def _anim_first_frame(src: Path, out: io.BytesIO):
+    # původní chování: im.save bez save_all → jen první snímek
+    with Image.open(src) as im:
+        im.convert("RGBA").save(out, format="WEBP", quality=72, method=4)
+    return {}
+
+
+def _anim_pillow_save_all(src: Path, out: io.BytesIO):
+    with Image.open(src) as im:
+        im.save(out, format="WEBP", save_all=True, quality=72, method=4)
+    return {}
+
+
+def _anim_stream(**kw):
+    def run(src: Path, out: io.BytesIO):
+        with Image.open(src) as im:
+            return encode_animated(im, out, quality=72, **kw)
+    return run
+
+
+PNG_CORPUS = ("photo_png", "screenshot_png", "icon_png")
+
+
+def _png_legacy(name: str):
+    # původní _choose_save_kwargs: každé PNG lossless, method 6
+    def run(root: Path, out: io.BytesIO):
+        with Image.open(root / f"{name[:-4]}.png") as im:
+            im.save(out, format="WEBP", lossless=True, quality=90, method=6)
+        return {}
+    return run
+
+
+def _png_auto(name: str):
+    def run(root: Path, out: io.BytesIO):
+        info: dict = {}
+        dst = root / f"{name}.auto.webp"
+        ok, err = convert_to_webp(root / f"{name[:-4]}.png", dst, info=info)
+        if not ok:
+            raise RuntimeError(err)
+        out.write(dst.read_bytes())
+        return {"mode": info["mode"]}
+    return run
+
+
+CHANNEL_CORPUS = ("opaque_rgba_png", "cutout_png")
+
+
+def _channels(name: str, reduce: bool):
+    # binární masku by LANCZOS vyhladil → cutout se měří bez resize
+    keep_size = name == "cutout_png"
+    # stejné lossy nastavení, liší se jen redukce režimu před resizem a enkódem
+    def run(root: Path, out: io.BytesIO):
+        with Image.open(root / f"{name[:-4]}.png") as im:
+            im.load()
+            extra = {}
+            save = {"quality": 72, "method": 6}
+            if reduce:
+                im, extra = reduce_mode(im)
+            if not keep_size:
+                im = im.resize((im.width // 2, im.height // 2), Image.Resampling.LANCZOS)
+            if reduce and alpha_usage(im) == "binary":
+                save["alpha_quality"] = BINARY_ALPHA_QUALITY
+            im.save(out, format="WEBP", **save)
+            return {"mode": im.mode, **extra}
+    return run
+
+
+ICC_CORPUS = ("p3_jpeg", "adobe_jpeg")
+ICC_ROUNDS = 10
+
+
+def _icc(policy: str):
+    # režie převodu do sRGB na obrázek (dekód a enkód se neměří)
+    def run(root: Path, out: io.BytesIO):
+        images = []
+        for name in ICC_CORPUS:
+            with Image.open(root / f"{name.replace('_jpeg', '')}.jpg") as im:
+                im.load()
+                images.append(im)
+        cache = TransformCache()
+        t0 = time.perf_counter()
+        for _ in range(ICC_ROUNDS):
+            for im in images:
+                if policy == "cold":
+                    cache = TransformCache()
+                if policy != "passthrough":
+                    conv, _status = to_srgb(im, cache)
+        per_image = (time.perf_counter() - t0) / (ICC_ROUNDS * len(images))
+        (conv if policy != "passthrough" else images[0]).save(out, format="WEBP", quality=72)
+
+        # samotné sestavení transformace = co cache ušetří na každém obrázku
+        icc = images[0].info["icc_profile"]
+        t0 = time.perf_counter()
+        for _ in range(ICC_ROUNDS):
+            TransformCache().get(icc, "RGB ", "RGB")
+        build = (time.perf_counter() - t0) / ICC_ROUNDS
+        return {
+            "per_image_ms": round(per_image * 1000, 2),
+            "build_ms": round(build * 1000, 2),
+            "cache_misses": cache.misses,
+        }
+    return run
+
+
+PEAK_MAX_WIDTH = 2048
+
+
+def _peak_legacy(ext: str, max_width):
+    # pipeline před prepare_image: celý dekód, kopie z exif_transpose,
+    # konverze režimu a zmenšení, všechny naživu současně
+    def run(root: Path, out: io.BytesIO):
+        with Image.open(root / f"large{ext}") as im:
+            im = ImageOps.exif_transpose(im)
+            if max_width and im.width > max_width:
+                im = im.resize((max_width, max(1, int(im.height * max_width / im.width))),
+                               Image.Resampling.LANCZOS)
+            if im.mode in ("P", "LA"):
+                im = im.convert("RGBA")
+            im.save(out, format="WEBP", quality=72, method=4)
+        return {}
+    return run
+
+
+def _peak_bounded(ext: str, max_width):
+    def run(root: Path, out: io.BytesIO):
+        dst = root / f"large{ext}.{max_width}.webp"
+        ok, err = convert_to_webp(root / f"large{ext}", dst, max_width=max_width)
+        if not ok:
+            raise RuntimeError(err)
+        out.write(dst.read_bytes())
+        return {}
+    return run
+
+
+VARIANTS = {
+    "animated": {
+        "first_frame": _anim_first_frame,
+        "pillow_save_all": _anim_pillow_save_all,
+        "stream": _anim_stream(),
+        "stream_w240": _anim_stream(max_width=240),
+        "stream_fps15": _anim_stream(max_fps=15),
+    },
+    "png_modes": {
+        f"{name[:-4]}:{policy}": make(name)
+        for name in PNG_CORPUS
+        for policy, make in (("legacy", _png_legacy), ("auto", _png_auto))
+    },
+    "channels": {
+        f"{name[:-4]}:{label}": _channels(name, reduce)
+        for name in CHANNEL_CORPUS
+        for label, reduce in (("keep", False), ("reduce", True))
+    },
+    "icc": {policy: _icc(policy) for policy in ("passthrough", "cold", "cached")},
+    "peakmem": {
+        f"{ext[1:]}{'' if mw else '_full'}:{label}": make(ext, mw)
+        for ext in (".jpg", ".png")
+        for mw in (PEAK_MAX_WIDTH, None)
+        for label, make in (("legacy", _peak_legacy), ("bounded", _peak_bounded))
+    },
+}
+
+
+def run_child(case: str, variant: str, src: Path) -> dict:
+    fn = VARIANTS[case][variant]
+    base_rss = _maxrss_bytes()
+    out = io.BytesIO()
+    t0 = time.perf_counter()
+    extra = fn(src, out) or {}
+    wall = time.perf_counter() - t0
+    rec = {
+        "case": case,
+        "variant": variant,
+        "wall_s": round(wall, 3),
+        "out_bytes": out.tell(),
+        "peak_rss_mb": round(_maxrss_bytes() / 2 ** 20, 1),
+        "rss_growth_mb": round((_maxrss_bytes() - base_rss) / 2 ** 20, 1),
+    }
+    rec.update(extra)
+    return rec
+
+
+# ── řízení ──────────────────────────────────────────────────────
+def prepare(case: str, root: Path, args) -> Path:
+    if case == "animated":
+        return corpus.long_gif(root / f"long_{args.frames}.gif", frames=args.frames)
+    if case == "png_modes":
+        corpus.build(root, list(PNG_CORPUS))
+        return root
+    if case == "channels":
+        corpus.build(root, list(CHANNEL_CORPUS))
+        return root
+    if case == "icc":
+        corpus.build(root, list(ICC_CORPUS))
+        return root
+    if case == "peakmem":
+        for ext in (".jpg", ".png"):
+            corpus.large(root / f"large{ext}", args.megapixels)
+        return root
+    raise SystemExit(f"neznámý case: {case}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark konverzí do WebP.")
+    parser.add_argument("case", choices=sorted(VARIANTS))
+    parser.add_argument("--variants", nargs="*", default=None, help="Jen vybrané varianty.")
+    parser.add_argument("--frames", type=int, default=600, help="animated: počet snímků GIFu.")
+    parser.add_argument("--megapixels", type=int, default=100, help="peakmem: velikost vstupu.")
+    parser.add_argument("--json", action="store_true", help="Výstup jako NDJSON.")
+    parser.add_argument("--child", nargs=2, metavar=("VARIANT", "SRC"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        variant, src = args.child
+        print(json.dumps(run_child(args.case, variant, Path(src))))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="webp-bench-") as tmp:
+        src = prepare(args.case, Path(tmp), args)
+        if src.is_file():
+            print(f"[INFO] {args.case}: {src.name} ({src.stat().st_size / 2 ** 20:.1f} MB)", file=sys.stderr)
+        for variant in args.variants or VARIANTS[args.case]:
+            proc = subprocess.run(
+                [sys.executable, __file__, args.case, "--child", variant, str(src)],
+                capture_output=True, text=True, check=True,
+            )
+            rec = json.loads(proc.stdout.strip().splitlines()[-1])
+            if args.json:
+                print(json.dumps(rec))
+            else:
+                extra = {k: v for k, v in rec.items()
+                         if k not in ("case", "variant", "wall_s", "out_bytes", "peak_rss_mb", "rss_growth_mb")}
+                print(f"{variant:22s} {rec['wall_s']:8.2f}s {rec['out_bytes'] / 1024:9.1f} KiB "
+                      f"peak {rec['peak_rss_mb']:7.1f} MB (+{rec['rss_growth_mb']:.1f})  {extra if extra else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import argparse
+import io
+import json
+import math
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps, features
+
+# Kvalita vs. velikost: projde korpus mřížkou quality × method × lossless,
+# každý výstup dekóduje a spočítá PSNR a SSIM (NumPy, bez scikit-image).
+# Pro každou třídu obsahu vykreslí Pareto frontu (bpp vs. SSIM) do SVG
+# a zapíše JSON report se seřazenými klíči – dva reporty z různých verzí
+# Pillow/libwebp jde porovnat obyčejným diffem.
+#
+#   python bench/bench_quality.py                       # syntetický korpus (corpus.py)
+#   python bench/bench_quality.py --corpus ~/fotky --out /tmp/q
+#   python bench/bench_quality.py --qualities 60,72,80 --methods 6 --no-lossless
+#
+# Třída obsahu = podadresář korpusu (photo/, screenshot/ …); soubory přímo
+# v kořeni se zařadí podle image_analysis (graphic | screenshot | photo).
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import corpus  # noqa: E402
+from image_analysis import PALETTE_COLORS, SCREEN_FLAT, analyze  # noqa: E402
+from image_io import open_image  # noqa: E402
+
+LOSSLESS_QUALITY = 90  # u lossless je quality úsilí kompresoru; stejně jako convert.py
+# současné výchozí hodnoty – v grafu a tabulce jsou zvýrazněné
+DEFAULTS = {"api": (72, 6, False), "batch": (70, 6, False), "png-lossless": (LOSSLESS_QUALITY, 6, True)}
+
+SSIM_WIN = 7  # jako skimage.metrics.structural_similarity (uniformní okno 7×7)
+
+
+# ── metriky ─────────────────────────────────────────────────────
+def _flatten(im: Image.Image) -> Image.Image:
+    """RGB; průhlednost se složí na bílé pozadí (tak ji uvidí prohlížeč na světlé stránce)."""
+    if "A" in im.mode or (im.mode == "P" and "transparency" in im.info):
+        rgba = im.convert("RGBA")
+        bg = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        return Image.alpha_composite(bg, rgba).convert("RGB")
+    return im.convert("RGB")
+
+
+def _rgb(im: Image.Image) -> np.ndarray:
+    return np.asarray(_flatten(im), dtype=np.float64)
+
+
+def _luma(rgb: np.ndarray) -> np.ndarray:
+    return rgb @ np.array([0.299, 0.587, 0.114])
+
+
+def psnr(a: np.ndarray, b: np.ndarray, data_range: float = 255.0) -> float:
+    mse = float(np.mean((a - b) ** 2))
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(data_range ** 2 / mse)
+
+
+def _box_mean(x: np.ndarray, win: int) -> np.ndarray:
+    """Průměr přes všechna okna win×win (jen celá okna) z integrálního obrazu."""
+    c = np.pad(x, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    return (c[win:, win:] - c[:-win, win:] - c[win:, :-win] + c[:-win, :-win]) / (win * win)
+
+
+def ssim(a: np.ndarray, b: np.ndarray, data_range: float = 255.0, win: int = SSIM_WIN) -> float:
+    """Střední SSIM dvou šedých obrazů (float). Konstanty a výběrová kovariance jako skimage."""
+    win = min(win, a.shape[0], a.shape[1])
+    if win < 2:
+        return 1.0 if np.array_equal(a, b) else 0.0
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+    n = win * win
+    norm = n / (n - 1)
+
+    mu_a, mu_b = _box_mean(a, win), _box_mean(b, win)
+    var_a = (_box_mean(a * a, win) - mu_a * mu_a) * norm
+    var_b = (_box_mean(b * b, win) - mu_b * mu_b) * norm
+    cov = (_box_mean(a * b, win) - mu_a * mu_b) * norm
+
+    s = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(s.mean())
+
+
+# ── korpus ──────────────────────────────────────────────────────
+def classify(im: Image.Image) -> str:
+    stats = analyze(im)
+    if stats.colors <= PALETTE_COLORS:
+        return "graphic"
+    if stats.flat_ratio >= SCREEN_FLAT:
+        return "screenshot"
+    return "photo"
+
+
+def synthetic() -> List[Tuple[str, str, Image.Image]]:
+    return [
+        ("photo", "photo", corpus.photo((1200, 900))),
+        ("photo", "cutout", corpus.cutout((1000, 750))),
+        ("screenshot", "screenshot", corpus.screenshot((1280, 800))),
+        ("graphic", "icon", corpus.icon((512, 512))),
+    ]
+
+
+def load_corpus(root: Path, max_side: Optional[int]) -> List[Tuple[str, str, Image.Image]]:
+    out = []
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        try:
+            with open_image(path) as im:
+                im = ImageOps.exif_transpose(im)
+                im.load()
+        except Exception:
+            continue  # ne-obrázky a nepodporované formáty
+        if max_side and max(im.size) > max_side:
+            im.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        rel = path.relative_to(root)
+        cls = rel.parts[0] if len(rel.parts) > 1 else classify(im)
+        out.append((cls, rel.as_posix(), im))
+    return out
+
+
+# ── mřížka ──────────────────────────────────────────────────────
+def grid(qualities: Iterable[int], methods: Iterable[int], lossless: bool) -> List[Tuple[int, int, bool]]:
+    settings = [(q, m, False) for q in qualities for m in methods]
+    if lossless:
+        settings += [(LOSSLESS_QUALITY, m, True) for m in methods]
+    return settings
+
+
+def label(quality: int, method: int, lossless: bool) -> str:
+    return f"lossless m{method}" if lossless else f"q{quality} m{method}"
+
+
+def measure(im: Image.Image, quality: int, method: int, lossless: bool, ref: np.ndarray,
+            repeat: int = 1) -> dict:
+    src = im if im.mode in ("RGB", "RGBA") else im.convert("RGBA" if "A" in im.mode else "RGB")
+    best = math.inf
+    for _ in range(max(1, repeat)):
+        buf = io.BytesIO()
+        t0 = time.perf_counter()
+        src.save(buf, format="WEBP", quality=quality, method=method, lossless=lossless)
+        best = min(best, time.perf_counter() - t0)
+    data = buf.getvalue()
+    with Image.open(io.BytesIO(data)) as dec:
+        out = _rgb(dec)
+    return {
+        "bytes": len(data),
+        "bpp": len(data) * 8 / (im.width * im.height),
+        "encode_ms": best * 1000,
+        "psnr": psnr(ref, out),
+        "ssim": ssim(_luma(ref), _luma(out)),
+    }
+
+
+def pareto(points: List[dict]) -> List[dict]:
+    """Body, které nic nepřekoná menší velikostí i vyšší SSIM zároveň (seřazené podle bpp)."""
+    front = []
+    for p in sorted(points, key=lambda p: (p["bpp"], -p["ssim"])):
+        if not front or p["ssim"] > front[-1]["ssim"]:
+            front.append(p)
+    return front
+
+
+def aggregate(rows: List[dict]) -> Dict[str, List[dict]]:
+    """Průměr přes obrázky třídy pro každé nastavení → {třída: [bod]}."""
+    groups: Dict[Tuple[str, str], List[dict]] = {}
+    for r in rows:
+        groups.setdefault((r["class"], r["setting"]), []).append(r)
+    out: Dict[str, List[dict]] = {}
+    for (cls, setting), rs in sorted(groups.items()):
+        first = rs[0]
+        finite = [r["psnr"] for r in rs if math.isfinite(r["psnr"])]
+        out.setdefault(cls, []).append({
+            "setting": setting,
+            "quality": first["quality"],
+            "method": first["method"],
+            "lossless": first["lossless"],
+            "images": len(rs),
+            "bytes": sum(r["bytes"] for r in rs),
+            "bpp": float(np.mean([r["bpp"] for r in rs])),
+            "encode_ms": float(np.mean([r["encode_ms"] for r in rs])),
+            "psnr": float(np.mean(finite)) if len(finite) == len(rs) else math.inf,
+            "ssim": float(np.mean([r["ssim"] for r in rs])),
+        })
+    return out
+
+
+# ── výstup ──────────────────────────────────────────────────────
+def _round(rec: dict) -> dict:
+    out = dict(rec)
+    for key, digits in (("bpp", 4), ("encode_ms", 1), ("psnr", 2), ("ssim", 5)):
+        if key in out:
+            out[key] = None if not math.isfinite(out[key]) else round(out[key], digits)  # JSON nezná inf
+    return out
+
+
+def svg_plot(cls: str, points: List[dict], front: List[dict]) -> str:
+    """Bodový graf bpp × SSIM s vyznačenou Pareto frontou a výchozími nastaveními."""
+    w, h, ml, mr, mt, mb = 720, 440, 64, 24, 36, 48
+    xs = [p["bpp"] for p in points]
+    ys = [p["ssim"] for p in points]
+    x0, x1 = 0.0, max(xs) * 1.05 or 1.0
+    y0 = min(ys) - (max(ys) - min(ys)) * 0.05 - 1e-4
+    y1 = min(1.0, max(ys) + (max(ys) - min(ys)) * 0.05 + 1e-4)
+
+    def px(x):
+        return ml + (x - x0) / (x1 - x0) * (w - ml - mr)
+
+    def py(y):
+        return h - mb - (y - y0) / (y1 - y0) * (h - mt - mb)
+
+    defaults = {label(*d): name for name, d in DEFAULTS.items()}
+    on_front = {p["setting"] for p in front}
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" font-family="sans-serif" font-size="11">',
+        f'<rect width="{w}" height="{h}" fill="white"/>',
+        f'<text x="{ml}" y="20" font-size="14" font-weight="bold">{cls}: SSIM vs. bits per pixel</text>',
+        f'<line x1="{ml}" y1="{h - mb}" x2="{w - mr}" y2="{h - mb}" stroke="black"/>',
+        f'<line x1="{ml}" y1="{mt}" x2="{ml}" y2="{h - mb}" stroke="black"/>',
+        f'<text x="{(w + ml) / 2}" y="{h - 10}" text-anchor="middle">bits per pixel</text>',
+        f'<text x="14" y="{(h - mb + mt) / 2}" transform="rotate(-90 14 {(h - mb + mt) / 2})" '
+        f'text-anchor="middle">SSIM</text>',
+    ]
+    for i in range(6):
+        xv, yv = x0 + (x1 - x0) * i / 5, y0 + (y1 - y0) * i / 5
+        parts.append(f'<line x1="{px(xv):.1f}" y1="{h - mb}" x2="{px(xv):.1f}" y2="{h - mb + 4}" stroke="black"/>')
+        parts.append(f'<text x="{px(xv):.1f}" y="{h - mb + 16}" text-anchor="middle">{xv:.2f}</text>')
+        parts.append(f'<line x1="{ml - 4}" y1="{py(yv):.1f}" x2="{w - mr}" y2="{py(yv):.1f}" stroke="#eee"/>')
+        parts.append(f'<text x="{ml - 6}" y="{py(yv) + 4:.1f}" text-anchor="end">{yv:.4f}</text>')
+
+    if len(front) > 1:
+        path = " ".join(f"{px(p['bpp']):.1f},{py(p['ssim']):.1f}" for p in front)
+        parts.append(f'<polyline points="{path}" fill="none" stroke="#1f77b4" stroke-width="1.5"/>')
+    for p in points:
+        x, y = px(p["bpp"]), py(p["ssim"])
+        color = "#1f77b4" if p["setting"] in on_front else "#bbb"
+        shape = (f'<rect x="{x - 4:.1f}" y="{y - 4:.1f}" width="8" height="8" fill="{color}"/>' if p["lossless"]
+                 else f'<circle cx="{x:.1f}" cy="{y:.1f}" r="3.5" fill="{color}"/>')
+        parts.append(shape)
+        if p["setting"] in on_front or p["setting"] in defaults:
+            text = p["setting"] + (f" [{defaults[p['setting']]}]" if p["setting"] in defaults else "")
+            weight = ' font-weight="bold"' if p["setting"] in defaults else ""
+            parts.append(f'<text x="{x + 6:.1f}" y="{y - 6:.1f}"{weight}>{text}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def versions() -> dict:
+    import PIL
+    return {
+        "pillow": PIL.__version__,
+        "libwebp": features.version("webp"),
+        "numpy": np.__version__,
+        "python": platform.python_version(),
+    }
+
+
+def run(images: List[Tuple[str, str, Image.Image]], settings: List[Tuple[int, int, bool]],
+        repeat: int = 1, progress=None) -> dict:
+    rows = []
+    for cls, name, im in images:
+        ref = _rgb(im)
+        for quality, method, lossless in settings:
+            rec = measure(im, quality, method, lossless, ref, repeat)
+            rows.append({"class": cls, "image": name, "setting": label(quality, method, lossless),
+                         "quality": quality, "method": method, "lossless": lossless,
+                         "pixels": im.width * im.height, **rec})
+            if progress:
+                progress(rows[-1])
+    classes = aggregate(rows)
+    return {
+        "versions": versions(),
+        "grid": [label(*s) for s in settings],
+        "images": [_round(r) for r in rows],
+        "classes": {
+            cls: {"points": [_round(p) for p in pts], "frontier": [p["setting"] for p in pareto(pts)]}
+            for cls, pts in classes.items()
+        },
+    }
+
+
+def _db(value: Optional[float]) -> str:
+    return "     ∞" if value is None else f"{value:6.2f}"  # None = beze ztráty (inf v JSONu nejde)
+
+
+def _ints(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kvalita (SSIM/PSNR) vs. velikost WebP přes mřížku nastavení.")
+    parser.add_argument("--corpus", type=Path, default=None,
+                        help="Adresář s obrázky (podadresáře = třídy). Bez něj syntetický korpus.")
+    parser.add_argument("--out", type=Path, default=Path("bench-quality"), help="Kam zapsat report.json a SVG.")
+    parser.add_argument("--qualities", default="40,50,60,65,70,72,75,80,85,90,95")
+    parser.add_argument("--methods", default="4,6")
+    parser.add_argument("--no-lossless", action="store_true", help="Bez lossless variant.")
+    parser.add_argument("--max-side", type=int, default=None, help="Zmenšit větší obrázky korpusu.")
+    parser.add_argument("--repeat", type=int, default=1, help="Enkód N× a brát nejrychlejší čas.")
+    args = parser.parse_args()
+
+    images = load_corpus(args.corpus, args.max_side) if args.corpus else synthetic()
+    if not images:
+        parser.error(f"v {args.corpus} nejsou žádné podporované obrázky")
+    settings = grid(_ints(args.qualities), _ints(args.methods), not args.no_lossless)
+
+    def progress(r):
+        print(f"  {r['class']:<11} {r['image'][:28]:<28} {r['setting']:<12} {r['bytes']:>9} B  "
+              f"{r['encode_ms']:7.1f} ms  PSNR {r['psnr']:6.2f}  SSIM {r['ssim']:.4f}", file=sys.stderr)
+
+    report = run(images, settings, args.repeat, progress)
+    args.out.mkdir(parents=True, exist_ok=True)
+    (args.out / "report.json").write_text(json.dumps(report, indent=1, sort_keys=True) + "\n", "utf-8")
+
+    defaults = {label(*d): name for name, d in DEFAULTS.items()}
+    for cls, data in report["classes"].items():
+        pts = data["points"]
+        front = sorted((p for p in pts if p["setting"] in data["frontier"]), key=lambda p: p["bpp"])
+        (args.out / f"{cls}.svg").write_text(svg_plot(cls, pts, front), "utf-8")
+
+        print(f"\n{cls} ({pts[0]['images']} obr.) – Pareto fronta:")
+        for p in front:
+            mark = f"  ← {defaults[p['setting']]}" if p["setting"] in defaults else ""
+            print(f"  {p['setting']:<12} {p['bpp']:7.3f} bpp  SSIM {p['ssim']:.4f}  "
+                  f"PSNR {_db(p['psnr'])}  {p['encode_ms']:7.1f} ms{mark}")
+        for p in pts:
+            if p["setting"] in defaults and p["setting"] not in data["frontier"]:
+                print(f"  (mimo frontu) {p['setting']:<12} {p['bpp']:7.3f} bpp  SSIM {p['ssim']:.4f}"
+                      f"  ← {defaults[p['setting']]}")
+    print(f"\nreport: {args.out / 'report.json'}")
+
+
+if __name__ == "__main__":
+    main()
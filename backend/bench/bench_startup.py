@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Start workeru: kolik stojí `import app` (to platí každý worker po
+# recyklaci přes max_requests) a kolik jednotlivé moduly. Každé měření
+# běží v čerstvém interpretu, jinak by moduly byly už v sys.modules.
+#
+#   python bench/bench_startup.py
+#   python bench/bench_startup.py --runs 10 --json
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+MODULES = (
+    "flask", "flask_sqlalchemy", "jwt", "PIL.Image", "numpy", "pillow_heif",
+    "image_io", "colorspace", "image_analysis", "convert", "app",
+)
+
+# boot workeru = import app; first_convert = boot + první konverze JPEG
+_BOOT = "import app"
+_FIRST_CONVERT = """
+import app, sys
+from pathlib import Path
+conv = app._convert()
+ok, err = conv.convert_to_webp(Path(sys.argv[1]), Path(sys.argv[1]).with_suffix(".webp"))
+assert ok, err
+"""
+_LOADED = """
+import sys, json
+import app
+from pathlib import Path
+conv = app._convert()
+conv.convert_to_webp(Path(sys.argv[1]), Path(sys.argv[1]).with_suffix(".webp"))
+plugins = sorted(m.split(".")[1] for m in sys.modules if m.startswith("PIL.") and m.endswith("ImagePlugin"))
+print(json.dumps({"plugins": plugins, "heif": "pillow_heif" in sys.modules}))
+"""
+
+
+def _env(db: Path) -> dict:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{db}"
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    return env
+
+
+def _wall(code: str, env: dict, *argv: str) -> float:
+    # čas celého interpretu včetně startu Pythonu, jak ho vidí gunicorn master
+    script = f"import time as _t; _t0 = _t.perf_counter()\n{code}\nprint(_t.perf_counter() - _t0)"
+    proc = subprocess.run([sys.executable, "-c", script, *argv], env=env, cwd=BACKEND_DIR,
+                          capture_output=True, text=True, check=True)
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def import_cost(module: str, env: dict) -> float:
+    """Kumulativní čas importu modulu (s) z -X importtime, v čerstvém procesu."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          env=env, cwd=BACKEND_DIR, capture_output=True, text=True)
+    if proc.returncode:
+        return float("nan")
+    for line in reversed(proc.stderr.splitlines()):
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1e6
+    return float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startu workeru a ceny importů.")
+    parser.add_argument("--runs", type=int, default=5, help="Opakování (medián).")
+    parser.add_argument("--json", action="store_true", help="Výstup jako NDJSON.")
+    args = parser.parse_args()
+
+    from PIL import Image
+
+    with tempfile.TemporaryDirectory(prefix="webp-bench-") as tmp:
+        tmp = Path(tmp)
+        env = _env(tmp / "bench.db")
+        src = tmp / "photo.jpg"
+        Image.linear_gradient("L").resize((1600, 1200)).convert("RGB").save(src, quality=85)
+
+        rows = []
+        for name, code, argv in (("boot", _BOOT, ()), ("first_convert", _FIRST_CONVERT, (str(src),))):
+            times = [_wall(code, env, *argv) for _ in range(args.runs)]
+            rows.append({"metric": name, "median_s": round(statistics.median(times), 4),
+                         "min_s": round(min(times), 4)})
+        for module in MODULES:
+            costs = [import_cost(module, env) for _ in range(args.runs)]
+            rows.append({"metric": f"import:{module}", "median_s": round(statistics.median(costs), 4),
+                         "min_s": round(min(costs), 4)})
+
+        proc = subprocess.run([sys.executable, "-c", _LOADED, str(src)], env=env, cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True)
+        loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+        else:
+            print(f"{row['metric']:28s} {row['median_s'] * 1000:8.1f} ms  (min {row['min_s'] * 1000:.1f})")
+    if args.json:
+        print(json.dumps({"metric": "loaded", **loaded}))
+    else:
+        print(f"PIL pluginy po konverzi JPEG: {len(loaded['plugins'])} ({', '.join(loaded['plugins'])}), "
+              f"pillow_heif: {'ano' if loaded['heif'] else 'ne'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+from __future__ import annotations
+import random
+import struct
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+# Syntetický korpus pro benchmarky – generuje se deterministicky ze seedu,
+# takže se do repa necommitují žádné binárky a čísla jsou porovnatelná.
+
+
+def _background(size: Tuple[int, int], seed: int) -> Image.Image:
+    w, h = size
+    rnd = random.Random(seed)
+    base = Image.linear_gradient("L").resize(size)
+    r, g, b = (rnd.randint(40, 200) for _ in range(3))
+    im = Image.merge("RGB", (
+        base.point(lambda v: (v + r) % 256),
+        base.transpose(Image.Transpose.ROTATE_90).resize(size).point(lambda v: (v + g) % 256),
+        Image.new("L", size, b),
+    ))
+    draw = ImageDraw.Draw(im)
+    for _ in range(12):
+        x, y = rnd.randrange(w), rnd.randrange(h)
+        rad = rnd.randint(4, max(5, w // 10))
+        draw.ellipse((x - rad, y - rad, x + rad, y + rad), fill=tuple(rnd.randrange(256) for _ in range(3)))
+    return im
+
+
+def photo(size: Tuple[int, int] = (1600, 1200), seed: int = 0) -> Image.Image:
+    """Fotka: rozmazané tvary + šum senzoru, skoro žádné shodné sousední pixely."""
+    im = _background(size, seed).filter(ImageFilter.GaussianBlur(6))
+    noise = Image.effect_noise(size, 18).convert("RGB")
+    return Image.blend(im, noise, 0.12)
+
+
+def screenshot(size: Tuple[int, int] = (1600, 1000), seed: int = 0) -> Image.Image:
+    """UI: plochy, rámečky a vyhlazený text → hodně shodných sousedů, stovky barev na hranách."""
+    rnd = random.Random(seed)
+    w, h = size
+    big = Image.new("RGB", (w * 2, h * 2), (246, 247, 249))
+    draw = ImageDraw.Draw(big)
+    draw.rectangle((0, 0, w * 2, 90), fill=(36, 41, 47))
+    draw.rectangle((0, 90, 440, h * 2), fill=(230, 233, 237))
+    try:
+        font = ImageFont.load_default(size=26)
+    except TypeError:  # Pillow < 10.1
+        font = ImageFont.load_default()
+    y = 130
+    while y < h * 2 - 60:
+        x = 480
+        draw.rounded_rectangle((x, y, w * 2 - 40, y + 150), radius=18, outline=(208, 215, 222),
+                               fill=(255, 255, 255), width=3)
+        for line in range(3):
+            words = " ".join("lorem ipsum dolor sit amet".split()[: rnd.randint(2, 5)] * 3)
+            draw.text((x + 24, y + 18 + line * 40), words, fill=(rnd.randint(0, 90),) * 3, font=font)
+        y += 180
+    # 2× plátno zmenšené na cílovou velikost = vyhlazení hran jako při renderu fontů
+    return big.resize(size, Image.Resampling.LANCZOS)
+
+
+def icon(size: Tuple[int, int] = (512, 512), seed: int = 0) -> Image.Image:
+    """Ikona/logo: pár barev, průhledné pozadí, binární alfa."""
+    rnd = random.Random(seed)
+    im = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(im)
+    w, h = size
+    draw.ellipse((w // 10, h // 10, w - w // 10, h - h // 10), fill=(rnd.randrange(256), 120, 200, 255))
+    draw.rectangle((w // 3, h // 3, w - w // 3, h - h // 3), fill=(255, 255, 255, 255))
+    return im
+
+
+def cutout(size: Tuple[int, int] = (1600, 1200), seed: int = 0) -> Image.Image:
+    """Fotka s binární maskou (vystřižený objekt, alfa jen 0/255)."""
+    im = photo(size, seed).convert("RGBA")
+    mask = Image.new("L", size, 0)
+    w, h = size
+    ImageDraw.Draw(mask).ellipse((w // 16, h // 12, w - w // 16, h - h // 12), fill=255)
+    im.putalpha(mask)
+    return im
+
+
+# Display P3 / Adobe RGB (1998): primárky adaptované na D50 (Bradford), jak je
+# ukládají matrix/TRC profily
+DISPLAY_P3 = ((0.5151, 0.2412, -0.0011), (0.2920, 0.6922, 0.0419), (0.1571, 0.0666, 0.7841))
+ADOBE_RGB = ((0.6097, 0.3111, 0.0195), (0.2053, 0.6257, 0.0609), (0.1492, 0.0632, 0.7446))
+_D50 = (0.9642, 1.0, 0.8249)
+
+
+def _s15(v: float) -> bytes:
+    return struct.pack(">i", int(round(v * 65536)))
+
+
+def _xyz(v: Sequence[float]) -> bytes:
+    return b"XYZ \0\0\0\0" + b"".join(_s15(c) for c in v)
+
+
+def icc_profile(primaries=DISPLAY_P3, gamma: float = 2.2, desc: str = "Display P3 (bench)") -> bytes:
+    """Minimální ICC v2 matrix/TRC profil displeje – testovací wide-gamut vstupy bez binárek v repu."""
+    ascii_desc = desc.encode("ascii") + b"\0"
+    tags = [
+        (b"desc", b"desc\0\0\0\0" + struct.pack(">I", len(ascii_desc)) + ascii_desc
+         + b"\0" * 8 + b"\0" * 3 + b"\0" * 67),
+        (b"cprt", b"text\0\0\0\0" + b"No copyright\0"),
+        (b"wtpt", _xyz(_D50)),
+        (b"rXYZ", _xyz(primaries[0])),
+        (b"gXYZ", _xyz(primaries[1])),
+        (b"bXYZ", _xyz(primaries[2])),
+        (b"rTRC", b"curv\0\0\0\0" + struct.pack(">IH", 1, int(round(gamma * 256))) + b"\0\0"),
+    ]
+    tags += [(b"gTRC", tags[-1][1]), (b"bTRC", tags[-1][1])]
+
+    offset = 128 + 4 + 12 * len(tags)
+    table, data = [], b""
+    for sig, body in tags:
+        table.append(struct.pack(">4sII", sig, offset + len(data), len(body)))
+        data += body + b"\0" * (-len(body) % 4)
+    size = offset + len(data)
+
+    header = struct.pack(">I4sI4s4s4s", size, b"\0\0\0\0", 0x02100000, b"mntr", b"RGB ", b"XYZ ")
+    header += b"\0" * 12 + b"acsp" + b"\0" * 28
+    header += b"".join(_s15(c) for c in _D50)
+    header += b"\0" * (128 - len(header))
+    return header + struct.pack(">I", len(tags)) + b"".join(table) + data
+
+
+def long_gif(
+    path: Path,
+    frames: int = 600,
+    size: Tuple[int, int] = (480, 270),
+    frame_ms: int = 20,
+    seed: int = 0,
+) -> Path:
+    """
+    Dlouhý GIF à la screen recording: statické pozadí, pohyblivý sprite
+    a úseky, kdy se nic nehýbe (duplicitní snímky). 50 fps ve výchozím stavu.
+    """
+    rnd = random.Random(seed)
+    bg = _background(size, seed)
+    w, h = size
+    sprite = max(8, w // 12)
+    x, y, dx, dy = w // 3, h // 3, 7, 5
+
+    def gen():
+        nonlocal x, y, dx, dy
+        hold = 0
+        for i in range(frames):
+            if hold:
+                hold -= 1
+            else:
+                if rnd.random() < 0.03:
+                    hold = rnd.randint(10, 40)
+                x, y = x + dx, y + dy
+                if not 0 <= x <= w - sprite:
+                    dx = -dx
+                    x += 2 * dx
+                if not 0 <= y <= h - sprite:
+                    dy = -dy
+                    y += 2 * dy
+            im = bg.copy()
+            ImageDraw.Draw(im).rectangle((x, y, x + sprite, y + sprite), fill=(255, 255, 255))
+            yield im.quantize(colors=128, method=Image.Quantize.FASTOCTREE)
+
+    it = gen()
+    first = next(it)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    first.save(path, format="GIF", save_all=True, append_images=it, duration=frame_ms, loop=0)
+    return path
+
+
+def large(path: Path, megapixels: int = 100, orientation: int = 6) -> Path:
+    """
+    Velká fotka (výchozí 100 MP) – zvětšený menší snímek, ať generování
+    netrvá minuty. JPEG dostane EXIF orientaci, aby se měřilo i otočení.
+    """
+    side = int((megapixels * 1_000_000) ** 0.5)
+    im = photo((side // 4, side // 4)).resize((side, side * 3 // 4), Image.Resampling.BILINEAR)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() in (".jpg", ".jpeg"):
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        im.save(path, quality=85, exif=exif)
+    else:
+        im.save(path, compress_level=1)
+    return path
+
+
+def _jpeg(path: Path, im: Image.Image, icc: bytes) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    im.save(path, quality=90, icc_profile=icc)
+    return path
+
+
+def build(root: Path, names: List[str]) -> dict:
+    """Vygeneruje požadované položky korpusu do root, vrací {jméno: cesta}."""
+    def png(name, make):
+        path = root / f"{name}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        make().save(path)
+        return path
+
+    makers = {
+        "long_gif": lambda: long_gif(root / "long.gif"),
+        "photo_png": lambda: png("photo", photo),
+        "screenshot_png": lambda: png("screenshot", screenshot),
+        "icon_png": lambda: png("icon", icon),
+        "opaque_rgba_png": lambda: png("opaque_rgba", lambda: photo().convert("RGBA")),
+        "cutout_png": lambda: png("cutout", cutout),
+        "p3_jpeg": lambda: _jpeg(root / "p3.jpg", photo(), icc_profile()),
+        "adobe_jpeg": lambda: _jpeg(root / "adobe.jpg", photo(),
+                                    icc_profile(ADOBE_RGB, 2.2, "Adobe RGB (bench)")),
+    }
+    out = {}
+    for name in names:
+        path = makers[name]()
+        out[name] = path
+    return out
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import argparse
+import http.client
+import io
+import itertools
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Zátěžový test API: spustí backend v gunicornu nad SQLite, pustí na něj
+# N souběžných klientů (přihlášení i anonymní, mix syntetických obrázků)
+# a změří propustnost, latence, podíl 402/429/503 a RSS serveru.
+# Vedle toho pár sond pravidelně volá /api/login – nejdřív na nezatíženém
+# serveru, pak během zátěže – a vypíše p99 loginu v obou fázích.
+# --split-auth spustí login/me na vlastní gunicorn skupině (jako imgwebp_auth
+# v docker-compose) a konverzní workery s GUNICORN_NICE.
+# --sweep projde mřížku workers × threads × MAX_CONCURRENT_CONVERSIONS
+# a vypíše nejlepší nastavení pro tento stroj.
+#
+#   python bench/loadtest.py --concurrency 8 --duration 20
+#   python bench/loadtest.py --concurrency 16 --duration 20 --split-auth
+#   python bench/loadtest.py --sweep --workers 1,2,4 --threads 1,2,4 --conversions 2,4 --duration 10
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import corpus  # noqa: E402
+
+
+# ── obrázky ─────────────────────────────────────────────────────
+def images(scale: float = 1.0) -> List[tuple]:
+    """[(název, bajty, content-type)] – typický mix: fotka z mobilu, screenshot, ikona."""
+    def size(w, h):
+        return max(16, int(w * scale)), max(16, int(h * scale))
+
+    out = []
+    for name, im, fmt in (
+        ("photo.jpg", corpus.photo(size(2000, 1500)), "JPEG"),
+        ("screenshot.png", corpus.screenshot(size(1280, 800)), "PNG"),
+        ("icon.png", corpus.icon(size(512, 512)), "PNG"),
+    ):
+        bio = io.BytesIO()
+        im.save(bio, format=fmt, **({"quality": 88} if fmt == "JPEG" else {}))
+        out.append((name, bio.getvalue(), f"image/{fmt.lower()}"))
+    return out
+
+
+def multipart(fields: Dict[str, str], name: str, data: bytes, ctype: str) -> tuple:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, val in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{val}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{name}"\r\n'
+        f"Content-Type: {ctype}\r\n\r\n".encode() + data + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+# ── server ──────────────────────────────────────────────────────
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid: int) -> List[int]:
+    out = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children", encoding="ascii") as fh:
+                out += [int(c) for c in fh.read().split()]
+    except OSError:
+        pass
+    return out
+
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss(pid: int) -> int:
+    """RSS mastera + workerů (sdílené stránky se počítají víckrát – horní odhad)."""
+    return _rss(pid) + sum(_rss(c) for c in _children(pid))
+
+
+class Server:
+    def __init__(self, workers: int, threads: int, conversions: int, tmp: Path, extra_env: Optional[dict] = None):
+        self.port = free_port()
+        env = dict(os.environ)
+        env.update({
+            "GUNICORN_BIND": f"127.0.0.1:{self.port}",
+            "GUNICORN_WORKERS": str(workers),
+            "GUNICORN_THREADS": str(threads),
+            "GUNICORN_LOGLEVEL": "warning",
+            "MAX_CONCURRENT_CONVERSIONS": str(conversions),
+            "DATABASE_URL": f"sqlite:///{tmp / f'load-{self.port}.db'}",
+            "RESULT_CACHE_DIR": str(tmp / f"cache-{self.port}"),
+            "UPLOAD_SESSION_DIR": str(tmp / f"uploads-{self.port}"),
+            "JWT_SECRET": "loadtest-secret-loadtest-secret-0123",
+        })
+        env.update(extra_env or {})
+        # schéma předem: souběžné db.create_all() ve workerech nad čerstvou
+        # SQLite umí shodit boot workeru ("table already exists")
+        subprocess.run([sys.executable, "-c", "import app"], cwd=BACKEND_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        self.log = open(tmp / f"gunicorn-{self.port}.log", "wb")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--access-logfile", "/dev/null", "app:app"],
+            cwd=BACKEND_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+
+    def wait_ready(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"gunicorn skončil (kód {self.proc.returncode}), viz {self.log.name}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=2)
+                conn.request("GET", "/health")
+                if conn.getresponse().status == 200:
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError("gunicorn nenaběhl včas")
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.log.close()
+
+
+# ── klienti ─────────────────────────────────────────────────────
+def _request(port: int, method: str, path: str, body=None, headers=None) -> tuple:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        res = conn.getresponse()
+        return res.status, res.read()
+    finally:
+        conn.close()
+
+
+PASSWORD = "pass1234"
+
+
+def register_users(port: int, n: int) -> List[tuple]:
+    """[(e-mail, token)] nově registrovaných uživatelů (heslo PASSWORD)."""
+    users = []
+    for i in range(n):
+        email = f"load{i}-{uuid.uuid4().hex[:6]}@example.com"
+        body = json.dumps({"email": email, "password": PASSWORD})
+        status, data = _request(port, "POST", "/api/register", body, {"Content-Type": "application/json"})
+        if status != 201:
+            raise RuntimeError(f"registrace selhala: {status} {data[:200]!r}")
+        users.append((email, json.loads(data)["token"]))
+    return users
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        kinds = ("convert", "me", "login", "login_idle")
+        self.samples: Dict[str, List[float]] = {k: [] for k in kinds}
+        self.status: Dict[str, Dict[int, int]] = {k: {} for k in kinds}
+        self.errors = 0
+
+    def add(self, kind: str, status: int, seconds: float):
+        with self.lock:
+            self.status[kind][status] = self.status[kind].get(status, 0) + 1
+            if status == 200:
+                self.samples[kind].append(seconds)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(rec: Recorder, duration: float, rss: List[int]) -> dict:
+    conv = rec.status["convert"]
+    total = sum(conv.values()) or 1
+    lat = rec.samples["convert"]
+    me = rec.samples["me"]
+    login = rec.samples["login"]
+    return {
+        "duration_s": round(duration, 2),
+        "convert_ok": conv.get(200, 0),
+        "throughput_rps": round(conv.get(200, 0) / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(lat, 50) * 1000, 1),
+        "p95_ms": round(percentile(lat, 95) * 1000, 1),
+        "p99_ms": round(percentile(lat, 99) * 1000, 1),
+        "me_p95_ms": round(percentile(me, 95) * 1000, 1),
+        # login: p99 bez zátěže vs. během zátěže – s oddělenou auth skupinou má zůstat stejné
+        "login_idle_p99_ms": round(percentile(rec.samples["login_idle"], 99) * 1000, 1),
+        "login_p50_ms": round(percentile(login, 50) * 1000, 1),
+        "login_p99_ms": round(percentile(login, 99) * 1000, 1),
+        "login_failed": sum(n for st, n in rec.status["login"].items() if st != 200),
+        "rate_402": round(conv.get(402, 0) / total, 4),
+        "rate_429": round(conv.get(429, 0) / total, 4),
+        "rate_503": round(conv.get(503, 0) / total, 4),
+        "errors": rec.errors + sum(n for s, n in conv.items() if s >= 500 and s != 503),
+        "rss_peak_mb": round(max(rss, default=0) / 2 ** 20, 1),
+        "rss_mean_mb": round(statistics.mean(rss) / 2 ** 20, 1) if rss else 0.0,
+    }
+
+
+def probe_logins(port: int, users: List[tuple], rec: Recorder, kind: str, args, until: float):
+    """Sondy /api/login: args.login_clients vláken, každé jednou za args.login_interval s."""
+    if not users or args.login_clients <= 0:
+        return
+
+    def probe(i: int):
+        email = users[i % len(users)][0]
+        body = json.dumps({"email": email, "password": PASSWORD})
+        while time.monotonic() < until:
+            t0 = time.perf_counter()
+            try:
+                status, _ = _request(port, "POST", "/api/login", body, {"Content-Type": "application/json"})
+                rec.add(kind, status, time.perf_counter() - t0)
+            except OSError:
+                rec.add(kind, 0, time.perf_counter() - t0)
+            time.sleep(max(0.0, args.login_interval - (time.perf_counter() - t0)))
+
+    with ThreadPoolExecutor(max_workers=args.login_clients) as ex:
+        list(ex.map(probe, range(args.login_clients)))
+
+
+def drive(server: Server, args, imgs: List[tuple], users: List[tuple], auth: Optional[Server] = None) -> dict:
+    rec = Recorder()
+    auth_port = (auth or server).port
+    # referenční latence loginu na nezatíženém serveru
+    probe_logins(auth_port, users, rec, "login_idle", args, time.monotonic() + args.idle_probe)
+
+    stop_at = time.monotonic() + args.duration
+    rnd = random.Random(args.seed)
+    clients = [{"Authorization": f"Bearer {t}"} for _, t in users]
+    clients += [{"X-Real-IP": f"10.9.{i // 250}.{i % 250 + 1}"} for i in range(args.anon)]
+    client_cycle = itertools.cycle(clients)
+    pick_lock = threading.Lock()
+
+    def worker(seed: int):
+        r = random.Random(seed)
+        while time.monotonic() < stop_at:
+            with pick_lock:
+                headers = dict(next(client_cycle))
+            t0 = time.perf_counter()
+            try:
+                if "Authorization" in headers and r.random() < args.me_ratio:
+                    status, _ = _request(auth_port, "GET", "/api/me", headers=headers)
+                    rec.add("me", status, time.perf_counter() - t0)
+                    continue
+                name, data, ctype = r.choice(imgs)
+                body, content_type = multipart({"quality": str(args.quality), "max_width": str(args.max_width)},
+                                               name, data, ctype)
+                headers["Content-Type"] = content_type
+                status, _ = _request(server.port, "POST", "/api/convert", body, headers)
+                rec.add("convert", status, time.perf_counter() - t0)
+                if status in (429, 503):
+                    time.sleep(args.backoff)
+            except OSError:
+                with rec.lock:
+                    rec.errors += 1
+
+    rss: List[int] = []
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.wait(0.5):
+            rss.append(tree_rss(server.proc.pid) + (tree_rss(auth.proc.pid) if auth else 0))
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    prober = threading.Thread(target=probe_logins, args=(auth_port, users, rec, "login", args, stop_at), daemon=True)
+    t0 = time.monotonic()
+    prober.start()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        list(ex.map(worker, [rnd.randrange(2 ** 31) for _ in range(args.concurrency)]))
+    duration = time.monotonic() - t0
+    prober.join()
+    sampling.set()
+    sampler.join()
+    return summarize(rec, duration, rss)
+
+
+def run_one(workers: int, threads: int, conversions: int, args, imgs, tmp: Path) -> dict:
+    env = {"FREE_LIMIT": str(args.free_limit)}
+    if not args.result_cache:
+        env["RESULT_CACHE_MAX"] = "0"  # opakované obrázky by jinak šly z cache a neměřila by se konverze
+    auth = None
+    if args.split_auth:
+        # obě skupiny nad jednou DB, konverze s nižší prioritou CPU (jako v docker-compose)
+        env["DATABASE_URL"] = f"sqlite:///{tmp / f'load-split-{uuid.uuid4().hex[:8]}.db'}"
+        env["GUNICORN_NICE"] = str(args.nice)
+    server = Server(workers, threads, conversions, tmp, env)
+    try:
+        if args.split_auth:
+            auth_env = {k: v for k, v in env.items() if k != "GUNICORN_NICE"}
+            auth = Server(args.auth_workers, args.auth_threads, conversions, tmp, auth_env)
+            auth.wait_ready()
+        server.wait_ready()
+        users = register_users((auth or server).port, args.users)
+        # zahřátí: import convert ve všech workerech, ať se neměří start
+        for name, data, ctype in imgs:
+            body, content_type = multipart({}, name, data, ctype)
+            _request(server.port, "POST", "/api/convert", body,
+                     {"Content-Type": content_type, "Authorization": f"Bearer {users[0][1]}"} if users else
+                     {"Content-Type": content_type, "X-Real-IP": "10.255.0.1"})
+        res = drive(server, args, imgs, users, auth)
+    finally:
+        server.stop()
+        if auth is not None:
+            auth.stop()
+    return {"workers": workers, "threads": threads, "conversions": conversions,
+            "split_auth": bool(args.split_auth), **res}
+
+
+def best(rows: List[dict], max_error_rate: float) -> Optional[dict]:
+    """Nejvyšší propustnost mezi běhy bez chyb (a s odmítnutími pod limitem); při shodě nižší p95."""
+    ok = [r for r in rows if r["errors"] == 0 and r["rate_429"] + r["rate_503"] <= max_error_rate]
+    if not ok:
+        return None
+    return max(ok, key=lambda r: (r["throughput_rps"], -r["p95_ms"]))
+
+
+def _ints(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _row(r: dict) -> str:
+    return (f"w={r['workers']:<2} t={r['threads']:<2} conv={r['conversions']:<2} "
+            f"{r['throughput_rps']:6.2f} req/s  p50 {r['p50_ms']:7.1f}  p95 {r['p95_ms']:7.1f}  "
+            f"p99 {r['p99_ms']:7.1f} ms  me p95 {r['me_p95_ms']:6.1f} ms  "
+            f"login p99 {r['login_idle_p99_ms']:.1f} → {r['login_p99_ms']:.1f} ms  "
+            f"402 {r['rate_402']:.1%}  429 {r['rate_429']:.1%}  503 {r['rate_503']:.1%}  "
+            f"err {r['errors']}  RSS {r['rss_peak_mb']:.0f} MB")
+
+
+def main():
+    cpu = os.cpu_count() or 2
+    parser = argparse.ArgumentParser(description="Zátěžový test /api/convert a nastavení gunicornu.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Souběžní klienti.")
+    parser.add_argument("--duration", type=float, default=20, help="Délka měření v sekundách.")
+    parser.add_argument("--users", type=int, default=4, help="Přihlášení uživatelé.")
+    parser.add_argument("--anon", type=int, default=4, help="Anonymní klienti (různé IP).")
+    parser.add_argument("--me-ratio", type=float, default=0.2, help="Podíl /api/me u přihlášených.")
+    parser.add_argument("--free-limit", type=int, default=1_000_000,
+                        help="FREE_LIMIT serveru (malé číslo = měří se i 402).")
+    parser.add_argument("--quality", type=int, default=72)
+    parser.add_argument("--max-width", type=int, default=1200)
+    parser.add_argument("--image-scale", type=float, default=1.0, help="Zvětšení syntetických obrázků.")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="Nechat zapnutou cache výsledků (měří se pak hlavně cache hity).")
+    parser.add_argument("--backoff", type=float, default=0.2, help="Pauza klienta po 429/503.")
+    parser.add_argument("--workers", default=str(max(2, cpu // 2)), help="Workery gunicornu (seznam pro --sweep).")
+    parser.add_argument("--threads", default="2", help="Vlákna na worker (seznam pro --sweep).")
+    parser.add_argument("--conversions", default="4", help="MAX_CONCURRENT_CONVERSIONS (seznam pro --sweep).")
+    parser.add_argument("--sweep", action="store_true", help="Projít všechny kombinace a vybrat nejlepší.")
+    parser.add_argument("--max-reject-rate", type=float, default=0.05,
+                        help="--sweep: nejvyšší přípustný podíl 429+503.")
+    parser.add_argument("--login-clients", type=int, default=2, help="Souběžné sondy /api/login (0 = bez).")
+    parser.add_argument("--login-interval", type=float, default=0.2, help="Pauza mezi loginy jedné sondy.")
+    parser.add_argument("--idle-probe", type=float, default=3.0,
+                        help="Sekundy měření loginu před spuštěním zátěže.")
+    parser.add_argument("--split-auth", action="store_true",
+                        help="Login/me na vlastní gunicorn skupině, konverze s GUNICORN_NICE.")
+    parser.add_argument("--auth-workers", type=int, default=1, help="--split-auth: workery auth skupiny.")
+    parser.add_argument("--auth-threads", type=int, default=8, help="--split-auth: vlákna auth skupiny.")
+    parser.add_argument("--nice", type=int, default=10, help="--split-auth: GUNICORN_NICE konverzních workerů.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Výstup jako NDJSON.")
+    args = parser.parse_args()
+
+    grid = list(itertools.product(_ints(args.workers), _ints(args.threads), _ints(args.conversions)))
+    if not args.sweep:
+        grid = grid[:1]
+
+    imgs = images(args.image_scale)
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="webp-load-") as tmp:
+        for workers, threads, conversions in grid:
+            row = run_one(workers, threads, conversions, args, imgs, Path(tmp))
+            rows.append(row)
+            print(json.dumps(row) if args.json else _row(row), flush=True)
+
+    if args.sweep:
+        pick = best(rows, args.max_reject_rate)
+        if pick is None:
+            print("[WARN] žádná kombinace bez chyb – zkus menší --concurrency", file=sys.stderr)
+        elif args.json:
+            print(json.dumps({"best": pick}))
+        else:
+            print(f"\nNejlepší pro tento stroj ({cpu} CPU): GUNICORN_WORKERS={pick['workers']} "
+                  f"GUNICORN_THREADS={pick['threads']} MAX_CONCURRENT_CONVERSIONS={pick['conversions']}")
+
+
+if __name__ == "__main__":
+    main()
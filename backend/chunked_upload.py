@@ -0,0 +1,235 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+# Obnovitelný upload po částech. Stav je jen na disku (uploads volume),
+# takže části můžou chodit paralelně do různých gunicorn workerů.
+#
+# <root>/<id>/meta.json    – vlastník, velikost, velikost části, název, sha256
+# <root>/<id>/data         – cílový soubor předalokovaný na plnou velikost;
+#                            každá část se zapíše pwrite() na svůj offset,
+#                            takže se na konci nic neskládá ani nekopíruje
+# <root>/<id>/chunks/<n>   – značka přijaté části (obsahuje její sha256)
+# <root>/<id>/committed    – upload je kompletní a ověřený
+#
+# Soubor "data" nemá příponu obrázku, batch watcher nad uploads ho nechá být.
+# Jeden vlastník má nanejvýš max_sessions rozpracovaných nebo nepoužitých
+# uploadů a max_owner_bytes rezervovaného místa; /api/convert session po
+# úspěšné konverzi smaže, opuštěné maže expirace (při každém přístupu,
+# nejčastěji jednou za sweep_interval).
+
+MIN_CHUNK = 256 * 1024
+MAX_CHUNK = 64 * 1024 * 1024
+DEFAULT_CHUNK = 8 * 1024 * 1024
+
+
+class UploadError(Exception):
+    """status: 400 špatná data, 404 neznámý upload, 409 konflikt stavu, 429 limit vlastníka."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadStore:
+    """
+    max_size        – strop velikosti jednoho uploadu
+    max_sessions    – kolik sessions smí mít jeden vlastník současně
+    max_owner_bytes – součet velikostí sessions jednoho vlastníka (None = max_size)
+    """
+
+    def __init__(self, root: Path, max_size: int, ttl: float = 24 * 3600, sweep_interval: float = 300,
+                 max_sessions: int = 8, max_owner_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.max_size = int(max_size)
+        self.max_sessions = int(max_sessions)
+        self.max_owner_bytes = int(max_owner_bytes) if max_owner_bytes else self.max_size
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+
+    # ── session ─────────────────────────────────────────────────
+    def _dir(self, upload_id: str) -> Path:
+        try:
+            uuid.UUID(hex=upload_id)
+        except (ValueError, TypeError):
+            raise UploadError(404, "Unknown upload")
+        return self.root / upload_id
+
+    def _meta(self, upload_id: str, owner: str) -> dict:
+        path = self._dir(upload_id)
+        try:
+            meta = json.loads((path / "meta.json").read_text("utf-8"))
+        except (OSError, ValueError):
+            raise UploadError(404, "Unknown upload")
+        if meta["owner"] != owner:
+            raise UploadError(404, "Unknown upload")  # cizí upload se tváří jako neexistující
+        return meta
+
+    def _owned(self, owner: str) -> List[dict]:
+        """Živé sessions vlastníka (sken meta.json – stav sdílí víc workerů jen přes disk)."""
+        now = time.time()
+        out = []
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return out
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    continue  # smaže ji nejbližší expirace
+                meta = json.loads(Path(entry.path, "meta.json").read_text("utf-8"))
+            except (OSError, ValueError):
+                continue
+            if meta.get("owner") == owner:
+                out.append(meta)
+        return out
+
+    def create(self, owner: str, filename: str, size: int, chunk_size: Optional[int] = None,
+               sha256: Optional[str] = None) -> dict:
+        if size <= 0 or size > self.max_size:
+            raise UploadError(400, f"size must be 1..{self.max_size} bytes")
+        chunk_size = max(MIN_CHUNK, min(MAX_CHUNK, int(chunk_size or DEFAULT_CHUNK)))
+        self.maybe_expire()
+        owned = self._owned(owner)
+        if len(owned) >= self.max_sessions:
+            raise UploadError(429, f"At most {self.max_sessions} open uploads")
+        if sum(m["size"] for m in owned) + size > self.max_owner_bytes:
+            raise UploadError(429, f"Open uploads may total at most {self.max_owner_bytes} bytes")
+
+        upload_id = uuid.uuid4().hex
+        path = self.root / upload_id
+        (path / "chunks").mkdir(parents=True)
+        with open(path / "data", "wb") as fh:
+            fh.truncate(size)  # řídký soubor, místo se alokuje až zápisem částí
+        meta = {
+            "id": upload_id,
+            "owner": owner,
+            "filename": filename,
+            "size": size,
+            "chunk_size": chunk_size,
+            "chunks": -(-size // chunk_size),
+            "sha256": sha256,
+            "created": time.time(),
+        }
+        (path / "meta.json").write_text(json.dumps(meta), "utf-8")
+        return meta
+
+    def received(self, upload_id: str) -> List[int]:
+        try:
+            return sorted(int(n) for n in os.listdir(self._dir(upload_id) / "chunks"))
+        except FileNotFoundError:
+            return []
+
+    def status(self, upload_id: str, owner: str) -> dict:
+        meta = self._meta(upload_id, owner)
+        got = set(self.received(upload_id))
+        return {
+            **{k: meta[k] for k in ("id", "filename", "size", "chunk_size", "chunks")},
+            "received": sorted(got),
+            "missing": [n for n in range(meta["chunks"]) if n not in got],
+            "committed": (self.root / upload_id / "committed").exists(),
+        }
+
+    # ── části ───────────────────────────────────────────────────
+    def put_chunk(self, upload_id: str, owner: str, index: int, data: bytes,
+                  sha256: Optional[str] = None) -> dict:
+        self.maybe_expire()
+        meta = self._meta(upload_id, owner)
+        path = self.root / upload_id
+        if (path / "committed").exists():
+            raise UploadError(409, "Upload already committed")
+        if not 0 <= index < meta["chunks"]:
+            raise UploadError(400, "Chunk index out of range")
+        offset = index * meta["chunk_size"]
+        expected = min(meta["chunk_size"], meta["size"] - offset)
+        if len(data) != expected:
+            raise UploadError(400, f"Chunk {index} must be {expected} bytes")
+        digest = hashlib.sha256(data).hexdigest()
+        if sha256 and sha256.lower() != digest:
+            raise UploadError(400, "Chunk checksum mismatch")
+
+        fd = os.open(path / "data", os.O_WRONLY)
+        try:
+            view = memoryview(data)
+            while view:
+                n = os.pwrite(fd, view, offset)
+                view = view[n:]
+                offset += n
+        finally:
+            os.close(fd)
+        # značka až po zápisu dat – opakovaný PUT téže části je neškodný
+        (path / "chunks" / str(index)).write_text(digest, "ascii")
+        os.utime(path)
+        return {"index": index, "sha256": digest}
+
+    # ── dokončení ───────────────────────────────────────────────
+    def commit(self, upload_id: str, owner: str) -> dict:
+        """Ověří úplnost (a celkový sha256, když ho klient zadal) a vrátí sha256 souboru."""
+        meta = self._meta(upload_id, owner)
+        path = self.root / upload_id
+        done = path / "committed"
+        if done.exists():
+            return json.loads(done.read_text("utf-8"))
+
+        missing = meta["chunks"] - len(self.received(upload_id))
+        if missing:
+            raise UploadError(409, f"{missing} chunk(s) missing")
+        h = hashlib.sha256()
+        with open(path / "data", "rb") as fh:
+            for block in iter(lambda: fh.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        if meta.get("sha256") and meta["sha256"].lower() != digest:
+            raise UploadError(400, "File checksum mismatch")
+
+        result = {"id": upload_id, "sha256": digest, "size": meta["size"], "filename": meta["filename"]}
+        done.write_text(json.dumps(result), "utf-8")
+        os.utime(path)
+        return result
+
+    def committed_file(self, upload_id: str, owner: str) -> tuple:
+        """(cesta k datům, výsledek commit) – pro /api/convert s upload_id."""
+        self.maybe_expire()
+        self._meta(upload_id, owner)
+        path = self.root / upload_id
+        try:
+            result = json.loads((path / "committed").read_text("utf-8"))
+        except (OSError, ValueError):
+            raise UploadError(409, "Upload not committed")
+        os.utime(path)
+        return path / "data", result
+
+    def delete(self, upload_id: str, owner: str):
+        self._meta(upload_id, owner)
+        shutil.rmtree(self.root / upload_id, ignore_errors=True)
+
+    # ── expirace ────────────────────────────────────────────────
+    def maybe_expire(self):
+        now = time.time()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self.expire(now)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Smaže sessions bez aktivity déle než ttl (mtime adresáře se posouvá s každou částí)."""
+        now = time.time() if now is None else now
+        removed = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_dir() and now - entry.stat().st_mtime > self.ttl:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
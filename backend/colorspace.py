@@ -0,0 +1,105 @@
+from __future__ import annotations
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image, ImageCms
+
+# Převod wide-gamut vstupů (Display P3, Adobe RGB, CMYK s profilem) do sRGB.
+# Sestavení transformace v LittleCMS je drahé, proto se zkompilované
+# transformace drží v LRU cache podle hashe zdrojového profilu – sdílené
+# všemi requesty v jednom workeru.
+
+COLORSPACES = ("keep", "srgb")
+
+# režim obrázku → (vstupní režim transformace, výstupní režim)
+_MODES = {
+    ("RGB ", "RGB"): ("RGB", "RGB"),
+    ("RGB ", "RGBA"): ("RGBA", "RGBA"),
+    ("CMYK", "CMYK"): ("CMYK", "RGB"),
+}
+
+_FLAGS = ImageCms.Flags.NOCACHE if hasattr(ImageCms, "Flags") else ImageCms.FLAGS["NOCACHE"]
+_SRGB = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+
+
+class TransformCache:
+    """
+    LRU {(hash profilu, režim): transformace | None}. None = profil už je
+    sRGB, převod se přeskočí. Transformace jsou bez 1-pixel cache
+    (NOCACHE), takže je mohou používat vlákna souběžně.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Tuple[bytes, str], Optional[ImageCms.ImageCmsTransform]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, icc: bytes, space: str, mode: str):
+        key = (hashlib.blake2b(icc, digest_size=16).digest(), mode)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+
+        # sestavení mimo zámek – souběžná stavba stejného klíče je jen zbytečná práce
+        src = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+        if "srgb" in (src.profile.profile_description or "").lower().replace(" ", ""):
+            transform = None
+        else:
+            in_mode, out_mode = _MODES[(space, mode)]
+            transform = ImageCms.buildTransform(
+                src, _SRGB, in_mode, out_mode,
+                renderingIntent=ImageCms.Intent.PERCEPTUAL, flags=_FLAGS,
+            )
+
+        with self._lock:
+            self._items[key] = transform
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return transform
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+
+transforms = TransformCache(int(os.environ.get("ICC_TRANSFORM_CACHE", "32")))
+
+
+def _profile_space(icc: bytes) -> str:
+    # barevný prostor je v hlavičce ICC na offsetu 16 – bez parsování profilu
+    return icc[16:20].decode("ascii", "replace") if len(icc) >= 20 else ""
+
+
+def to_srgb(im: Image.Image, cache: TransformCache = transforms) -> Tuple[Image.Image, str]:
+    """
+    Vrací (obrázek, stav): converted | srgb (už je sRGB) | untagged (bez
+    profilu) | unsupported (režim/profil, který neumíme). Po převodu
+    obrázek profil nenese – webový default je sRGB.
+    """
+    icc = im.info.get("icc_profile")
+    if not icc:
+        return im, "untagged"
+    space = _profile_space(icc)
+    if (space, im.mode) not in _MODES:
+        return im, "unsupported"
+    try:
+        transform = cache.get(icc, space, im.mode)
+    except (ImageCms.PyCMSError, OSError, ValueError):
+        return im, "unsupported"
+    if transform is None:
+        return im, "srgb"
+
+    out = ImageCms.applyTransform(im, transform)
+    out.info = {k: v for k, v in im.info.items() if k != "icc_profile"}
+    return out, "converted"
@@ -25,6 +25,11 @@ IMAP_SENDER_WHITELIST = [
 ]
 IMAP_POLL_SECONDS = int(_env("IMAP_POLL_SECONDS", "60"))
 IMAP_MARK_SEEN = (_env("IMAP_MARK_SEEN", "true") or "").lower() == "true"
+IMAP_SSL = (_env("IMAP_SSL", "true") or "").lower() == "true"
+# IDLE push místo pollingu (když ho server umí); RFC 2177: obnovit nejpozději po 29 min
+IMAP_IDLE = (_env("IMAP_IDLE", "true") or "").lower() == "true"
+IMAP_IDLE_SECONDS = int(_env("IMAP_IDLE_SECONDS", "1500"))
+IMAP_FETCH_BATCH = int(_env("IMAP_FETCH_BATCH", "50"))
 
 # Stripe (test/prod)
 STRIPE_SECRET_KEY = _env("STRIPE_SECRET_KEY")
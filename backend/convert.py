@@ -1,71 +1,559 @@
 from __future__ import annotations
+import io
+import struct
+import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import BinaryIO, Optional, Tuple, Union
 
-from PIL import Image, ImageOps
+from PIL import Image, ImageChops, ImageOps
 
-# HEIC/HEIF podpora (iPhone)
-try:
-    from pillow_heif import register_heif_opener  # type: ignore
-    register_heif_opener()
-except Exception:
-    pass
+from colorspace import to_srgb
+from image_analysis import alpha_usage, analyze, choose_png_mode, reduce_mode, to_palette
+from image_io import open_image
 
-def _choose_save_kwargs(src: Path, im: Image.Image, quality: int):
-    ext = src.suffix.lower()
-    save = {
-        "format": "WEBP",
-        "method": 6,
-        "optimize": True,
-    }
+# binární alfa (0/255) přežije kvantizaci alfa roviny beze změny, ale
+# alpha_quality=100 u method 6 zkouší všechny filtry a je ~10× pomalejší
+BINARY_ALPHA_QUALITY = 50
+
+# animace jen z formátů, kde více snímků znamená animaci; MPO (JPEG s náhledem
+# nebo gain mapou) a vícestránkový TIFF se převádí jako statický snímek 0
+ANIMATED_FORMATS = ("GIF", "PNG", "WEBP")
+
+# animace method 4, ne 6 jako statické obrázky: na 120snímkovém GIFu (480×270)
+# je method 6 ~7× pomalejší (7,6 s vs 1,1 s) a výstup jen o ~3 % menší
+ANIM_METHOD = 4
+
+# keep = EXIF + ICC jak jsou, minimal = ICC + autor/copyright, strip = nic
+# (a EXIF se ani neparsuje, orientace se čte přímo z IFD0)
+METADATA_POLICIES = ("keep", "minimal", "strip")
+_MINIMAL_EXIF_TAGS = (0x013B, 0x8298)  # Artist, Copyright
+_ORIENTATION_TAG = 0x0112
+
+_ORIENTATION_OPS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
 
+def exif_orientation(raw: Optional[bytes]) -> int:
+    """Orientace (1–8) z raw EXIF bajtů – projde jen záznamy IFD0, nic nedekóduje."""
+    if not raw:
+        return 1
+    if raw.startswith(b"Exif\x00\x00"):
+        raw = raw[6:]
+    if len(raw) < 8 or raw[:2] not in (b"II", b"MM"):
+        return 1
+    end = "<" if raw[:2] == b"II" else ">"
+    ifd = struct.unpack_from(end + "I", raw, 4)[0]
+    if ifd + 2 > len(raw):
+        return 1
+    count = struct.unpack_from(end + "H", raw, ifd)[0]
+    for i in range(count):
+        off = ifd + 2 + i * 12
+        if off + 12 > len(raw):
+            break
+        if struct.unpack_from(end + "H", raw, off)[0] == _ORIENTATION_TAG:
+            value = struct.unpack_from(end + "H", raw, off + 8)[0]
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+def apply_orientation(im: Image.Image, metadata: str = "keep") -> Image.Image:
+    if metadata == "strip":
+        op = _ORIENTATION_OPS.get(exif_orientation(im.info.get("exif")))
+        return im.transpose(op) if op is not None else im
+    return ImageOps.exif_transpose(im)
+
+def metadata_kwargs(im: Image.Image, metadata: str = "keep") -> dict:
+    """icc_profile/exif pro im.save podle politiky; u strip se EXIF vůbec nečte."""
+    if metadata not in METADATA_POLICIES:
+        raise ValueError(f"unknown metadata policy: {metadata!r}")
+    out = {}
+    if metadata == "strip":
+        return out
     icc = im.info.get("icc_profile")
     if icc:
-        save["icc_profile"] = icc
+        out["icc_profile"] = icc
     try:
         exif = im.getexif()
-        if exif:
-            save["exif"] = exif.tobytes()
     except Exception:
-        pass
+        exif = None
+    if exif and _ORIENTATION_TAG in exif:
+        # pixely už jsou otočené – orientace ve výstupu by obrázek otočila podruhé
+        del exif[_ORIENTATION_TAG]
+    if exif and metadata == "minimal":
+        kept = Image.Exif()
+        for tag in _MINIMAL_EXIF_TAGS:
+            if tag in exif:
+                kept[tag] = exif[tag]
+        exif = kept
+    if exif:
+        out["exif"] = exif.tobytes()
+    return out
+
+def _choose_save_kwargs(
+    src_format: Optional[str],
+    im: Image.Image,
+    quality: int,
+    info: Optional[dict] = None,
+    metadata: str = "keep",
+):
+    """
+    Vrací kwargs pro im.save a zvolený režim (lossless | near-lossless | lossy).
+    src_format je im.format dekodéru (ne přípona – upload po částech a cache
+    originálů ukládají data bez přípony).
+    """
+    save = {
+        "format": "WEBP",
+        "method": 6,
+        "optimize": True,
+    }
+    save.update(metadata_kwargs(im, metadata))
 
-    if ext in (".jpg", ".jpeg", ".heic", ".heif"):
+    mode = "lossy"
+    if src_format == "PNG":
+        # PNG může být ikona, screenshot i fotka → rozhodne obsah, ne přípona
+        stats = analyze(im)
+        mode = choose_png_mode(stats)
+        if info is not None:
+            info["analysis"] = stats.as_dict()
+
+    if mode == "lossy":
         save["lossless"] = False
         save["quality"] = int(quality)
-    elif ext == ".png":
-        if im.mode in ("RGBA", "LA"):
-            save["lossless"] = True
-        else:
-            save["lossless"] = True
-            save["quality"] = 90
     else:
-        save["lossless"] = False
-        save["quality"] = int(quality)
+        save["lossless"] = True
+        save["quality"] = 90
+
+    if info is not None:
+        info["mode"] = mode
+    return save, mode
 
-    return save
+# bajty na pixel v paměti Pillow (RGB se ukládá jako 4 bajty/pixel)
+_PIXEL_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16L": 2, "I;16B": 2, "I;16N": 2}
 
-def _resize_if_needed(im: Image.Image, max_width: Optional[int]) -> Image.Image:
-    if max_width and max_width > 0 and im.width > max_width:
-        new_h = max(1, int(im.height * (max_width / im.width)))
-        im = im.resize((max_width, new_h), Image.Resampling.LANCZOS)
-    return im
+def _draft_size(size, target) -> Tuple[int, int]:
+    # JPEG draft škáluje v DCT 1/2, 1/4, 1/8 – největší krok, který nejde pod cíl
+    w, h = size
+    scale = 1
+    while scale < 8 and w // (scale * 2) >= target[0] and h // (scale * 2) >= target[1]:
+        scale *= 2
+    return -(-w // scale), -(-h // scale)
 
-def convert_to_webp(input_path: Path, output_path: Path, *, quality: int = 72, max_width: Optional[int] = None) -> Tuple[bool, Optional[str]]:
+def estimate_peak_memory(
+    input_path: Path,
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+) -> int:
+    """
+    Odhad špičkové RAM jedné konverze jen z hlavičky (bez dekódování),
+    podle průběhu prepare_image: dekódovaný zdroj (u JPEG už zmenšený
+    draftem) + jedna pracovní kopie + výstup a buffery enkodéru.
+    """
+    with open_image(input_path) as im:
+        w, h = im.size
+        mode = im.mode
+        fmt = im.format
+        orientation = exif_orientation(im.info.get("exif"))
+
+    swap = orientation in (5, 6, 7, 8)
+    ow, oh = _fit_size((h, w) if swap else (w, h), max_width, max_height)
+    target = (oh, ow) if swap else (ow, oh)
+
+    dw, dh = (w, h)
+    if fmt == "JPEG" and target != (w, h):
+        dw, dh = _draft_size((w, h), target)
+
+    decoded = dw * dh * _PIXEL_BYTES.get(mode, 4)
+    if target == (w, h):
+        work = w * h * 4          # otočení / konverze režimu v plné velikosti
+    else:
+        work = ow * oh * 4 * 2    # zmenšená kopie + její otočení / konverze
+    out = ow * oh * 4
+    return decoded + work + out + 8 * 1024 * 1024
+
+SAMPLE_SIDE = 256  # delší strana vzorku pro odhad ceny (estimate.py)
+
+def header_info(
+    input_path: Union[Path, BinaryIO],
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+) -> dict:
+    """Rozměry vstupu a výstupu, formát a počet snímků jen z hlavičky (bez dekódování)."""
+    with open_image(input_path) as im:
+        w, h = im.size
+        info = {"width": w, "height": h, "format": im.format, "frames": im.n_frames if is_animated(im) else 1}
+        orientation = exif_orientation(im.info.get("exif"))
+    swap = orientation in (5, 6, 7, 8) and info["frames"] == 1  # animace se neotáčí
+    ow, oh = _fit_size((h, w) if swap else (w, h), max_width, max_height)
+    info.update(out_width=ow, out_height=oh)
+    return info
+
+def _encode_sample(
+    im: Image.Image,
+    src_format: Optional[str],
+    quality: int,
+    metadata: str = "keep",
+    side: int = SAMPLE_SIDE,
+) -> dict:
+    """
+    Zkušební enkód zmenšené kopie už připraveného obrázku (rysy pro estimate.py).
+    Zmenšuje se rovnou do malého obrázku, plná kopie nevzniká.
+    """
+    w, h = im.size
+    sample = im
+    if max(w, h) > side:
+        scale = side / max(w, h)
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        sample = im.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
     try:
-        with Image.open(input_path) as im:
-            im = ImageOps.exif_transpose(im)
-            im = _resize_if_needed(im, max_width)
-
-            if im.mode in ("I;16", "I", "F"):
-                im = im.convert("RGB")
-            elif im.mode in ("P", "LA"):
-                im = im.convert("RGBA")
-            elif im.mode == "CMYK":
-                im = im.convert("RGB")
-
-            save_kwargs = _choose_save_kwargs(input_path, im, quality)
+        save_kwargs, mode = _choose_save_kwargs(src_format, sample, quality, None, metadata)
+        meta_bytes = len(save_kwargs.pop("icc_profile", None) or b"") + len(save_kwargs.pop("exif", None) or b"")
+        alpha = not save_kwargs["lossless"] and "A" in sample.mode
+        if alpha:
+            # zmenšený vzorek má na hranách vždy částečnou alfu; plná alpha_quality
+            # by i 256px vzorek kódovala přes sekundu – jestli ji použije skutečná
+            # konverze, říká alpha_full
+            save_kwargs["alpha_quality"] = BINARY_ALPHA_QUALITY
+        enc = to_palette(sample) if mode == "near-lossless" else sample
+        buf = io.BytesIO()
+        t0 = time.perf_counter()
+        enc.save(buf, **save_kwargs)
+        seconds = time.perf_counter() - t0
+        pixels = enc.width * enc.height
+        if enc is not sample:
+            enc.close()
+    finally:
+        if sample is not im:
+            sample.close()
+    return {
+        "mode": mode,
+        "sample_pixels": pixels,
+        "sample_bytes": buf.tell(),
+        "sample_seconds": seconds,
+        "meta_bytes": meta_bytes,
+        "alpha": alpha,
+    }
+
+def sample_encode(
+    input_path: Path,
+    *,
+    quality: int = 72,
+    max_width: Optional[int] = None,
+    metadata: str = "keep",
+    side: int = SAMPLE_SIDE,
+) -> dict:
+    """
+    Levný zkušební enkód pro odhad ceny konverze (viz estimate.py): hlavička
+    + vzorek s delší stranou `side` (JPEG se rovnou dekóduje zmenšený, ostatní
+    formáty celé – špička RAM = estimate_peak_memory(path, side, side)), stejná
+    volba režimu jako v convert_to_webp. U animací jen první snímek.
+    Vrací header_info + mode, sample_pixels, sample_bytes, sample_seconds,
+    meta_bytes (ICC/EXIF, které se do výstupu přidají nezávisle na pixelech)
+    a alpha_full (lossy s alfou, kterou enkodér bude kódovat v plné kvalitě –
+    zmenšování binární alfu rozmaže).
+    """
+    info = header_info(input_path, max_width)
+    with open_image(input_path) as im:
+        src_format = im.format
+        im, _reduced = prepare_image(im, max_width=side, max_height=side, metadata=metadata)
+        sample = _encode_sample(im, src_format, quality, metadata, side)
+        im.close()
+    resized = info["out_width"] * info["out_height"] != info["width"] * info["height"]
+    alpha = sample.pop("alpha")
+    info.update(sample, alpha_full=alpha and resized)
+    return info
+
+def _swap(old: Image.Image, new: Image.Image) -> Image.Image:
+    # close() uvolní pixely předchozí verze hned, ne až při úklidu referencí
+    if new is not old:
+        old.close()
+    return new
+
+def prepare_image(
+    im: Image.Image,
+    *,
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+    metadata: str = "keep",
+    colorspace: str = "keep",
+    info: Optional[dict] = None,
+) -> Tuple[Image.Image, dict]:
+    """
+    Otevřený (nenačtený) obrázek → obrázek připravený k enkódování, s co
+    nejmenší špičkou RAM:
+    - JPEG se dekóduje rovnou zmenšený (draft = škálování v DCT),
+    - zmenšuje se před otočením, převodem barev a redukcí režimu
+      (resize s reducing_gap = nejdřív reduce() po celých násobcích),
+    - každá předchozí verze se hned uzavře, v paměti jsou nanejvýš dvě.
+    Předaný `im` je po návratu uzavřený, pokud vznikla nová verze.
+    Vrací (obrázek, výsledek reduce_mode).
+    """
+    t0 = time.perf_counter()
+    raw = im.info.get("exif")
+    if raw or metadata == "strip":
+        orientation = exif_orientation(raw)
+    else:
+        orientation = im.getexif().get(_ORIENTATION_TAG, 1)
+    op = _ORIENTATION_OPS.get(orientation)
+
+    swap = orientation in (5, 6, 7, 8)
+    w, h = im.size
+    ow, oh = _fit_size((h, w) if swap else (w, h), max_width, max_height)
+    target = (oh, ow) if swap else (ow, oh)
+    if target != im.size:
+        im.draft(im.mode, target)  # jen JPEG, jinde no-op
+    im.load()
+    t1 = time.perf_counter()
+
+    # režimy, které resize neumí (nebo jen NEAREST), převést ještě před ním
+    if im.mode in ("I", "F") or im.mode.startswith("I;16"):
+        im = _swap(im, im.convert("RGB"))
+    elif im.mode == "P":
+        im = _swap(im, im.convert("RGBA"))
+    elif im.mode == "1":
+        im = _swap(im, im.convert("L"))
+
+    if im.size != target:
+        im = _swap(im, im.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0))
+
+    if colorspace == "srgb":
+        converted, color = to_srgb(im)
+        im = _swap(im, converted)
+        if info is not None:
+            info["color"] = color
+
+    if op is not None:
+        im = _swap(im, im.transpose(op))
+
+    if im.mode == "LA":
+        im = _swap(im, im.convert("RGBA"))
+    elif im.mode == "CMYK":
+        im = _swap(im, im.convert("RGB"))
+
+    reduced_im, reduced = reduce_mode(im)
+    im = _swap(im, reduced_im)
+
+    if info is not None:
+        info["reduced"] = reduced
+        info["t_decode"] = t1 - t0
+        info["t_process"] = time.perf_counter() - t1
+    return im, reduced
+
+def is_animated(im: Image.Image) -> bool:
+    return (im.format in ANIMATED_FORMATS and bool(getattr(im, "is_animated", False))
+            and getattr(im, "n_frames", 1) > 1)
+
+class _AnimEncoder:
+    """
+    Tenký obal nad _webp.WebPAnimEncoder (libwebp). Snímky se posílají po
+    jednom, takže v paměti je jen aktuální plátno; výřez změněné oblasti
+    (sub-frame rectangle) si enkodér počítá sám proti předchozímu snímku.
+    Pillow 11 změnil signaturu (size + getim místo w/h + bytes).
+    """
+
+    def __init__(self, size, loop: int, lossless: bool, quality: int, method: int):
+        from PIL import _webp
+
+        self.size = size
+        self.lossless = bool(lossless)
+        self.quality = int(quality)
+        self.method = int(method)
+        kmin, kmax = (9, 17) if lossless else (3, 5)  # výchozí hodnoty gif2webp
+        bg = 0  # průhledné pozadí
+        try:
+            self._enc = _webp.WebPAnimEncoder(size, bg, loop, False, kmin, kmax, False, False)
+            self._legacy = False
+        except TypeError:
+            self._enc = _webp.WebPAnimEncoder(size[0], size[1], bg, loop, False, kmin, kmax, False, False)
+            self._legacy = True
+
+    def add(self, frame: Optional[Image.Image], timestamp: int, method: Optional[int] = None):
+        method = self.method if method is None else method
+        if self._legacy:
+            if frame is None:
+                self._enc.add(None, timestamp, 0, 0, "", self.lossless, self.quality, 100, method)
+            else:
+                self._enc.add(frame.tobytes("raw", "RGBA"), timestamp, frame.width, frame.height,
+                              "RGBA", self.lossless, self.quality, 100, method)
+        else:
+            self._enc.add(None if frame is None else frame.getim(), timestamp,
+                          self.lossless, self.quality, 100, method)
+
+    def finish(self, timestamp: int, icc_profile: Optional[bytes] = None, exif: Optional[bytes] = None) -> bytes:
+        self.add(None, timestamp, method=0)
+        data = self._enc.assemble(icc_profile or b"", exif or b"", b"")
+        if data is None:
+            raise OSError("WebP animation encoder returned no data")
+        return data
+
+def _diff_bbox(a: Image.Image, b: Image.Image):
+    diff = ImageChops.difference(a, b)
+    try:
+        return diff.getbbox(alpha_only=False)
+    except TypeError:  # Pillow < 10.1 bere u RGBA jen alfa kanál
+        bands = diff.split()
+        acc = bands[0]
+        for band in bands[1:]:
+            acc = ImageChops.lighter(acc, band)
+        return acc.getbbox()
+
+def _fit_size(size, max_width: Optional[int], max_height: Optional[int]):
+    w, h = size
+    if max_width and max_width > 0 and w > max_width:
+        w, h = max_width, max(1, int(h * max_width / w))
+    if max_height and max_height > 0 and h > max_height:
+        w, h = max(1, int(w * max_height / h)), max_height
+    return w, h
+
+def encode_animated(
+    im: Image.Image,
+    out: Union[Path, str, BinaryIO],
+    *,
+    quality: int = 72,
+    lossless: bool = False,
+    method: int = ANIM_METHOD,
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+    max_fps: Optional[float] = None,
+    icc_profile: Optional[bytes] = None,
+    exif: Optional[bytes] = None,
+) -> dict:
+    """
+    Animovaný GIF/APNG/WebP → animovaný WebP. Snímky se čtou postupně
+    (seek), drží se jen poslední odeslaný a jeden čekající snímek:
+    - stejný snímek jako předchozí se nepřidá, jen se prodlouží předchozí,
+    - max_fps: snímky ve stejném časovém okně 1/max_fps se slijí (vyhrává poslední),
+    - max_width/max_height zmenší každý snímek.
+    Vrací statistiky (frames_in, frames_out, merged, dropped, changed_ratio, duration_ms).
+    """
+    size = _fit_size(im.size, max_width, max_height)
+    enc = _AnimEncoder(size, int(im.info.get("loop", 0) or 0), lossless, quality, method)
+    slot_ms = 1000.0 / max_fps if max_fps and max_fps > 0 else 0.0
+
+    stats = {"frames_in": 0, "frames_out": 0, "merged": 0, "dropped": 0}
+    changed_px = 0
+    last: Optional[Image.Image] = None      # poslední snímek předaný enkodéru
+    pending: Optional[Image.Image] = None   # čeká, jestli ho další snímek nenahradí
+    pending_ts = 0
+    t = 0.0
+
+    def submit(frame: Image.Image, ts: int):
+        nonlocal last, changed_px
+        if last is not None:
+            bbox = _diff_bbox(frame, last)
+            if bbox is None:
+                stats["merged"] += 1
+                return
+            changed_px += (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+        else:
+            changed_px += frame.width * frame.height
+        enc.add(frame, ts)
+        stats["frames_out"] += 1
+        last = frame
+
+    for idx in range(im.n_frames):
+        im.seek(idx)
+        frame = im.convert("RGBA")
+        if frame.size != size:
+            frame = frame.resize(size, Image.Resampling.LANCZOS)
+        duration = im.info.get("duration") or 0
+        stats["frames_in"] += 1
+
+        if pending is not None and slot_ms and int(t // slot_ms) == int(pending_ts // slot_ms):
+            pending = frame  # stejné okno → poslední stav okna, čas začátku zůstává
+            stats["dropped"] += 1
+        else:
+            if pending is not None:
+                submit(pending, pending_ts)
+            pending, pending_ts = frame, int(round(t))
+        t += duration
+
+    if pending is not None:
+        submit(pending, pending_ts)
+    end_ts = max(int(round(t)), pending_ts + 1)
+    data = enc.finish(end_ts, icc_profile=icc_profile, exif=exif)
+
+    if isinstance(out, (str, Path)):
+        Path(out).parent.mkdir(parents=True, exist_ok=True)
+        Path(out).write_bytes(data)
+    else:
+        out.write(data)
+
+    canvas = size[0] * size[1] * max(stats["frames_out"], 1)
+    stats["changed_ratio"] = round(changed_px / canvas, 4)
+    stats["duration_ms"] = int(round(t))
+    stats["bytes"] = len(data)
+    return stats
+
+def convert_to_webp(
+    input_path: Path,
+    output_path: Path,
+    *,
+    quality: int = 72,
+    max_width: Optional[int] = None,
+    max_fps: Optional[float] = None,
+    metadata: str = "keep",
+    colorspace: str = "keep",
+    info: Optional[dict] = None,
+    sample_side: Optional[int] = None,
+) -> Tuple[bool, Optional[str]]:
+    """
+    info (volitelně): doplní se o rozhodnutí konverze, např. info["mode"].
+    sample_side: do info["sample"] přidá rysy jako sample_encode, ale z už
+    připraveného obrázku – bez druhého dekódování (historie pro estimate.py).
+    """
+    try:
+        if info is not None:
+            info["metadata"] = metadata
+        with open_image(input_path) as im:
+            if is_animated(im):
+                save_kwargs, _mode = _choose_save_kwargs(im.format, im, quality, info, metadata)
+                anim = encode_animated(
+                    im,
+                    output_path,
+                    quality=save_kwargs.get("quality", quality),
+                    lossless=save_kwargs["lossless"],
+                    max_width=max_width,
+                    max_fps=max_fps,
+                    icc_profile=save_kwargs.get("icc_profile"),
+                    exif=save_kwargs.get("exif"),
+                )
+                if info is not None:
+                    info["animation"] = anim
+                return True, None
+
+            src_format = im.format  # prepare_image vrací nový obrázek bez .format
+            src_w, src_h = im.size
+            im, reduced = prepare_image(
+                im,
+                max_width=max_width,
+                metadata=metadata,
+                colorspace=colorspace,
+                info=info,
+            )
+
+            save_kwargs, mode = _choose_save_kwargs(src_format, im, quality, info, metadata)
+            if reduced["alpha"] == "binary" and not save_kwargs["lossless"] and alpha_usage(im) == "binary":
+                save_kwargs["alpha_quality"] = BINARY_ALPHA_QUALITY
+            if sample_side and info is not None:
+                t0 = time.perf_counter()
+                sample = _encode_sample(im, src_format, quality, metadata, sample_side)
+                sample.pop("alpha")
+                sample.update(
+                    width=src_w, height=src_h, frames=1, out_width=im.width, out_height=im.height,
+                    alpha_full=not save_kwargs["lossless"] and "A" in im.mode and "alpha_quality" not in save_kwargs,
+                )
+                info["sample"] = sample
+                info["t_sample"] = time.perf_counter() - t0
+            if mode == "near-lossless":
+                im = _swap(im, to_palette(im))
             output_path.parent.mkdir(parents=True, exist_ok=True)
             im.save(output_path, **save_kwargs)
+            im.close()
 
         return True, None
     except Exception as e:
@@ -0,0 +1,224 @@
+from __future__ import annotations
+import json
+import math
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Odhad ceny konverze – doba enkódování a velikost výstupu – bez plné konverze.
+# Vstupem jsou rysy z convert.sample_encode (hlavička + zkušební enkód vzorku
+# ~256 px) a koeficienty nafitované na historii skutečných konverzí:
+#   bajty:  ln(bytes / sample_bytes) = b0 + b1·ln(out_px / sample_px)
+#           (zmenšený vzorek má víc detailu na pixel, proto b1 < 1)
+#   čas:    seconds = t0 + t1·in_px + t2·(sample_seconds / sample_px)·out_px·a
+#           (a = ALPHA_SLOWDOWN u alfy v plné kvalitě, viz convert.sample_encode)
+#   rychlý: seconds = q0 + q1·in_px + q2·out_px      (jen z hlavičky – pro frontu)
+# out_px zahrnuje počet snímků. Meze jsou ±Z·σ rezidua v log prostoru (90%
+# interval). Dokud historie nemá MIN_FIT záznamů, platí apriorní koeficienty
+# změřené na referenčním stroji (1 jádro, method 6) se širokou σ.
+#
+# Historie je NDJSON na uploads volume: append malého řádku je mezi workery
+# atomický, při přerůstání se soubor přepíše na posledních max_records řádků
+# (řádek připsaný jiným workerem během přepisu se ztratí – pro statistiku nevadí).
+# NumPy se importuje až při fitování – app ho při startu workeru nenačítá.
+
+Z90 = 1.645
+MIN_FIT = 8
+MIN_SIGMA = 0.05
+PRIOR_SIGMA = 0.6
+PRIOR_BYTES = (0.0, 0.6)
+PRIOR_SECONDS = (0.02, 1e-8, 0.8)
+PRIOR_QUICK = (0.02, 1e-8, 2e-7)
+ALPHA_SLOWDOWN = 10.0  # alpha_quality 100 vs BINARY_ALPHA_QUALITY při method 6
+FEATURES = (
+    "width", "height", "frames", "out_width", "out_height", "mode",
+    "sample_pixels", "sample_bytes", "sample_seconds", "meta_bytes", "alpha_full",
+)
+
+
+@dataclass
+class Estimate:
+    seconds: float
+    seconds_low: float
+    seconds_high: float
+    bytes: int
+    bytes_low: int
+    bytes_high: int
+    basis: str       # history | prior
+    samples: int     # kolik záznamů historie model viděl
+
+    def as_dict(self) -> dict:
+        return {
+            "seconds": {"estimate": round(self.seconds, 3), "low": round(self.seconds_low, 3),
+                        "high": round(self.seconds_high, 3)},
+            "bytes": {"estimate": self.bytes, "low": self.bytes_low, "high": self.bytes_high},
+            "confidence": 0.9,
+            "basis": self.basis,
+            "samples": self.samples,
+        }
+
+
+@dataclass
+class Fit:
+    bytes: Tuple[float, ...] = PRIOR_BYTES
+    seconds: Tuple[float, ...] = PRIOR_SECONDS
+    quick: Tuple[float, ...] = PRIOR_QUICK
+    sigma_bytes: float = PRIOR_SIGMA
+    sigma_seconds: float = PRIOR_SIGMA
+    samples: int = 0
+
+    @property
+    def basis(self) -> str:
+        return "history" if self.samples >= MIN_FIT else "prior"
+
+
+# ── rysy ────────────────────────────────────────────────────────
+def _out_px(f: dict) -> float:
+    return max(1, f["out_width"] * f["out_height"]) * max(1, f.get("frames") or 1)
+
+
+def _in_px(f: dict) -> float:
+    return float(f["width"] * f["height"])
+
+
+def _bytes_x(f: dict) -> float:
+    return math.log(_out_px(f) / max(1, f["sample_pixels"]))
+
+
+def _seconds_x(f: dict) -> List[float]:
+    per_px = f["sample_seconds"] / max(1, f["sample_pixels"])
+    if f.get("alpha_full"):
+        per_px *= ALPHA_SLOWDOWN
+    return [1.0, _in_px(f), per_px * _out_px(f)]
+
+
+def _quick_x(f: dict) -> List[float]:
+    return [1.0, _in_px(f), _out_px(f)]
+
+
+def _dot(coef: Sequence[float], x: Sequence[float]) -> float:
+    return max(1e-3, float(sum(c * v for c, v in zip(coef, x))))
+
+
+def _sigma(residuals) -> float:
+    import numpy as np
+    return max(MIN_SIGMA, float(np.std(residuals, ddof=min(2, len(residuals) - 1))))
+
+
+def _fit_linear(rows: List[List[float]], y: List[float], prior: Sequence[float]) -> Tuple[Tuple[float, ...], float]:
+    """Nejmenší čtverce se zápornými koeficienty srovnanými na 0; σ z log reziduí."""
+    import numpy as np
+    X, Y = np.asarray(rows), np.asarray(y)
+    coef, *_ = np.linalg.lstsq(X, Y, rcond=None)
+    coef = np.clip(coef, 0.0, None)
+    if not coef.any():
+        coef = np.asarray(prior)
+    pred = np.maximum(X @ coef, 1e-3)
+    return tuple(float(c) for c in coef), _sigma(np.log(Y) - np.log(pred))
+
+
+def fit(records: Sequence[dict]) -> Fit:
+    """Koeficienty z historie (záznam = FEATURES + seconds + bytes)."""
+    records = [r for r in records if r.get("seconds", 0) > 0 and r.get("bytes", 0) > 0 and r.get("sample_bytes")]
+    if len(records) < MIN_FIT:
+        return Fit(samples=len(records))
+    import numpy as np
+    x = np.asarray([_bytes_x(r) for r in records])
+    y = np.asarray([math.log(max(1, r["bytes"] - r.get("meta_bytes", 0)) / r["sample_bytes"]) for r in records])
+    A = np.column_stack([np.ones_like(x), x])
+    b_coef, *_ = np.linalg.lstsq(A, y, rcond=None)
+    seconds = [r["seconds"] for r in records]
+    s_coef, s_sigma = _fit_linear([_seconds_x(r) for r in records], seconds, PRIOR_SECONDS)
+    q_coef, _ = _fit_linear([_quick_x(r) for r in records], seconds, PRIOR_QUICK)
+    return Fit(
+        bytes=tuple(float(c) for c in b_coef),
+        seconds=s_coef,
+        quick=q_coef,
+        sigma_bytes=_sigma(y - A @ b_coef),
+        sigma_seconds=s_sigma,
+        samples=len(records),
+    )
+
+
+def _bounds(value: float, sigma: float) -> Tuple[float, float]:
+    spread = math.exp(Z90 * sigma)
+    return value / spread, value * spread
+
+
+# ── model s historií ────────────────────────────────────────────
+class CostModel:
+    """
+    history     – NDJSON soubor s historií (None = jen apriorní koeficienty)
+    max_records – z kolika posledních konverzí se fituje
+    """
+
+    def __init__(self, history: Optional[Path] = None, max_records: int = 2000):
+        self.history = Path(history) if history else None
+        self.max_records = max(MIN_FIT, int(max_records))
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._fit = Fit()
+
+    def record(self, features: dict, seconds: float, out_bytes: int):
+        """Zapíše skutečný výsledek konverze s rysy ze sample_encode téhož vstupu."""
+        if self.history is None:
+            return
+        row: Dict = {k: features.get(k) for k in FEATURES}
+        row.update(seconds=round(seconds, 4), bytes=int(out_bytes))
+        self.history.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.history, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(row, sort_keys=True) + "\n")
+            size = fh.tell()
+        if size > self.max_records * 2 * 300:  # ~300 B na řádek
+            self._trim()
+
+    def _load(self) -> List[dict]:
+        try:
+            lines = self.history.read_text("utf-8").splitlines()
+        except (OSError, AttributeError):
+            return []
+        out: List[dict] = []
+        for line in reversed(lines):
+            if len(out) >= self.max_records:
+                break
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue  # useknutý řádek
+        return out[::-1]
+
+    def _trim(self):
+        records = self._load()
+        tmp = self.history.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text("".join(json.dumps(r, sort_keys=True) + "\n" for r in records), "utf-8")
+        os.replace(tmp, self.history)
+
+    def current(self) -> Fit:
+        """Fit podle aktuální historie; přepočítá se jen když se soubor změnil."""
+        try:
+            st = self.history.stat()
+            stamp = (st.st_mtime_ns, st.st_size)
+        except (OSError, AttributeError):
+            return self._fit
+        with self._lock:
+            if stamp != self._stamp:
+                self._fit = fit(self._load())
+                self._stamp = stamp
+            return self._fit
+
+    def estimate(self, features: dict) -> Estimate:
+        """Odhad z rysů convert.sample_encode (čas enkódování a velikost výstupu s 90% mezemi)."""
+        f = self.current()
+        b0, b1 = f.bytes
+        size = math.exp(b0 + b1 * _bytes_x(features)) * features["sample_bytes"] + features.get("meta_bytes", 0)
+        seconds = _dot(f.seconds, _seconds_x(features))
+        s_low, s_high = _bounds(seconds, f.sigma_seconds)
+        b_low, b_high = _bounds(size, f.sigma_bytes)
+        return Estimate(seconds, s_low, s_high, int(round(size)), int(b_low), int(math.ceil(b_high)),
+                        f.basis, f.samples)
+
+    def quick_seconds(self, header: dict) -> float:
+        """Hrubý odhad doby jen z convert.header_info – pro frontu, bez zkušebního enkódu."""
+        return _dot(self.current().quick, _quick_x(header))
@@ -1,21 +1,43 @@
+import importlib
 import multiprocessing
+import os
+import sys
+import threading
 
-bind = "0.0.0.0:5000"
+# výchozí hodnoty jsou produkční; bench/loadtest.py je přepisuje přes env
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
 
-workers = max(2, multiprocessing.cpu_count() // 2)
-threads = 2
+workers = int(os.environ.get("GUNICORN_WORKERS") or max(2, multiprocessing.cpu_count() // 2))
+threads = int(os.environ.get("GUNICORN_THREADS") or 2)
 
 timeout = 600
 graceful_timeout = 60
 
-max_requests = 200
-max_requests_jitter = 50
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS") or 200)
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER") or 50)
 
 preload_app = False
 
 accesslog = "-"
 errorlog = "-"
-loglevel = "info"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
 
 keepalive = 5
 worker_tmp_dir = "/dev/shm"
+
+
+# nižší priorita CPU pro workery, které konvertují (imgwebp_backend); auth
+# skupina (imgwebp_auth) běží s 0, takže ji saturované konverze nepředbíhají
+nice = int(os.environ.get("GUNICORN_NICE") or 0)
+
+
+def post_worker_init(worker):
+    if nice:
+        os.nice(nice)
+    # app importuje convert (Pillow, NumPy) líně; worker už přijímá requesty
+    # a konverzní moduly se mezitím dotáhnou na pozadí
+    threading.Thread(target=importlib.import_module, args=("convert",), daemon=True).start()
+    # inbox webhooků se zpracovává na pozadí v každém workeru (viz webhook_inbox.py)
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.webhook_applier.start()
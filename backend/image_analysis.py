@@ -0,0 +1,150 @@
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Rychlá analýza obsahu (NumPy nad zmenšenou kopií) pro volbu režimu WebP
+# u PNG: grafika/ikony → lossless, screenshoty → near-lossless (paleta
+# 256 barev + lossless), fotky uložené jako PNG → lossy. Screenshot s fotkou
+# nebo přechodem by paleta bez ditheringu posterizovala – near-lossless jen
+# když paleta na vzorku drží PSNR i v nejhorší dlaždici, jinak lossless.
+
+SAMPLE_SIDE = 256        # delší strana vzorku
+SMOOTH_MAX = 12          # rozdíl sousedů 1..12 = plynulý přechod / šum
+EDGE_MIN = 48            # rozdíl > 48 = ostrá hrana (text, UI)
+
+PALETTE_COLORS = 256     # do tolika barev → lossless (WebP použije paletu)
+SCREEN_FLAT = 0.55       # aspoň tolik shodných sousedů → screenshot / UI
+PALETTE_MIN_PSNR = 40.0  # dB v nejhorší dlaždici vzorku; pod tím je paleta vidět
+PALETTE_TILE = 32        # dlaždice vzorku – lokální fotka se v průměru celku ztratí
+
+
+@dataclass
+class ContentStats:
+    colors: int           # počet unikátních RGBA barev ve vzorku
+    flat_ratio: float     # podíl sousedních pixelů beze změny
+    smooth_ratio: float   # podíl malých nenulových rozdílů
+    edge_density: float   # podíl ostrých hran
+    alpha: str            # none | opaque | binary | partial
+    palette_psnr: Optional[float] = None  # dB po to_palette (nejhorší dlaždice), jen u screenshotů
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def sample(im: Image.Image, side: int = SAMPLE_SIDE) -> Image.Image:
+    """Zmenšená kopie nejbližším sousedem – nevznikají nové barvy."""
+    w, h = im.size
+    if max(w, h) <= side:
+        return im
+    scale = side / max(w, h)
+    return im.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.Resampling.NEAREST)
+
+
+def _alpha_usage(a: np.ndarray) -> str:
+    if int(a.min()) == 255:
+        return "opaque"
+    if np.count_nonzero((a != 0) & (a != 255)) == 0:
+        return "binary"
+    return "partial"
+
+
+def _palette_psnr(small: Image.Image, arr: np.ndarray) -> float:
+    """PSNR vzorku po to_palette v nejhorší dlaždici PALETTE_TILE×PALETTE_TILE."""
+    q = to_palette(small)
+    diff = np.asarray(q.convert("RGBA")).astype(np.float32) - arr
+    err = (diff * diff).mean(axis=2)
+    worst = 0.0
+    for y in range(0, err.shape[0], PALETTE_TILE):
+        for x in range(0, err.shape[1], PALETTE_TILE):
+            worst = max(worst, float(err[y:y + PALETTE_TILE, x:x + PALETTE_TILE].mean()))
+    return 99.0 if worst == 0 else round(float(10 * np.log10(255 ** 2 / worst)), 1)
+
+
+def analyze(im: Image.Image) -> ContentStats:
+    has_alpha = im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info)
+    small = sample(im).convert("RGBA" if has_alpha else "RGB")
+    arr = np.asarray(small.convert("RGBA"))
+    h, w = arr.shape[:2]
+
+    packed = arr.view(np.uint32).reshape(h, w)
+    colors = int(np.unique(packed).size)
+
+    rgb = arr[..., :3].astype(np.int16)
+    dx = np.abs(np.diff(rgb, axis=1)).max(axis=2)
+    dy = np.abs(np.diff(rgb, axis=0)).max(axis=2)
+    total = dx.size + dy.size
+    if total:
+        flat = (np.count_nonzero(dx == 0) + np.count_nonzero(dy == 0)) / total
+        smooth = (np.count_nonzero((dx > 0) & (dx <= SMOOTH_MAX))
+                  + np.count_nonzero((dy > 0) & (dy <= SMOOTH_MAX))) / total
+        edge = (np.count_nonzero(dx > EDGE_MIN) + np.count_nonzero(dy > EDGE_MIN)) / total
+    else:
+        flat, smooth, edge = 1.0, 0.0, 0.0
+
+    palette_psnr = None
+    if colors > PALETTE_COLORS and flat >= SCREEN_FLAT:
+        palette_psnr = _palette_psnr(small, arr)
+
+    return ContentStats(
+        colors=colors,
+        flat_ratio=round(float(flat), 4),
+        smooth_ratio=round(float(smooth), 4),
+        edge_density=round(float(edge), 4),
+        alpha=_alpha_usage(arr[..., 3]) if has_alpha else "none",
+        palette_psnr=palette_psnr,
+    )
+
+
+def choose_png_mode(stats: ContentStats) -> str:
+    """lossless | near-lossless | lossy"""
+    if stats.colors <= PALETTE_COLORS:
+        return "lossless"
+    if stats.flat_ratio >= SCREEN_FLAT:
+        if stats.palette_psnr is not None and stats.palette_psnr < PALETTE_MIN_PSNR:
+            return "lossless"  # UI s fotkou / přechodem: lossy rozmaže text, paleta posterizuje
+        return "near-lossless"
+    return "lossy"
+
+
+def to_palette(im: Image.Image, colors: int = PALETTE_COLORS) -> Image.Image:
+    """Near-lossless: kvantizace na paletu bez ditheringu (ten by zhoršil lossless kompresi)."""
+    if "A" in im.mode:
+        q = im.convert("RGBA").quantize(colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        return q.convert("RGBA")
+    q = im.convert("RGB").quantize(colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+    return q.convert("RGB")
+
+
+def alpha_usage(im: Image.Image) -> str:
+    """none | opaque | binary | partial – extrema/histogram v C, bez kopie do NumPy."""
+    if "A" not in im.mode:
+        return "none"
+    alpha = im.getchannel("A")
+    if alpha.getextrema()[0] == 255:
+        return "opaque"
+    hist = alpha.histogram()
+    return "binary" if not any(hist[1:255]) else "partial"
+
+
+def reduce_mode(im: Image.Image) -> Tuple[Image.Image, dict]:
+    """
+    Nejmenší ekvivalentní režim před enkódováním (jen RGB/RGBA vstup):
+    - alfa samé 255 → RGB (enkodér nemusí řešit alfa rovinu),
+    - binární alfa (0/255) se jen nahlásí. Resize ji ale vyhladí, takže
+      alpha_quality se volí podle alpha_usage() až na výsledném obrázku.
+    Šedý obsah se do L / LA nepřevádí: WebP enkodér L i LA stejně vrací do
+    RGB(A) a výstup vyjde bajtově stejný.
+    Vrací (obrázek, {"alpha": none|opaque|binary|partial}).
+    """
+    out = {"alpha": "none"}
+    if im.mode not in ("RGB", "RGBA"):
+        return im, out
+
+    if im.mode == "RGBA":
+        out["alpha"] = alpha_usage(im)
+        if out["alpha"] == "opaque":
+            im = im.convert("RGB")
+    return im, out
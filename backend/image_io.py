@@ -0,0 +1,64 @@
+from __future__ import annotations
+import importlib.util
+import threading
+from pathlib import Path
+from typing import BinaryIO, Union
+
+from PIL import Image
+# jen pluginy formátů, které přijímáme – Image.open bez formats= by při
+# neznámém vstupu zavolal Image.init() a natáhl všech ~40 pluginů
+from PIL import (  # noqa: F401
+    BmpImagePlugin, GifImagePlugin, JpegImagePlugin, PngImagePlugin, TiffImagePlugin, WebPImagePlugin,
+)
+
+# Otevírání vstupů: omezená sada formátů a HEIF (pillow_heif, ~50 ms importu)
+# registrovaný až ve chvíli, kdy soubor opravdu začíná HEIF signaturou.
+
+# stejná sada jako ACCEPT ve frontendu (Webpify.tsx)
+ACCEPTED_FORMATS = ("JPEG", "PNG", "GIF", "WEBP", "TIFF", "BMP")
+
+# ISO-BMFF "ftyp" brandy HEIF/HEIC (iPhone: heic, sekvence: hevc/msf1)
+_HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"hevm", b"hevs", b"mif1", b"msf1"}
+
+_heif_lock = threading.Lock()
+_heif_state = None  # None = nezkoušeno, True/False = výsledek registrace
+
+
+def is_heif(prefix: bytes) -> bool:
+    return len(prefix) >= 12 and prefix[4:8] == b"ftyp" and prefix[8:12] in _HEIF_BRANDS
+
+
+def heif_available() -> bool:
+    """Je pillow_heif nainstalovaný? Bez importu – jen pro hlášky v CLI."""
+    return _heif_state if _heif_state is not None else importlib.util.find_spec("pillow_heif") is not None
+
+
+def ensure_heif() -> bool:
+    """Zaregistruje HEIF opener (jednou na proces). False = plugin chybí."""
+    global _heif_state
+    if _heif_state is None:
+        with _heif_lock:
+            if _heif_state is None:
+                try:
+                    from pillow_heif import register_heif_opener  # type: ignore
+                    register_heif_opener()
+                    _heif_state = True
+                except Exception:
+                    _heif_state = False
+    return _heif_state
+
+
+def open_image(src: Union[str, Path, BinaryIO]) -> Image.Image:
+    """Image.open omezený na ACCEPTED_FORMATS (+ HEIF, pokud ho vstup potřebuje)."""
+    if isinstance(src, (str, Path)):
+        with open(src, "rb") as fh:
+            prefix = fh.read(16)
+    else:
+        pos = src.tell()
+        prefix = src.read(16)
+        src.seek(pos)
+
+    formats = ACCEPTED_FORMATS
+    if is_heif(prefix) and ensure_heif():
+        formats = ("HEIF",) + formats
+    return Image.open(src, formats=formats)
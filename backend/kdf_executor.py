@@ -0,0 +1,42 @@
+from __future__ import annotations
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from admission import Rejected
+
+# Hashování hesel (scrypt/pbkdf2, desítky ms CPU) na malém vlastním poolu.
+# hashlib během KDF uvolňuje GIL, takže pool skutečně omezuje, kolik jader
+# si login/registrace naráz vezme; request vlákno jen čeká na výsledek.
+# Přes max_pending čekajících se hned odmítá 503 (stejné Rejected jako fronta
+# konverzí), místo aby se fronta hromadila do timeoutů klientů.
+
+
+class KdfExecutor:
+    def __init__(self, workers: int = 2, max_pending: int = 32, timeout: float = 10.0):
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kdf")
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, int(max_pending)))
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise Rejected(503, "auth_busy", 1)
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise Rejected(503, "auth_timeout", max(1, int(self.timeout)))
+
+    def hash_password(self, password: str) -> str:
+        return self.run(generate_password_hash, password)
+
+    def check_password(self, pwhash: str, password: str) -> bool:
+        return self.run(check_password_hash, pwhash, password)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import concurrent.futures as futures
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Optional
+
+# Paměťový rozpočet pro konverze: job se pustí jen když se jeho odhad
+# špičkové RAM (viz convert.estimate_peak_memory) vejde do zbývajícího limitu.
+
+_UNITS = {
+    "": 1, "b": 1,
+    "k": 1024, "kb": 1024, "kib": 1024,
+    "m": 1024 ** 2, "mb": 1024 ** 2, "mib": 1024 ** 2,
+    "g": 1024 ** 3, "gb": 1024 ** 3, "gib": 1024 ** 3,
+    "t": 1024 ** 4, "tb": 1024 ** 4, "tib": 1024 ** 4,
+}
+
+
+def available_memory() -> Optional[int]:
+    try:
+        with open("/proc/meminfo", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def parse_size(value) -> int:
+    """'4G', '512M', '1.5GiB', '0' (= bez limitu), 'auto' (= 75 % MemAvailable)."""
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().lower()
+    if not text:
+        return 0
+    if text == "auto":
+        avail = available_memory()
+        return int(avail * 0.75) if avail else 0
+    num = text.rstrip("kmgtib")
+    unit = text[len(num):]
+    if unit not in _UNITS:
+        raise ValueError(f"unknown size unit: {value!r}")
+    return int(float(num) * _UNITS[unit])
+
+
+class MemoryBudget:
+    """
+    Počítadlo rezervované paměti. Job větší než celý limit se pustí, jen
+    když nic jiného neběží – jinak by čekal navždy.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = int(limit)
+        self.used = 0
+        self._cond = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def _fits(self, n: int) -> bool:
+        return not self.enabled or self.used == 0 or self.used + n <= self.limit
+
+    def try_acquire(self, n: int) -> bool:
+        with self._cond:
+            if not self._fits(n):
+                return False
+            self.used += n
+            return True
+
+    def acquire(self, n: int, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._fits(n):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.used += n
+            return True
+
+    def release(self, n: int):
+        with self._cond:
+            self.used = max(0, self.used - n)
+            self._cond.notify_all()
+
+
+class _Pending:
+    __slots__ = ("cost", "fn", "args", "future")
+
+    def __init__(self, cost, fn, args, future):
+        self.cost = cost
+        self.fn = fn
+        self.args = args
+        self.future = future
+
+
+class BudgetedExecutor:
+    """
+    ThreadPoolExecutor s paměťovým rozpočtem. Když se první čekající job
+    nevejde, pustí se menší joby za ním (okno `lookahead`), aby pool nestál.
+    Po `max_bypass` předběhnutích už se ale čeká na něj, aby velké soubory
+    nehladověly.
+    """
+
+    def __init__(self, workers: int, budget: MemoryBudget, lookahead: int = 64, max_bypass: Optional[int] = None):
+        self.workers = max(1, int(workers))
+        self.budget = budget
+        self.lookahead = lookahead
+        self.max_bypass = max_bypass if max_bypass is not None else self.workers * 4
+        self._ex = futures.ThreadPoolExecutor(max_workers=self.workers)
+        self._lock = threading.Condition()
+        self._pending: Deque[_Pending] = deque()
+        self._running = 0
+        self._head_bypassed = 0
+        self.peak_used = 0
+        self.wait_s = 0.0
+        self._blocked_since: Optional[float] = None
+
+    def submit(self, cost: int, fn: Callable, *args) -> futures.Future:
+        fut: futures.Future = futures.Future()
+        with self._lock:
+            self._pending.append(_Pending(int(cost), fn, args, fut))
+        self._dispatch()
+        return fut
+
+    def _pick(self) -> Optional[_Pending]:
+        for i, item in enumerate(self._pending):
+            if i >= self.lookahead:
+                break
+            if self.budget.try_acquire(item.cost):
+                del self._pending[i]
+                self._head_bypassed = self._head_bypassed + 1 if i else 0
+                return item
+            if i == 0 and self._head_bypassed >= self.max_bypass:
+                break
+        return None
+
+    def _dispatch(self):
+        start = []
+        with self._lock:
+            while self._running < self.workers and self._pending:
+                item = self._pick()
+                if item is None:
+                    break
+                self._running += 1
+                start.append(item)
+            self.peak_used = max(self.peak_used, self.budget.used)
+            now = time.monotonic()
+            blocked = bool(self._pending) and self._running < self.workers
+            if blocked and self._blocked_since is None:
+                self._blocked_since = now
+            elif not blocked and self._blocked_since is not None:
+                self.wait_s += now - self._blocked_since
+                self._blocked_since = None
+        for item in start:
+            inner = self._ex.submit(item.fn, *item.args)
+            inner.add_done_callback(lambda f, item=item: self._finished(item, f))
+
+    def _finished(self, item: _Pending, inner: futures.Future):
+        self.budget.release(item.cost)
+        with self._lock:
+            self._running -= 1
+            self._lock.notify_all()
+        exc = inner.exception()
+        if exc is not None:
+            item.future.set_exception(exc)
+        else:
+            item.future.set_result(inner.result())
+        self._dispatch()
+
+    def shutdown(self, wait: bool = True):
+        if wait:
+            with self._lock:
+                while self._pending or self._running:
+                    self._lock.wait()
+        self._ex.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown(wait=True)
+        return False
@@ -0,0 +1,199 @@
+from __future__ import annotations
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+from admission import Rejected
+from result_cache import ResultCache
+
+# Odvozené rendice pro režim CDN originu: GET /img/<id>?w=800&q=75&fmt=webp.
+# Originály leží na uploads volume, hotové rendice v ResultCache s vlastním
+# adresářem a stropem (nejdéle nepoužité se mažou). Šířka a kvalita se
+# přichytí na nastavené sady – na jeden originál tak připadá konečný počet
+# rendic a náhodná čísla v URL cache nenafouknou.
+# Souběžné požadavky na stejnou rendici konvertuje jen jeden: ve workeru
+# zámek na klíč, mezi workery flock (256 souborů podle prefixu klíče).
+
+FORMATS = ("webp",)
+LOCK_STRIPES = 256
+_SEGMENT = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*\Z")
+
+
+class RenditionError(Exception):
+    """Konverze originálu selhala (poškozený nebo nepodporovaný soubor)."""
+
+
+def parse_steps(value: str) -> Tuple[int, ...]:
+    """"320, 640,1280" → (320, 640, 1280); nečíselné a nekladné položky se zahodí."""
+    steps = set()
+    for item in (value or "").split(","):
+        try:
+            n = int(item.strip())
+        except ValueError:
+            continue
+        if n > 0:
+            steps.add(n)
+    return tuple(sorted(steps))
+
+
+def snap_up(value: int, steps: Sequence[int]) -> int:
+    """Nejmenší krok >= value (obrázek se nezmenší víc, než klient chtěl); nad sadou největší."""
+    for step in steps:
+        if step >= value:
+            return step
+    return steps[-1]
+
+
+def snap_nearest(value: int, steps: Sequence[int]) -> int:
+    """Nejbližší krok; při shodě vzdálenosti ten vyšší."""
+    return min(steps, key=lambda step: (abs(step - value), -step))
+
+
+def _digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()[:32]
+
+
+class RenditionStore:
+    """
+    originals    – kořen originálů; id je relativní cesta pod ním
+    cache        – ResultCache pro hotové rendice (max_bytes 0 = bez cache,
+                   každý požadavek konvertuje znovu)
+    widths       – povolené šířky; prázdné = jen původní šířka
+    qualities    – povolené kvality
+    lock_timeout – jak dlouho čekat na souběžnou konverzi téže rendice
+    """
+
+    def __init__(self, originals: Path, cache: ResultCache, widths: Sequence[int], qualities: Sequence[int],
+                 default_quality: int = 72, lock_timeout: float = 30.0):
+        if not qualities:
+            raise ValueError("qualities must not be empty")
+        self.originals = Path(originals)
+        self.cache = cache
+        self.widths = tuple(sorted(widths))
+        self.qualities = tuple(sorted(qualities))
+        self.default_quality = snap_nearest(default_quality, self.qualities)
+        self.lock_timeout = lock_timeout
+        self._guard = threading.Lock()
+        self._flights: Dict[str, List] = {}  # klíč → [Lock, počet čekajících]
+
+    # ── vstup ───────────────────────────────────────────────────
+    def original(self, original_id: str) -> Optional[Path]:
+        """Cesta k originálu, nebo None – neplatné id (.., skryté soubory) i symlink ven z kořene."""
+        parts = original_id.split("/")
+        if not all(_SEGMENT.match(p) for p in parts):
+            return None
+        path = self.originals.joinpath(*parts)
+        try:
+            path.resolve(strict=True).relative_to(self.originals.resolve())
+        except (OSError, ValueError):
+            return None
+        return path if path.is_file() else None
+
+    def snap(self, width: Optional[int], quality: Optional[int]) -> Tuple[Optional[int], int]:
+        """Požadovaná šířka/kvalita → hodnoty ze sady (None = původní šířka)."""
+        if width is None or not self.widths:
+            width = None
+        else:
+            width = snap_up(width, self.widths)
+        quality = self.default_quality if quality is None else snap_nearest(quality, self.qualities)
+        return width, quality
+
+    def key(self, original_id: str, path: Path, params: dict) -> str:
+        # velikost + mtime originálu: přepsaný originál dostane nové klíče i ETagy
+        st = path.stat()
+        return self.cache.result_key(f"img:{original_id}", f"{st.st_size}:{st.st_mtime_ns}", params)
+
+    # ── rendice ─────────────────────────────────────────────────
+    def _read(self, key: str) -> Optional[Tuple[bytes, dict]]:
+        hit = self.cache.get_result(key)
+        if hit is None:
+            return None
+        try:
+            return hit[0].read_bytes(), hit[1]
+        except OSError:
+            return None  # mezitím smazal prune
+
+    def get_or_build(self, key: str, build: Callable[[Path], dict]) -> Tuple[bytes, dict, str]:
+        """
+        Rendice z cache, nebo ji postaví build(out_path) → meta. Vrací
+        (data, meta, stav), stav je hit / miss / coalesced (počkal na cizí konverzi).
+        Plno nebo dlouhé čekání → Rejected; chyba konverze → RenditionError z build.
+        """
+        found = self._read(key)
+        if found:
+            return found[0], found[1], "hit"
+        with self._flight(key):
+            found = self._read(key)
+            if found:
+                return found[0], found[1], "coalesced"
+            tmpdir = tempfile.mkdtemp(prefix="rendition-")
+            try:
+                out = Path(tmpdir) / "out.webp"
+                meta = dict(build(out))
+                meta["etag"] = _digest(out)
+                try:
+                    self.cache.put_result(key, out, meta)
+                except OSError:
+                    pass  # plný disk: rendici vrátíme, jen se neuloží
+                return out.read_bytes(), meta, "miss"
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+    # ── koalescence ─────────────────────────────────────────────
+    @contextmanager
+    def _flight(self, key: str):
+        with self._guard:
+            entry = self._flights.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            if not entry[0].acquire(timeout=self.lock_timeout):
+                raise Rejected(503, "rendition_busy", 1)
+            try:
+                with self._file_lock(key):
+                    yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._flights[key]
+
+    @contextmanager
+    def _file_lock(self, key: str):
+        if fcntl is None or not self.cache.enabled:
+            yield
+            return
+        stripe = int(key[:4], 16) % LOCK_STRIPES
+        path = self.cache.root / "locks" / f"{stripe:02x}.lock"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            deadline = time.monotonic() + self.lock_timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise Rejected(503, "rendition_busy", 1)
+                    time.sleep(0.05)
+            yield
+        finally:
+            os.close(fd)  # zavřením se flock uvolní
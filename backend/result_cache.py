@@ -0,0 +1,197 @@
+from __future__ import annotations
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+# Cache hotových konverzí na disku (uploads volume, sdílený všemi workery).
+# Klíč = vlastník + SHA-256 vstupu + parametry konverze, takže preflight
+# s hashem spočítaným v prohlížeči najde výsledek bez nahrávání souboru.
+# Vlastník je v klíči záměrně: kdo zná hash cizího souboru, nedostane
+# cizí výsledek ani potvrzení, že soubor na serveru je.
+#
+# <root>/results/<klíč>.webp (+ .json s X-Webp-* údaji)
+# <root>/originals/<vlastník+hash>.orig  – pro jiné parametry bez uploadu
+# Přípony .webp/.orig batch watcher nad uploads nekonvertuje.
+
+CACHE_VERSION = 1
+HASH_CHUNK = 1024 * 1024
+
+
+def is_sha256(value) -> bool:
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def save_hashed(stream: BinaryIO, path: Path) -> Tuple[str, int]:
+    """Uloží stream do path a cestou spočítá SHA-256 – bez druhého čtení souboru."""
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as fh:
+        while True:
+            chunk = stream.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+            fh.write(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+class ResultCache:
+    """
+    max_bytes – strop velikosti cache (výsledky + originály), nejstarší
+                podle mtime se mažou; 0 = cache vypnutá
+    """
+
+    def __init__(self, root: Path, max_bytes: int, secret: str, token_ttl: int = 120):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.token_ttl = token_ttl
+        self._secret = secret.encode("utf-8")
+        self._lock = threading.Lock()
+        self._approx_size: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # ── klíče ───────────────────────────────────────────────────
+    def _digest(self, *parts: str) -> str:
+        return hashlib.sha256("\0".join((str(CACHE_VERSION),) + parts).encode("utf-8")).hexdigest()
+
+    def result_key(self, owner: str, sha256: str, params: dict) -> str:
+        return self._digest("result", owner, sha256, json.dumps(params, sort_keys=True))
+
+    def original_key(self, owner: str, sha256: str) -> str:
+        return self._digest("original", owner, sha256)
+
+    # ── čtení ───────────────────────────────────────────────────
+    def _result_path(self, key: str) -> Path:
+        return self.root / "results" / f"{key}.webp"
+
+    def _original_path(self, key: str) -> Path:
+        return self.root / "originals" / f"{key}.orig"
+
+    @staticmethod
+    def _touch(path: Path) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def get_result(self, key: str) -> Optional[Tuple[Path, dict]]:
+        if not self.enabled:
+            return None
+        path = self._result_path(key)
+        if not self._touch(path):
+            return None
+        try:
+            meta = json.loads(path.with_suffix(".json").read_text("utf-8"))
+        except (OSError, ValueError):
+            meta = {}
+        return path, meta
+
+    def get_original(self, key: str, size: Optional[int] = None) -> Optional[Path]:
+        if not self.enabled:
+            return None
+        path = self._original_path(key)
+        try:
+            if size is not None and path.stat().st_size != size:
+                return None
+        except OSError:
+            return None
+        return path if self._touch(path) else None
+
+    # ── zápis ───────────────────────────────────────────────────
+    def _store(self, src: Path, dst: Path):
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dst.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)  # atomicky – souběžný čtenář vidí celý soubor nebo nic
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self._grow(dst.stat().st_size)
+
+    def put_result(self, key: str, src: Path, meta: dict):
+        if not self.enabled:
+            return
+        path = self._result_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.with_suffix(".json").write_text(json.dumps(meta), "utf-8")
+        self._store(src, path)
+
+    def put_original(self, key: str, src: Path):
+        if not self.enabled or self._original_path(key).exists():
+            return
+        self._store(src, self._original_path(key))
+
+    # ── úklid ───────────────────────────────────────────────────
+    def _files(self):
+        for sub in ("results", "originals"):
+            try:
+                with os.scandir(self.root / sub) as it:
+                    for entry in it:
+                        if entry.is_file() and not entry.name.endswith(".tmp"):
+                            yield entry
+            except FileNotFoundError:
+                continue
+
+    def _grow(self, n: int):
+        with self._lock:
+            if self._approx_size is None:
+                self._approx_size = sum(e.stat().st_size for e in self._files())
+            else:
+                self._approx_size += n
+            over = self._approx_size > self.max_bytes
+        if over:
+            self.prune()
+
+    def prune(self):
+        """Smaže nejdéle nepoužité soubory, až je cache pod 90 % stropu."""
+        with self._lock:
+            entries = sorted(self._files(), key=lambda e: e.stat().st_mtime)
+            total = sum(e.stat().st_size for e in entries)
+            target = self.max_bytes * 0.9
+            for entry in entries:
+                if total <= target:
+                    break
+                if entry.name.endswith(".json"):
+                    continue  # maže se spolu s .webp
+                try:
+                    size = entry.stat().st_size
+                    os.unlink(entry.path)
+                    if entry.name.endswith(".webp"):
+                        Path(entry.path).with_suffix(".json").unlink(missing_ok=True)
+                    total -= size
+                except OSError:
+                    pass
+            self._approx_size = total
+
+    # ── download token ──────────────────────────────────────────
+    def _sign(self, payload: str) -> str:
+        return hmac.new(self._secret, payload.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def issue_token(self, key: str) -> str:
+        """Krátkodobý podepsaný odkaz na výsledek – bezstavový, platí v každém workeru."""
+        payload = f"{key}.{int(time.time()) + self.token_ttl}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def resolve_token(self, token: str) -> Optional[Tuple[Path, dict]]:
+        try:
+            key, exp, sig = token.split(".")
+            expired = int(exp) < time.time()
+        except ValueError:
+            return None
+        if expired or not hmac.compare_digest(sig, self._sign(f"{key}.{exp}")):
+            return None
+        return self.get_result(key)
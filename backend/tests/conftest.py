@@ -7,8 +7,11 @@ import pytest
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 BACKEND_DIR = REPO_ROOT / "backend"
-if str(BACKEND_DIR) not in sys.path:
-    sys.path.insert(0, str(BACKEND_DIR))
+TOOLS_DIR = BACKEND_DIR / "tools"
+BENCH_DIR = BACKEND_DIR / "bench"
+for _p in (BACKEND_DIR, TOOLS_DIR, BENCH_DIR):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
 
 
 @pytest.fixture(scope="session")
@@ -19,6 +22,12 @@ def app_module(tmp_path_factory):
     mp.setenv("JWT_SECRET", "test-secret")
     mp.setenv("BMC_WEBHOOK_SECRET", "test-bmc-secret")
     mp.setenv("FREE_LIMIT", "2")
+    mp.setenv("RESULT_CACHE_DIR", str(tmp_path_factory.mktemp("result-cache")))
+    mp.setenv("UPLOAD_SESSION_DIR", str(tmp_path_factory.mktemp("uploads")))
+    mp.setenv("IMG_ORIGINALS_DIR", str(tmp_path_factory.mktemp("originals")))
+    mp.setenv("RENDITION_CACHE_DIR", str(tmp_path_factory.mktemp("renditions")))
+    mp.setenv("ESTIMATE_HISTORY", str(tmp_path_factory.mktemp("estimate") / "history.ndjson"))
+    mp.setenv("ESTIMATE_RECORD_RATE", "0")
     try:
         app_module = importlib.import_module("app")
         with app_module.app.app_context():
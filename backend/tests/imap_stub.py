@@ -0,0 +1,230 @@
+"""Minimální IMAP4rev1 server pro testy imap_activate (jedna schránka, bez TLS).
+
+Umí jen to, co worker používá: LOGIN, SELECT, UID SEARCH/FETCH/STORE, IDLE,
+NOOP, LOGOUT. Každý příkaz a počet odeslaných bajtů se zaznamená, aby testy
+mohly ověřit, že se nestahují celé zprávy.
+"""
+from __future__ import annotations
+import email
+import re
+import socketserver
+import threading
+from email.message import Message
+from typing import List, Optional
+
+
+def _q(value: Optional[str]) -> str:
+    if value is None:
+        return "NIL"
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def bodystructure(part: Message) -> str:
+    if part.is_multipart():
+        children = "".join(bodystructure(p) for p in part.get_payload())
+        return f"({children} {_q(part.get_content_subtype().upper())})"
+    payload = part.get_payload()
+    params = " ".join(f"{_q(k.upper())} {_q(v)}" for k, v in part.get_params()[1:]) or None
+    params = f"({params})" if params else "NIL"
+    encoding = _q((part.get("Content-Transfer-Encoding") or "7BIT").upper())
+    disposition = part.get_content_disposition()
+    if disposition:
+        filename = part.get_filename()
+        dparams = f'("FILENAME" {_q(filename)})' if filename else "NIL"
+        disposition = f"({_q(disposition)} {dparams})"
+    else:
+        disposition = "NIL"
+    head = f"({_q(part.get_content_maintype().upper())} {_q(part.get_content_subtype().upper())} {params} NIL NIL {encoding} {len(payload)}"
+    if part.get_content_maintype() == "text":
+        return f"{head} {payload.count(chr(10))} NIL {disposition} NIL)"
+    return f"{head} NIL {disposition} NIL)"
+
+
+def section(msg: Message, spec: str) -> bytes:
+    if spec == "":
+        return msg.as_bytes()
+    if spec.startswith("HEADER.FIELDS"):
+        names = re.findall(r"[\w-]+", spec[len("HEADER.FIELDS"):])
+        lines = [f"{k}: {v}" for k, v in msg.items() if k.upper() in {n.upper() for n in names}]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+    part = msg
+    for n in spec.split("."):
+        part = part.get_payload()[int(n) - 1] if part.is_multipart() else part
+    return part.get_payload().encode()
+
+
+class Mailbox:
+    def __init__(self, capabilities=("IMAP4rev1", "IDLE")):
+        self.capabilities = capabilities
+        self.messages: List[dict] = []  # {"uid", "msg", "flags"}
+        self.commands: List[str] = []
+        self.bytes_sent = 0
+        self.idling = threading.Event()
+        self.lock = threading.Condition()
+        self.uidvalidity = 1
+        self.next_uid = 1
+        self.idle_exists_now = False  # EXISTS hned v paketu s `+ idling`
+
+    def append(self, raw: bytes, flags=()):
+        with self.lock:
+            self.messages.append({"uid": self.next_uid, "msg": email.message_from_bytes(raw), "flags": set(flags)})
+            self.next_uid += 1
+            self.lock.notify_all()
+
+    def seen(self) -> List[int]:
+        return [m["uid"] for m in self.messages if "\\Seen" in m["flags"]]
+
+
+def _uids(spec: str, mailbox: Mailbox) -> List[int]:
+    top = max([m["uid"] for m in mailbox.messages], default=0)
+    out = set()
+    for chunk in spec.split(","):
+        a, _, b = chunk.partition(":")
+        lo = top if a == "*" else int(a)
+        hi = lo if not b else (top if b == "*" else int(b))
+        out.update(range(min(lo, hi), max(lo, hi) + 1))
+    return sorted(out)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    mailbox: Mailbox
+
+    def send(self, data: bytes):
+        self.mailbox.bytes_sent += len(data)
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def handle(self):
+        box = self.server.mailbox  # type: ignore[attr-defined]
+        self.mailbox = box
+        self.send(b"* OK stub ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            text = line.decode().rstrip("\r\n")
+            box.commands.append(text)
+            tag, _, rest = text.partition(" ")
+            cmd, _, args = rest.partition(" ")
+            cmd = cmd.upper()
+            if cmd == "UID":
+                sub, _, args = args.partition(" ")
+                cmd = "UID " + sub.upper()
+            handler = getattr(self, "do_" + cmd.replace(" ", "_"), None)
+            if handler is None:
+                self.send(f"{tag} BAD unknown command\r\n".encode())
+                continue
+            if handler(tag, args) is False:
+                return
+
+    def do_CAPABILITY(self, tag, args):
+        self.send(f"* CAPABILITY {' '.join(self.mailbox.capabilities)}\r\n{tag} OK done\r\n".encode())
+
+    def do_LOGIN(self, tag, args):
+        self.send(f"{tag} OK logged in\r\n".encode())
+
+    def do_SELECT(self, tag, args):
+        box = self.mailbox
+        self.send(f"* {len(box.messages)} EXISTS\r\n* OK [UIDVALIDITY {box.uidvalidity}] ok\r\n"
+                  f"* OK [UIDNEXT {box.next_uid}] ok\r\n"
+                  f"{tag} OK [READ-WRITE] done\r\n".encode())
+
+    def do_NOOP(self, tag, args):
+        self.send(f"{tag} OK done\r\n".encode())
+
+    def do_LOGOUT(self, tag, args):
+        self.send(f"* BYE\r\n{tag} OK done\r\n".encode())
+        return False
+
+    def do_UID_SEARCH(self, tag, args):
+        box = self.mailbox
+        words = args.upper().split()
+        found = [m["uid"] for m in box.messages]
+        if "UNSEEN" in words:
+            found = [m["uid"] for m in box.messages if "\\Seen" not in m["flags"]]
+        if "UID" in words:
+            allowed = set(_uids(words[words.index("UID") + 1], box))
+            found = [u for u in found if u in allowed]
+        self.send(f"* SEARCH {' '.join(map(str, found))}\r\n{tag} OK done\r\n".encode())
+
+    def do_UID_FETCH(self, tag, args):
+        box = self.mailbox
+        spec, _, items = args.partition(" ")
+        wanted = set(_uids(spec, box))
+        for seq, m in enumerate(box.messages, 1):
+            if m["uid"] not in wanted:
+                continue
+            out = [f"UID {m['uid']}".encode()]
+            if "BODYSTRUCTURE" in items:
+                out.append(f"BODYSTRUCTURE {bodystructure(m['msg'])}".encode())
+            if "RFC822" in items:
+                data = m["msg"].as_bytes()
+                out.append(b"RFC822 {%d}\r\n" % len(data) + data)
+                m["flags"].add("\\Seen")
+            for peek, sec in re.findall(r"BODY(\.PEEK)?\[([^\]]*)\]", items):
+                data = section(m["msg"], sec)
+                out.append(f"BODY[{sec}] {{{len(data)}}}\r\n".encode() + data)
+                if not peek:
+                    m["flags"].add("\\Seen")
+            self.send(f"* {seq} FETCH (".encode() + b" ".join(out) + b")\r\n")
+        self.send(f"{tag} OK done\r\n".encode())
+
+    def do_UID_STORE(self, tag, args):
+        box = self.mailbox
+        spec, _, rest = args.partition(" ")
+        wanted = set(_uids(spec, box))
+        for m in box.messages:
+            if m["uid"] in wanted and "\\Seen" in rest:
+                m["flags"].add("\\Seen")
+        self.send(f"{tag} OK done\r\n".encode())
+
+    def do_IDLE(self, tag, args):
+        box = self.mailbox
+        if box.idle_exists_now:
+            self.send(f"+ idling\r\n* {len(box.messages)} EXISTS\r\n".encode())
+        else:
+            self.send(b"+ idling\r\n")
+        known = len(box.messages)
+        box.idling.set()
+        done = threading.Event()
+
+        def notify():
+            with box.lock:
+                while not done.is_set():
+                    if len(box.messages) > known:
+                        self.send(f"* {len(box.messages)} EXISTS\r\n".encode())
+                        return
+                    box.lock.wait(0.05)
+
+        watcher = threading.Thread(target=notify, daemon=True)
+        watcher.start()
+        line = self.rfile.readline()
+        done.set()
+        box.idling.clear()
+        watcher.join()
+        if line.strip().upper() != b"DONE":
+            self.send(f"{tag} BAD expected DONE\r\n".encode())
+            return False
+        self.send(f"{tag} OK idle done\r\n".encode())
+
+
+class ImapStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: Mailbox):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.mailbox = mailbox
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
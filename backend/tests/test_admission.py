@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionQueue, Rejected
+
+
+def _enqueue(q, client, lane, order, cost=None):
+    """Spustí čekající požadavek ve vlákně a počká, až je opravdu ve frontě."""
+    before = q.waiting
+
+    def run():
+        ticket = q.acquire(client, lane, cost=cost)
+        order.append(client)
+        q.release(ticket)
+
+    t = threading.Thread(target=run)
+    t.start()
+    deadline = time.monotonic() + 2
+    while q.waiting == before and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return t
+
+
+def test_round_robin_between_clients_and_paid_lane_first():
+    q = AdmissionQueue(1, max_depth=10, free_depth=10, per_client=5, weights={"paid": 1, "free": 1})
+    held = q.acquire("holder", "free")
+    order = []
+    threads = [_enqueue(q, "bulk", "free", order) for _ in range(3)]
+    threads.append(_enqueue(q, "single", "free", order))
+    threads.append(_enqueue(q, "payer", "paid", order))
+
+    q.release(held)
+    for t in threads:
+        t.join(timeout=5)
+
+    # bulk neblokuje ostatní: po prvním jeho požadavku jde single
+    assert order == ["payer", "bulk", "single", "bulk", "bulk"]
+    assert q.running == 0 and q.waiting == 0
+
+
+def test_img_lane_yields_to_paid_and_leads_free():
+    q = AdmissionQueue(1, max_depth=10, free_depth=10, per_client=5)
+    held = q.acquire("holder", "free")
+    order = []
+    threads = [_enqueue(q, f"img:cdn{i}", "img", order) for i in range(3)]
+    threads += [_enqueue(q, f"free{i}", "free", order) for i in range(2)]
+    threads += [_enqueue(q, f"paid{i}", "paid", order) for i in range(3)]
+
+    q.release(held)
+    for t in threads:
+        t.join(timeout=5)
+
+    # výchozí váhy paid 3 : img 2 : free 1 – anonymní /img/ nepředběhne platící
+    assert [c.rstrip("0123456789") for c in order] == [
+        "paid", "paid", "paid", "img:cdn", "img:cdn", "free", "img:cdn", "free"]
+
+
+def test_rejects_immediately_with_retry_after():
+    q = AdmissionQueue(1, max_depth=2, free_depth=1, per_client=1, initial_estimate=4.0)
+    held = q.acquire("a", "free")
+    order = []
+    t = _enqueue(q, "b", "free", order)
+
+    with pytest.raises(Rejected) as exc:
+        q.acquire("b", "free")
+    assert exc.value.status == 429 and exc.value.code == "client_queue_full"
+
+    with pytest.raises(Rejected) as exc:
+        q.acquire("c", "free")  # free pruh je plný, placený ne
+    assert exc.value.status == 503 and exc.value.retry_after == 8
+
+    q.release(held)
+    t.join(timeout=5)
+    assert order == ["b"]
+
+
+def test_estimate_follows_recent_conversions():
+    q = AdmissionQueue(2, initial_estimate=1.0, alpha=0.5)
+    ticket = q.acquire("a")
+    ticket.started -= 3.0  # konverze trvala 3 s
+    q.release(ticket)
+    assert q.avg_seconds == pytest.approx(2.0, abs=0.05)
+    assert q.retry_after(ahead=2) == 4
+
+
+def test_long_estimated_wait_is_shed_up_front():
+    q = AdmissionQueue(1, max_depth=10, max_wait=5, initial_estimate=10.0)
+    held = q.acquire("a")
+    t0 = time.monotonic()
+    with pytest.raises(Rejected) as exc:
+        q.acquire("b")
+    assert time.monotonic() - t0 < 0.5
+    assert exc.value.retry_after == 10
+    q.release(held)
+
+
+def test_wait_estimate_uses_per_request_costs():
+    q = AdmissionQueue(1, max_depth=10, free_depth=10, per_client=5, max_wait=20, initial_estimate=2.0)
+    assert q.wait_seconds() == 0.0
+    held = q.acquire("a")
+    assert q.wait_seconds() == 2.0  # jedna běžící konverze
+    order = []
+    threads = [_enqueue(q, "b", "free", order, cost=8.0) for _ in range(2)]
+    assert q.wait_seconds() == pytest.approx(18.0)
+    assert q.retry_after() == 18
+
+    threads.append(_enqueue(q, "c", "free", order, cost=3.0))  # čekal by 18 s ≤ max_wait
+    with pytest.raises(Rejected) as exc:
+        q.acquire("d", "free")  # 8 + 8 + 3 + běžící 2 = 21 s > max_wait → rovnou pryč
+    assert exc.value.code == "queue_full"
+
+    q.release(held)
+    for t in threads:
+        t.join(timeout=5)
+    assert order == ["b", "c", "b"]
+    assert q.wait_seconds() == 0.0 and q._queued_seconds == 0.0
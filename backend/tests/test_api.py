@@ -1,4 +1,8 @@
+import hashlib
+import hmac
 import io
+import json
+from datetime import datetime, timezone
 
 from PIL import Image
 
@@ -49,3 +53,274 @@ def test_convert_success(client):
     res = client.post("/api/convert", data=data, content_type="multipart/form-data")
     assert res.status_code == 200
     assert res.mimetype == "image/webp"
+    assert res.headers["X-Webp-Mode"] == "lossless"
+
+
+def test_convert_metadata_policy(client):
+    headers = {"X-Real-IP": "10.0.0.36"}
+    res = client.post(
+        "/api/convert",
+        data={"image": (_make_png_bytes(), "sample.png"), "metadata": "bogus"},
+        content_type="multipart/form-data",
+        headers=headers,
+    )
+    assert res.status_code == 400
+
+    res = client.post(
+        "/api/convert",
+        data={"image": (_make_png_bytes(), "sample.png"), "metadata": "strip"},
+        content_type="multipart/form-data",
+        headers=headers,
+    )
+    assert res.status_code == 200
+    assert res.headers["X-Webp-Metadata"] == "strip"
+
+
+def test_convert_sheds_load_with_retry_after(client, app_module, monkeypatch):
+    from admission import AdmissionQueue
+
+    queue = AdmissionQueue(1, max_depth=0, initial_estimate=3.0)
+    monkeypatch.setattr(app_module, "conversion_queue", queue)
+    held = queue.acquire("someone-else", "paid")
+    try:
+        res = client.post(
+            "/api/convert",
+            data={"image": (_make_png_bytes(), "sample.png")},
+            content_type="multipart/form-data",
+            headers={"X-Real-IP": "10.0.0.40"},
+        )
+    finally:
+        queue.release(held)
+
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "3"
+    assert res.get_json()["code"] == "queue_full"
+
+
+def test_preflight_skips_upload_for_known_content(client, app_module):
+    import hashlib
+
+    res = client.post("/api/register", json={"email": "preflight@example.com", "password": "pass1234"})
+    token = res.get_json()["token"]
+    with app_module.app.app_context():
+        user = app_module.User.query.filter_by(email="preflight@example.com").first()
+        user.is_vip = True  # bez limitu free konverzí
+        app_module.db.session.commit()
+    auth = {"Authorization": f"Bearer {token}"}
+
+    raw = _make_png_bytes().getvalue()
+    ask = {"sha256": hashlib.sha256(raw).hexdigest(), "size": len(raw), "filename": "pic.png", "quality": 80}
+
+    res = client.post("/api/convert/preflight", json=ask, headers=auth)
+    assert res.status_code == 204  # server soubor nezná → normální upload
+
+    res = client.post(
+        "/api/convert",
+        data={"image": (io.BytesIO(raw), "pic.png"), "quality": "80"},
+        content_type="multipart/form-data",
+        headers=auth,
+    )
+    assert res.status_code == 200 and res.headers["X-Webp-Cache"] == "miss"
+    converted = res.data
+
+    res = client.post("/api/convert/preflight", json=ask, headers=auth)
+    assert res.status_code == 200
+    assert res.headers["X-Webp-Cache"] == "hit" and res.data == converted
+
+    # jiné parametry: konverze z uloženého originálu, pořád bez uploadu
+    res = client.post("/api/convert/preflight", json={**ask, "quality": 50, "token": True}, headers=auth)
+    assert res.status_code == 200
+    res = client.get(res.get_json()["download"])
+    assert res.status_code == 200 and res.mimetype == "image/webp"
+    assert res.headers["X-Webp-Mode"] == "lossless"  # .orig bez přípony – režim podle obsahu PNG
+
+    # cizí klient stejný hash nezná
+    res = client.post("/api/convert/preflight", json=ask, headers={"X-Real-IP": "10.0.0.41"})
+    assert res.status_code == 204
+
+    # podvržený X-Forwarded-For anonyma nepřevlékne za jiného klienta
+    anon = {"X-Real-IP": "10.0.0.45"}
+    res = client.post("/api/convert", data={"image": (io.BytesIO(raw), "pic.png"), "quality": "80"},
+                      content_type="multipart/form-data", headers=anon)
+    assert res.status_code == 200
+    res = client.post("/api/convert/preflight", json=ask, headers=anon)
+    assert res.status_code == 200
+    spoofed = {"X-Real-IP": "10.0.0.46", "X-Forwarded-For": "10.0.0.45"}
+    assert client.post("/api/convert/preflight", json=ask, headers=spoofed).status_code == 204
+
+    res = client.post("/api/convert/preflight", json={"sha256": "nope", "size": 1}, headers=auth)
+    assert res.status_code == 400
+
+
+def test_convert_from_chunked_upload(client):
+    import hashlib
+
+    headers = {"X-Real-IP": "10.0.0.42"}
+    raw = _make_png_bytes().getvalue()
+    res = client.post("/api/uploads", json={"filename": "chunked.png", "size": len(raw),
+                                            "sha256": hashlib.sha256(raw).hexdigest()}, headers=headers)
+    assert res.status_code == 201
+    upload = res.get_json()
+    assert upload["chunks"] == 1
+
+    res = client.put(f"/api/uploads/{upload['upload_id']}/chunks/0", data=raw,
+                     headers={**headers, "X-Chunk-Sha256": hashlib.sha256(raw).hexdigest()})
+    assert res.status_code == 200
+    res = client.post(f"/api/uploads/{upload['upload_id']}/commit", headers=headers)
+    assert res.status_code == 200
+
+    # jiný klient upload nevidí
+    res = client.post("/api/convert", data={"upload_id": upload["upload_id"]},
+                      headers={"X-Real-IP": "10.0.0.43"})
+    assert res.status_code == 404
+
+    res = client.post("/api/convert", data={"upload_id": upload["upload_id"]}, headers=headers)
+    assert res.status_code == 200
+    assert res.mimetype == "image/webp"
+    assert "chunked.webp" in res.headers["Content-Disposition"]
+    assert res.headers["X-Webp-Mode"] == "lossless"  # PNG podle obsahu, i když data/ nemá příponu
+
+    # po úspěšné konverzi se session smaže
+    assert client.get(f"/api/uploads/{upload['upload_id']}", headers=headers).status_code == 404
+
+
+def test_upload_create_checks_free_limit(client):
+    headers = {"X-Real-IP": "10.0.0.44"}
+    for _ in range(2):  # FREE_LIMIT=2
+        res = client.post("/api/convert", data={"image": (_make_png_bytes(), "q.png")},
+                          content_type="multipart/form-data", headers=headers)
+        assert res.status_code == 200
+    res = client.post("/api/uploads", json={"filename": "q.png", "size": 100}, headers=headers)
+    assert res.status_code == 402
+
+
+def _bmc(client, payload):
+    raw = json.dumps(payload).encode()
+    sig = hmac.new(b"test-bmc-secret", raw, hashlib.sha256).hexdigest()
+    return client.post("/api/webhooks/bmc", data=raw, content_type="application/json",
+                       headers={"X-Signature-Sha256": sig})
+
+
+def test_webhook_acks_then_applies_each_event_once(client, app_module, monkeypatch):
+    kicks = []
+    monkeypatch.setattr(app_module.webhook_applier, "kick", lambda: kicks.append(1))  # bez vlákna, drain níže
+
+    event = {"event_id": 9001, "type": "membership.started", "data": {"supporter_email": "Fan@Example.com"}}
+    res = _bmc(client, event)
+    assert res.status_code == 202
+    assert res.get_json() == {"ok": True, "event_id": "bmc:9001", "queued": True}
+
+    # opakované doručení: potvrdí se, ale podruhé se neuloží
+    res = _bmc(client, event)
+    assert res.status_code == 200 and res.get_json()["duplicate"] is True
+    assert _bmc(client, {**event, "event_id": 9002, "type": "membership.renewed"}).status_code == 202
+    assert _bmc(client, {**event, "event_id": 9003, "type": "membership.cancelled"}).status_code == 202
+    assert len(kicks) == 3
+
+    with app_module.app.app_context():
+        assert app_module.User.query.filter_by(email="fan@example.com").first() is None  # nic v requestu
+
+    assert app_module.webhook_applier.drain() == 3
+    assert app_module.apply_webhook_events() == 0
+
+    with app_module.app.app_context():
+        user = app_module.User.query.filter_by(email="fan@example.com").one()
+        assert user.plan == "monthly"
+        days = (user.plan_expires_at.replace(tzinfo=None) - datetime.now(timezone.utc).replace(tzinfo=None)).days
+        assert 59 <= days <= 60  # started + renewed, ne víc
+        statuses = {e.id: e.status for e in app_module.WebhookEvent.query}
+        assert statuses == {"bmc:9001": "applied", "bmc:9002": "applied", "bmc:9003": "ignored"}
+
+    # placeholder účet nemá použitelné heslo
+    res = client.post("/api/login", json={"email": "fan@example.com", "password": "!"})
+    assert res.status_code == 401
+
+
+def test_webhook_rejects_bad_signature(client):
+    raw = json.dumps({"event_id": 1, "type": "membership.started", "data": {"supporter_email": "x@example.com"}})
+    res = client.post("/api/webhooks/bmc", data=raw, content_type="application/json",
+                      headers={"X-Signature-Sha256": "00" * 32})
+    assert res.status_code == 401
+
+
+def test_img_origin_serves_snapped_cached_renditions(client, app_module):
+    src = app_module.renditions.originals / "catalog" / "photo.png"
+    src.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (1000, 500), color=(0, 128, 255)).save(src)
+
+    res = client.get("/img/catalog/photo.png?w=790&q=70&fmt=webp")
+    assert res.status_code == 200
+    assert res.mimetype == "image/webp"
+    assert res.headers["X-Webp-Cache"] == "miss"
+    assert res.headers["X-Webp-Rendition"] == "w=800,q=72"
+    assert res.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    etag = res.headers["ETag"]
+    assert etag.startswith('"')  # silný ETag
+    assert Image.open(io.BytesIO(res.data)).size == (800, 400)
+
+    # jiné URL přichycené na tutéž rendici = stejný soubor z cache
+    res = client.get("/img/catalog/photo.png?w=800&q=73")
+    assert res.headers["X-Webp-Cache"] == "hit" and res.headers["ETag"] == etag
+
+    res = client.get("/img/catalog/photo.png?w=800&q=72", headers={"If-None-Match": etag})
+    assert res.status_code == 304 and not res.data
+
+    assert client.get("/img/catalog/photo.png?fmt=avif").status_code == 400
+    assert client.get("/img/catalog/missing.png").status_code == 404
+    assert client.get("/img/../app.py").status_code == 404
+
+
+def test_estimate_reports_bounds_and_queue(client, app_module, monkeypatch):
+    img = io.BytesIO()
+    Image.new("RGB", (640, 480), color=(10, 200, 30)).save(img, format="JPEG")
+    img.seek(0)
+    res = client.post("/api/estimate", data={"image": (img, "shot.jpg"), "max_width": "320"},
+                      content_type="multipart/form-data", headers={"X-Real-IP": "10.0.0.51"})
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["input"] == {"width": 640, "height": 480, "format": "JPEG", "frames": 1}
+    assert body["output"] == {"width": 320, "height": 240, "mode": "lossy"}
+    assert body["bytes"]["low"] <= body["bytes"]["estimate"] <= body["bytes"]["high"]
+    assert body["seconds"]["low"] <= body["seconds"]["estimate"] <= body["seconds"]["high"]
+    assert body["confidence"] == 0.9 and body["queue"]["waiting"] == 0
+
+    assert client.post("/api/estimate").status_code == 400
+    bad = {"image": (io.BytesIO(b"not an image"), "x.png")}
+    assert client.post("/api/estimate", data=bad, content_type="multipart/form-data").status_code == 400
+
+
+def test_conversions_feed_estimate_history(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "ESTIMATE_RECORD_RATE", 1.0)
+    history = app_module.cost_model.history
+    before = len(history.read_text().splitlines()) if history.exists() else 0
+    res = client.post("/api/convert", data={"image": (_make_png_bytes(), "h.png")},
+                      content_type="multipart/form-data", headers={"X-Real-IP": "10.0.0.50"})
+    assert res.status_code == 200
+    rows = history.read_text().splitlines()
+    assert len(rows) == before + 1
+    row = json.loads(rows[-1])
+    assert row["bytes"] == len(res.data) and row["seconds"] > 0 and row["sample_bytes"] > 0
+    assert (row["width"], row["out_width"], row["mode"]) == (8, 8, "lossless")
+
+
+def test_estimate_shares_queue_and_free_limit(client, app_module, monkeypatch):
+    from admission import AdmissionQueue
+
+    headers = {"X-Real-IP": "10.0.0.52"}
+    queue = AdmissionQueue(1, max_depth=0, initial_estimate=3.0)
+    monkeypatch.setattr(app_module, "conversion_queue", queue)
+    held = queue.acquire("someone-else", "paid")
+    try:
+        res = client.post("/api/estimate", data={"image": (_make_png_bytes(), "e.png")},
+                          content_type="multipart/form-data", headers=headers)
+    finally:
+        queue.release(held)
+    assert res.status_code == 503 and res.get_json()["code"] == "queue_full"
+
+    for _ in range(2):  # FREE_LIMIT=2
+        res = client.post("/api/convert", data={"image": (_make_png_bytes(), "e.png")},
+                          content_type="multipart/form-data", headers=headers)
+        assert res.status_code == 200
+    res = client.post("/api/estimate", data={"image": (_make_png_bytes(), "e.png")},
+                      content_type="multipart/form-data", headers=headers)
+    assert res.status_code == 402
@@ -0,0 +1,53 @@
+import math
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from bench_quality import pareto, psnr, run, ssim, svg_plot
+
+
+def test_metrics_match_reference_values():
+    rnd = np.random.default_rng(0)
+    a = rnd.uniform(0, 255, (64, 48))
+
+    assert ssim(a, a) == pytest.approx(1.0)
+    assert psnr(a, a) == math.inf
+    assert psnr(a, a + 1) == pytest.approx(20 * math.log10(255))  # MSE = 1
+
+    noisy = np.clip(a + rnd.normal(0, 10, a.shape), 0, 255)
+    worse = np.clip(a + rnd.normal(0, 40, a.shape), 0, 255)
+    assert 0 < ssim(a, worse) < ssim(a, noisy) < 1
+
+    # posun jasu: SSIM skoro nezmění, PSNR ano
+    flat = np.full((32, 32), 100.0)
+    assert ssim(flat, flat + 5) == pytest.approx(
+        ((2 * 100 * 105 + 6.5025) / (100 ** 2 + 105 ** 2 + 6.5025)), rel=1e-9)
+
+
+def test_pareto_drops_dominated_settings():
+    pts = [
+        {"setting": "a", "bpp": 0.5, "ssim": 0.95},
+        {"setting": "b", "bpp": 0.6, "ssim": 0.94},  # větší i horší
+        {"setting": "c", "bpp": 1.0, "ssim": 0.99},
+        {"setting": "d", "bpp": 0.2, "ssim": 0.90},
+    ]
+    assert [p["setting"] for p in pareto(pts)] == ["d", "a", "c"]
+
+
+def test_run_reports_classes_and_plots():
+    gradient = Image.linear_gradient("L").resize((96, 64)).convert("RGB")
+    icon = Image.new("RGBA", (32, 32), (0, 0, 0, 0))
+    icon.paste((200, 30, 30, 255), (8, 8, 24, 24))
+    report = run([("photo", "g", gradient), ("graphic", "i", icon)], [(50, 4, False), (90, 4, True)])
+
+    assert set(report["versions"]) == {"pillow", "libwebp", "numpy", "python"}
+    assert report["grid"] == ["q50 m4", "lossless m4"]
+    lossless = [r for r in report["images"] if r["lossless"]]
+    assert all(r["ssim"] == 1.0 and r["psnr"] is None for r in lossless)  # beze ztráty
+    graphic = report["classes"]["graphic"]
+    assert "lossless m4" in graphic["frontier"]
+
+    svg = svg_plot("graphic", graphic["points"], [p for p in graphic["points"] if p["setting"] in graphic["frontier"]])
+    assert ET.fromstring(svg).tag.endswith("svg")
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from chunked_upload import MIN_CHUNK, UploadError, UploadStore
+
+
+def _store(tmp_path, **kw):
+    return UploadStore(tmp_path / "uploads", max_size=10 * MIN_CHUNK, **kw)
+
+
+def test_parallel_chunks_land_in_place_without_assembly(tmp_path):
+    store = _store(tmp_path)
+    data = os.urandom(2 * MIN_CHUNK + 1000)
+    meta = store.create("u1", "big.png", len(data), chunk_size=MIN_CHUNK, sha256=hashlib.sha256(data).hexdigest())
+    assert meta["chunks"] == 3
+
+    # pořadí nehraje roli, opakovaný PUT téže části je neškodný
+    for index in (2, 0, 0):
+        chunk = data[index * MIN_CHUNK:(index + 1) * MIN_CHUNK]
+        store.put_chunk(meta["id"], "u1", index, chunk, sha256=hashlib.sha256(chunk).hexdigest())
+    status = store.status(meta["id"], "u1")
+    assert status["missing"] == [1] and not status["committed"]
+    with pytest.raises(UploadError) as exc:
+        store.commit(meta["id"], "u1")
+    assert exc.value.status == 409
+
+    store.put_chunk(meta["id"], "u1", 1, data[MIN_CHUNK:2 * MIN_CHUNK])
+    done = store.commit(meta["id"], "u1")
+
+    path, result = store.committed_file(meta["id"], "u1")
+    assert path.read_bytes() == data
+    assert result["sha256"] == done["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_rejects_bad_chunks_and_foreign_owner(tmp_path):
+    store = _store(tmp_path)
+    meta = store.create("u1", "a.png", MIN_CHUNK, chunk_size=MIN_CHUNK)
+
+    with pytest.raises(UploadError) as exc:
+        store.put_chunk(meta["id"], "u1", 0, b"x" * MIN_CHUNK, sha256="0" * 64)
+    assert exc.value.status == 400
+    with pytest.raises(UploadError) as exc:
+        store.put_chunk(meta["id"], "u1", 0, b"short")
+    assert exc.value.status == 400
+    with pytest.raises(UploadError) as exc:
+        store.status(meta["id"], "u2")
+    assert exc.value.status == 404
+    with pytest.raises(UploadError):
+        store.create("u1", "huge.png", 11 * MIN_CHUNK)
+
+
+def test_abandoned_sessions_expire(tmp_path):
+    store = _store(tmp_path, ttl=60)
+    old = store.create("u1", "old.png", 10)
+    fresh = store.create("u1", "new.png", 10)
+    past = time.time() - 120
+    os.utime(store.root / old["id"], (past, past))
+
+    assert store.expire() == 1
+    assert not (store.root / old["id"]).exists()
+    assert (store.root / fresh["id"]).exists()
+
+
+def test_owner_limits_and_expiry_between_creates(tmp_path):
+    store = _store(tmp_path, ttl=60, sweep_interval=0, max_sessions=2, max_owner_bytes=3 * MIN_CHUNK)
+    first = store.create("u1", "a.png", 2 * MIN_CHUNK)
+    with pytest.raises(UploadError) as exc:
+        store.create("u1", "b.png", 2 * MIN_CHUNK)  # přes rezervované bajty
+    assert exc.value.status == 429
+    store.create("u1", "b.png", MIN_CHUNK)
+    with pytest.raises(UploadError) as exc:
+        store.create("u1", "c.png", 10)  # přes počet sessions
+    assert exc.value.status == 429
+    store.create("u2", "c.png", 3 * MIN_CHUNK)  # jiný vlastník má vlastní limity
+
+    store.delete(first["id"], "u1")
+    other = store.create("u1", "c.png", 10)
+
+    # expirace běží i bez dalšího create
+    past = time.time() - 120
+    os.utime(store.root / other["id"], (past, past))
+    with pytest.raises(UploadError):
+        store.put_chunk(other["id"], "u1", 0, b"x" * 10)
+    assert not (store.root / other["id"]).exists()
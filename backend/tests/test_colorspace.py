@@ -0,0 +1,63 @@
+from PIL import Image, ImageCms
+
+import corpus
+from colorspace import TransformCache, to_srgb
+from convert import convert_to_webp
+
+
+def _tagged(mode="RGB", icc=None):
+    im = Image.new(mode, (16, 16), (200, 100, 50, 77)[: len(mode)])
+    im.info["icc_profile"] = icc if icc is not None else corpus.icc_profile()
+    return im
+
+
+def test_wide_gamut_is_converted_and_transform_reused():
+    cache = TransformCache(maxsize=4)
+
+    out, status = to_srgb(_tagged(), cache)
+    assert status == "converted"
+    assert out.getpixel((0, 0)) != (200, 100, 50)
+    assert "icc_profile" not in out.info
+
+    out, status = to_srgb(_tagged("RGBA"), cache)
+    assert status == "converted" and out.mode == "RGBA"
+    assert out.getpixel((0, 0))[3] == 77
+
+    to_srgb(_tagged(), cache)
+    assert (cache.misses, cache.hits) == (2, 1)  # RGB a RGBA = dvě transformace
+
+
+def test_srgb_untagged_and_unsupported_are_left_alone():
+    cache = TransformCache()
+    srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    im = _tagged(icc=srgb)
+    assert to_srgb(im, cache) == (im, "srgb")
+
+    plain = Image.new("RGB", (4, 4))
+    assert to_srgb(plain, cache) == (plain, "untagged")
+
+    gray = _tagged("L")
+    assert to_srgb(gray, cache) == (gray, "unsupported")
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TransformCache(maxsize=1)
+    p3 = corpus.icc_profile()
+    adobe = corpus.icc_profile(corpus.ADOBE_RGB, 2.2, "Adobe RGB (test)")
+    to_srgb(_tagged(icc=p3), cache)
+    to_srgb(_tagged(icc=adobe), cache)
+    to_srgb(_tagged(icc=p3), cache)
+    assert cache.misses == 3 and cache.hits == 0
+
+
+def test_convert_to_webp_srgb_option(tmp_path):
+    src = tmp_path / "p3.jpg"
+    Image.new("RGB", (32, 32), (200, 100, 50)).save(src, icc_profile=corpus.icc_profile())
+    out = tmp_path / "p3.webp"
+    info = {}
+
+    ok, err = convert_to_webp(src, out, colorspace="srgb", info=info)
+
+    assert ok, err
+    assert info["color"] == "converted"
+    assert "icc_profile" not in Image.open(out).info
@@ -0,0 +1,231 @@
+import io
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageCms, ImageDraw
+
+from convert import convert_to_webp, encode_animated, exif_orientation
+
+
+def _frames(n, size=(64, 48), step=4):
+    out = []
+    for i in range(n):
+        im = Image.new("RGB", size, (255, 255, 255))
+        x = i * step
+        im.paste((255, 0, 0), (x, 10, x + 8, 20))
+        out.append(im)
+    return out
+
+
+class _FakeAnim:
+    """Animace z hotových snímků – GIF/WebP writer v Pillow duplicity slije sám."""
+
+    def __init__(self, frames, durations):
+        self._frames = frames
+        self._durations = durations
+        self.n_frames = len(frames)
+        self.is_animated = True
+        self.size = frames[0].size
+        self.info = {"loop": 0}
+        self._cur = frames[0]
+
+    def seek(self, idx):
+        self._cur = self._frames[idx]
+        self.info = {"loop": 0, "duration": self._durations[idx]}
+
+    def convert(self, mode):
+        return self._cur.convert(mode)
+
+
+def _durations(data):
+    im = Image.open(io.BytesIO(data))
+    out = []
+    for i in range(im.n_frames):
+        im.seek(i)
+        im.load()
+        out.append(im.info["duration"])
+    return im, out
+
+
+def test_animated_gif_stays_animated(tmp_path):
+    src = tmp_path / "anim.gif"
+    frames = _frames(6)
+    frames[0].save(src, save_all=True, append_images=frames[1:], duration=[40, 60, 40, 60, 40, 60], loop=0)
+    out = tmp_path / "anim.webp"
+
+    ok, err = convert_to_webp(src, out, max_width=32)
+
+    assert ok, err
+    im, durations = _durations(out.read_bytes())
+    assert im.size == (32, 24)
+    assert durations == [40, 60, 40, 60, 40, 60]
+
+
+def test_mpo_converts_as_still_photo(tmp_path):
+    # JPEG z fotoaparátu s MPF náhledem: Pillow hlásí MPO se 2 snímky
+    src = tmp_path / "camera.mpo"
+    photo, preview = _frames(2, size=(320, 240))
+    photo.save(src, "MPO", save_all=True, append_images=[preview.resize((160, 120))])
+    with Image.open(src) as im:
+        assert im.format == "MPO" and im.n_frames == 2
+    out = tmp_path / "camera.webp"
+    info = {}
+
+    ok, err = convert_to_webp(src, out, info=info)
+
+    assert ok, err
+    assert "animation" not in info and info["mode"] == "lossy"
+    with Image.open(out) as im:
+        assert not getattr(im, "is_animated", False) and im.size == (320, 240)
+
+
+def test_encode_animated_merges_duplicates_and_limits_fps():
+    f = _frames(3)
+    seq = [f[0], f[0], f[0], f[1], f[1], f[2]]
+    bio = io.BytesIO()
+
+    stats = encode_animated(_FakeAnim(seq, [50] * 6), bio, lossless=True)
+
+    assert stats["frames_in"] == 6
+    assert stats["frames_out"] == 3
+    assert stats["merged"] == 3
+    _im, durations = _durations(bio.getvalue())
+    assert durations == [150, 100, 50]
+
+    bio = io.BytesIO()
+    stats = encode_animated(_FakeAnim(_frames(10), [20] * 10), bio, max_fps=10)
+    assert stats["frames_out"] == 2
+    assert stats["dropped"] == 8
+    _im, durations = _durations(bio.getvalue())
+    assert sum(durations) == 200
+
+
+def _png(kind):
+    if kind == "icon":
+        im = Image.new("RGBA", (300, 300), (0, 0, 0, 0))
+        ImageDraw.Draw(im).ellipse((20, 20, 280, 280), fill=(30, 120, 200, 255))
+    elif kind == "screenshot":
+        im = Image.new("RGB", (600, 400), (250, 250, 250))
+        draw = ImageDraw.Draw(im)
+        draw.rectangle((0, 0, 120, 400), fill=(40, 60, 90))
+        for i, y in enumerate(range(20, 380, 30)):
+            draw.text((140, y), "lorem ipsum dolor sit amet " * 3, fill=(20 * i, 80, 200 - 15 * i))
+        im = im.resize((300, 200), Image.Resampling.LANCZOS)
+    elif kind == "mixed":
+        # UI s fotkou a přechodem: plochy převažují, ale paleta by přechod posterizovala
+        im = _png("screenshot").resize((600, 400))
+        x = np.linspace(0, 255, 240)[None, :].repeat(160, 0)
+        y = np.linspace(0, 255, 160)[:, None].repeat(240, 1)
+        im.paste(Image.fromarray(np.stack([x, y, 255 - x], axis=2).astype(np.uint8)), (320, 200))
+    else:
+        im = Image.effect_noise((300, 300), 40).convert("RGB")
+        im = Image.merge("RGB", (im.getchannel(0), Image.linear_gradient("L").resize((300, 300)), im.getchannel(2)))
+    return im
+
+
+@pytest.mark.parametrize("kind, mode", [
+    ("icon", "lossless"),
+    ("screenshot", "near-lossless"),
+    ("mixed", "lossless"),
+    ("photo", "lossy"),
+])
+def test_png_mode_follows_content(tmp_path, kind, mode):
+    src = tmp_path / f"{kind}.png"
+    _png(kind).save(src)
+    out = tmp_path / f"{kind}.webp"
+    info = {}
+
+    ok, err = convert_to_webp(src, out, info=info)
+
+    assert ok, err
+    assert info["mode"] == mode
+    assert set(info["analysis"]) == {"colors", "flat_ratio", "smooth_ratio", "edge_density", "alpha", "palette_psnr"}
+    assert Image.open(out).size == Image.open(src).size
+
+
+def _jpeg_with_meta(path):
+    im = Image.new("RGB", (40, 20), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = 6            # Orientation: otočit o 90° doprava
+    exif[0x010F] = "Camera Co"  # Make
+    exif[0x8298] = "(c) Someone"
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    im.save(path, exif=exif, icc_profile=icc)
+    return icc
+
+
+@pytest.mark.parametrize("policy", ["keep", "minimal", "strip"])
+def test_metadata_policy(tmp_path, policy):
+    src = tmp_path / "meta.jpg"
+    icc = _jpeg_with_meta(src)
+    out = tmp_path / "meta.webp"
+    info = {}
+
+    ok, err = convert_to_webp(src, out, metadata=policy, info=info)
+
+    assert ok, err
+    assert info["metadata"] == policy
+    res = Image.open(out)
+    assert res.size == (20, 40)  # orientace se aplikuje ve všech režimech
+    exif = res.getexif()
+    assert 0x0112 not in exif
+    if policy == "strip":
+        assert not exif and "icc_profile" not in res.info
+    else:
+        assert res.info["icc_profile"] == icc
+        assert exif[0x8298] == "(c) Someone"
+        assert (0x010F in exif) == (policy == "keep")
+
+
+def test_exif_orientation_reads_both_byte_orders():
+    exif = Image.Exif()
+    exif[0x010F] = "x"
+    exif[0x0112] = 8
+    assert exif_orientation(exif.tobytes()) == 8  # Pillow: "Exif\0\0" + little-endian
+
+    # big-endian IFD0 s jediným záznamem Orientation = 3
+    raw = b"MM\x00\x2a\x00\x00\x00\x08\x00\x01" + b"\x01\x12\x00\x03\x00\x00\x00\x01\x00\x03\x00\x00"
+    assert exif_orientation(raw) == 3
+
+    assert exif_orientation(None) == 1
+    assert exif_orientation(b"garbage") == 1
+
+
+_PEAK_SCRIPT = """
+import sys
+from pathlib import Path
+sys.path.insert(0, sys.argv[1])
+from convert import convert_to_webp
+
+def hwm():
+    with open("/proc/self/status") as fh:
+        return next(int(l.split()[1]) * 1024 for l in fh if l.startswith("VmHWM:"))
+
+base = hwm()
+ok, err = convert_to_webp(Path(sys.argv[2]), Path(sys.argv[3]), max_width=int(sys.argv[4]))
+assert ok, err
+print(hwm() - base)
+"""
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="VmHWM jen na Linuxu")
+def test_large_jpeg_peak_memory_stays_below_full_decode(tmp_path):
+    # tracemalloc alokace v C části Pillow nevidí → špička RSS v podprocesu
+    src = tmp_path / "large.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.linear_gradient("L").resize((6000, 4000)).convert("RGB").save(src, quality=80, exif=exif)
+    out = tmp_path / "large.webp"
+
+    proc = subprocess.run(
+        [sys.executable, "-c", _PEAK_SCRIPT, str(Path(__file__).resolve().parents[1]), str(src), str(out), "800"],
+        capture_output=True, text=True, check=True,
+    )
+
+    decoded = 6000 * 4000 * 3
+    assert int(proc.stdout.strip().splitlines()[-1]) < decoded / 3
+    assert Image.open(out).size == (800, 1200)
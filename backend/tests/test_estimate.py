@@ -0,0 +1,83 @@
+import json
+import math
+import random
+
+import pytest
+from PIL import Image
+
+from convert import convert_to_webp, sample_encode
+from estimate import MIN_FIT, CostModel, fit
+
+
+def _record(rng, out_px, sample_bpp, sample_spp, noise=0.1):
+    """Záznam historie podle známého modelu: bytes ~ out_px^0.7, čas lineárně s pixely."""
+    sample_px = 256 * 192
+    side = int(math.sqrt(out_px))
+    bytes_ = sample_bpp * sample_px * math.exp(-0.5 + 0.7 * math.log(out_px / sample_px) + rng.gauss(0, noise))
+    seconds = (0.05 + 2e-8 * out_px + 0.5 * sample_spp * out_px) * math.exp(rng.gauss(0, noise))
+    return {
+        "width": side, "height": side, "frames": 1, "out_width": side, "out_height": side, "mode": "lossy",
+        "sample_pixels": sample_px, "sample_bytes": int(sample_bpp * sample_px),
+        "sample_seconds": sample_spp * sample_px, "meta_bytes": 0, "alpha_full": False,
+        "seconds": seconds, "bytes": int(bytes_),
+    }
+
+
+def _history(rng, n):
+    return [_record(rng, rng.uniform(0.2e6, 12e6), rng.uniform(0.2, 1.5), rng.uniform(2e-7, 1e-6))
+            for _ in range(n)]
+
+
+def test_fit_recovers_model_and_bounds_cover_holdout():
+    rng = random.Random(7)
+    model = fit(_history(rng, 300))
+    assert model.basis == "history" and model.samples == 300
+    assert model.bytes[1] == pytest.approx(0.7, abs=0.05)
+    assert model.seconds[2] == pytest.approx(0.5, rel=0.1)
+
+    cm = CostModel()
+    cm._fit = model
+    holdout = _history(rng, 200)
+    inside = 0
+    for r in holdout:
+        est = cm.estimate(r)
+        inside += est.bytes_low <= r["bytes"] <= est.bytes_high and est.seconds_low <= r["seconds"] <= est.seconds_high
+    assert inside / len(holdout) > 0.75  # 90% meze pro každou veličinu zvlášť
+
+
+def test_history_file_drives_fit_and_is_trimmed(tmp_path):
+    rng = random.Random(1)
+    path = tmp_path / "history.ndjson"
+    cm = CostModel(path, max_records=MIN_FIT)
+    assert cm.current().basis == "prior"
+
+    rows = _history(rng, MIN_FIT * 20)
+    for r in rows:
+        cm.record(r, r["seconds"], r["bytes"])
+    assert cm.current().basis == "history"
+    lines = path.read_text().splitlines()
+    assert MIN_FIT <= len(lines) < len(rows) // 4  # přepisuje se na posledních max_records
+    assert json.loads(lines[-1])["bytes"] == rows[-1]["bytes"]
+
+    path.write_text(path.read_text() + '{"broken": ')  # useknutý řádek po pádu workeru
+    assert cm.current().basis == "history"
+
+
+def test_prior_estimate_brackets_real_conversion(tmp_path):
+    src = tmp_path / "gradient.jpg"
+    im = Image.linear_gradient("L").resize((1200, 900)).convert("RGB")
+    im.save(src, quality=90)
+
+    features = sample_encode(src, quality=72, max_width=800)
+    assert (features["out_width"], features["out_height"]) == (800, 600)
+    assert features["sample_pixels"] <= 256 * 256 and features["mode"] == "lossy"
+
+    cm = CostModel()
+    est = cm.estimate(features)
+    assert est.basis == "prior"
+    ok, _err = convert_to_webp(src, tmp_path / "out.webp", quality=72, max_width=800)
+    assert ok
+    actual = (tmp_path / "out.webp").stat().st_size
+    assert est.bytes_low <= actual <= est.bytes_high
+    assert 0 < est.seconds_low < est.seconds < est.seconds_high
+    assert cm.quick_seconds(features) < cm.quick_seconds(dict(features, out_width=1200, out_height=900))
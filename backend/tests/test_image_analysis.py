@@ -0,0 +1,35 @@
+from PIL import Image, ImageDraw
+
+from image_analysis import alpha_usage, reduce_mode
+
+
+def _rgba(alpha):
+    im = Image.new("RGBA", (64, 64), (10, 120, 200, 255))
+    mask = Image.new("L", im.size, 0 if alpha != "opaque" else 255)
+    if alpha == "binary":
+        ImageDraw.Draw(mask).ellipse((8, 8, 56, 56), fill=255)
+    elif alpha == "partial":
+        mask = Image.linear_gradient("L").resize(im.size)
+    im.putalpha(mask)
+    return im
+
+
+def test_reduce_mode_drops_opaque_alpha():
+    im, info = reduce_mode(_rgba("opaque"))
+    assert im.mode == "RGB"
+    assert info == {"alpha": "opaque"}
+
+
+def test_reduce_mode_reports_binary_and_partial_alpha():
+    for kind in ("binary", "partial"):
+        im, info = reduce_mode(_rgba(kind))
+        assert im.mode == "RGBA"
+        assert info["alpha"] == kind
+        assert alpha_usage(im) == kind
+
+
+def test_reduce_mode_keeps_gray_rgb():
+    # WebP enkodér L stejně vrací do RGB – převod by jen stál čas
+    gray = Image.linear_gradient("L").resize((300, 200)).convert("RGB")
+    im, info = reduce_mode(gray)
+    assert im is gray and info == {"alpha": "none"}
@@ -0,0 +1,59 @@
+import io
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+from convert import convert_to_webp
+from image_io import is_heif, open_image
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def test_open_image_accepts_only_supported_formats(tmp_path):
+    src = tmp_path / "a.png"
+    Image.new("RGB", (8, 8), (1, 2, 3)).save(src)
+    with open_image(src) as im:
+        assert im.format == "PNG"
+
+    tga = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(tga, format="TGA")
+    tga.seek(0)
+    with pytest.raises(UnidentifiedImageError):
+        open_image(tga)
+
+
+def test_is_heif_sniffs_ftyp_brand():
+    assert is_heif(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00")
+    assert is_heif(b"\x00\x00\x00\x18ftypmif1\x00\x00\x00\x00")
+    assert not is_heif(b"\x00\x00\x00\x18ftypisom\x00\x00\x00\x00")  # MP4
+    assert not is_heif(b"\xff\xd8\xff\xe0")
+
+
+def test_heif_input_registers_plugin_on_demand(tmp_path):
+    pillow_heif = pytest.importorskip("pillow_heif")
+    src = tmp_path / "photo.heic"
+    pillow_heif.from_pillow(Image.new("RGB", (32, 16), (200, 10, 10))).save(src)
+    out = tmp_path / "photo.webp"
+
+    ok, err = convert_to_webp(src, out)
+
+    assert ok, err
+    assert Image.open(out).size == (32, 16)
+
+
+def test_app_import_is_lazy(tmp_path):
+    # čerstvý interpret – v pytest session už jsou moduly naimportované jinými testy
+    code = (
+        "import sys, json, app\n"
+        "print(json.dumps({m: m in sys.modules for m in ('convert', 'numpy', 'jwt', 'pillow_heif')}))"
+    )
+    env = {"DATABASE_URL": f"sqlite:///{tmp_path / 'app.db'}", "PYTHONPATH": str(BACKEND_DIR)}
+    proc = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+
+    assert proc.stdout.strip().splitlines()[-1] == (
+        '{"convert": false, "numpy": false, "jwt": false, "pillow_heif": false}'
+    )
@@ -0,0 +1,177 @@
+import threading
+import time
+from email.message import EmailMessage
+
+import pytest
+from sqlalchemy import event
+
+from imap_stub import ImapStub, Mailbox
+
+SENDER = "no-reply@buymeacoffee.com"
+
+
+@pytest.fixture()
+def worker(app_module, monkeypatch):
+    import imap_activate  # až po app_module – app musí vzniknout s testovacím prostředím
+
+    monkeypatch.setattr(imap_activate, "IMAP_SSL", False)
+    monkeypatch.setattr(imap_activate, "IMAP_HOST", "127.0.0.1")
+    monkeypatch.setattr(imap_activate, "IMAP_USER", "worker")
+    monkeypatch.setattr(imap_activate, "IMAP_PASS", "secret")
+    monkeypatch.setattr(imap_activate, "IMAP_ENABLED", True)
+    monkeypatch.setattr(imap_activate, "IMAP_MARK_SEEN", True)
+    monkeypatch.setattr(imap_activate, "IMAP_SENDER_WHITELIST", [SENDER])
+    monkeypatch.setattr(imap_activate, "PAYMENT_IGNORED_EMAILS", {SENDER})
+    with app_module.app.app_context():  # každý test má vlastní schránku od UID 1
+        app_module.ImapCheckpoint.query.delete()
+        app_module.ImapMessage.query.delete()
+        app_module.db.session.commit()
+    return imap_activate
+
+
+def payment_mail(buyer, html=False, attachment=0, sender=SENDER, message_id=None):
+    msg = EmailMessage()
+    msg["From"] = f"Buy Me a Coffee <{sender}>"
+    msg["Subject"] = "You have a new supporter!"
+    if message_id:
+        msg["Message-ID"] = message_id
+    if html:
+        msg.set_content(f"<p>New membership from <b>{buyer}</b></p>", subtype="html")
+    else:
+        msg.set_content(f"New membership from {buyer}\n")
+    if attachment:
+        msg.add_attachment(b"%PDF" + b"\0" * attachment, maintype="application", subtype="pdf",
+                           filename="receipt.pdf")
+    return msg.as_bytes()
+
+
+def plan_of(app_module, addr):
+    with app_module.app.app_context():
+        user = app_module.User.query.filter_by(email=addr).first()
+        return user.plan if user else None
+
+
+def test_scan_fetches_headers_then_text_parts_only(worker, app_module, monkeypatch):
+    box = Mailbox()
+    box.append(payment_mail("plain-buyer@example.com", attachment=2_000_000))
+    box.append(payment_mail("spam-buyer@example.com", sender="someone@example.org"))
+    box.append(payment_mail("html-buyer@example.com", html=True))
+
+    with ImapStub(box) as server:
+        monkeypatch.setattr(worker, "IMAP_PORT", server.port)
+        stats = worker.process_inbox()
+
+    assert stats == {"scanned": 3, "candidates": 2, "activated": 2}
+    assert plan_of(app_module, "plain-buyer@example.com") == "monthly"
+    assert plan_of(app_module, "html-buyer@example.com") == "monthly"
+    assert plan_of(app_module, "spam-buyer@example.com") is None
+
+    fetches = [c for c in box.commands if " UID FETCH " in c]
+    # jedna dávka hlaviček pro celou sadu, pak jen text/plain (sekce 1) a text/html (sekce 1)
+    assert fetches[0].split()[3] == "1:3" and "HEADER.FIELDS" in fetches[0]
+    assert all("RFC822" not in c and "BODY[" not in c and "BODY.PEEK[]" not in c for c in fetches)
+    assert len(fetches) == 2
+    assert box.bytes_sent < 100_000  # 2 MB příloha nikdy neodešla
+    assert box.seen() == [1, 3]   # jen platby, cizí pošta zůstane nepřečtená
+    assert sum(" UID STORE " in c for c in box.commands) == 1  # jeden STORE za dávku
+
+
+def test_checkpoint_ignores_seen_flag_and_skips_processed_mail(worker, app_module, monkeypatch):
+    box = Mailbox()
+    box.append(payment_mail("ckpt-a@example.com", message_id="<a@bmc>"))
+    box.append(payment_mail("ckpt-b@example.com", message_id="<b@bmc>"))
+
+    user_selects = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            user_selects.append(statement)
+
+    with ImapStub(box) as server:
+        monkeypatch.setattr(worker, "IMAP_PORT", server.port)
+        monkeypatch.setattr(worker, "IMAP_MARK_SEEN", False)
+        with app_module.app.app_context():
+            engine = app_module.db.engine
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            assert worker.process_inbox()["activated"] == 2
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        assert len(user_selects) == 1 and " IN " in user_selects[0]  # jeden IN dotaz na všechny adresy
+
+        # nic nového → žádný FETCH, i když zprávy zůstaly UNSEEN
+        fetches = sum(" UID FETCH " in c for c in box.commands)
+        assert worker.process_inbox()["scanned"] == 0
+        assert sum(" UID FETCH " in c for c in box.commands) == fetches
+
+        # někdo zprávu otevřel dřív než worker – checkpoint ji stejně najde
+        box.append(payment_mail("ckpt-c@example.com", message_id="<c@bmc>"), flags={"\\Seen"})
+        assert worker.process_inbox() == {"scanned": 1, "candidates": 1, "activated": 1}
+
+        # server přečísloval schránku: UNSEEN vrátí staré zprávy, Message-ID je podruhé neaktivuje
+        box.uidvalidity = 2
+        assert worker.process_inbox() == {"scanned": 2, "candidates": 2, "activated": 0}
+
+    with app_module.app.app_context():
+        assert app_module.ImapCheckpoint.query.one().last_uid == 3
+        results = {m.key: m.result for m in app_module.ImapMessage.query}
+    assert results == {"<a@bmc>": "activated", "<b@bmc>": "activated", "<c@bmc>": "activated"}
+
+
+def test_idle_activates_new_payment_without_polling(worker, app_module, monkeypatch):
+    box = Mailbox()
+    stop = threading.Event()
+    with ImapStub(box) as server:
+        monkeypatch.setattr(worker, "IMAP_PORT", server.port)
+        thread = threading.Thread(target=worker.run_loop, args=(3600,),
+                                  kwargs={"idle_seconds": 60, "stop": stop}, daemon=True)
+        thread.start()
+        try:
+            assert box.idling.wait(5)
+            box.append(payment_mail("idle-buyer@example.com"))
+            deadline = time.monotonic() + 5
+            while plan_of(app_module, "idle-buyer@example.com") is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            stop.set()
+            thread.join(5)
+
+    assert plan_of(app_module, "idle-buyer@example.com") == "monthly"
+    assert not thread.is_alive()
+    assert sum(" LOGIN " in c for c in box.commands) == 1  # jedno trvalé spojení
+
+
+def test_idle_sees_exists_sent_with_continuation(worker, monkeypatch):
+    box = Mailbox()
+    box.append(payment_mail("burst-buyer@example.com"))
+    box.idle_exists_now = True
+    with ImapStub(box) as server:
+        monkeypatch.setattr(worker, "IMAP_PORT", server.port)
+        client = worker.connect()
+        try:
+            worker.select_folder(client)
+            t0 = time.monotonic()
+            assert worker.idle_wait(client, 4) is True
+            assert time.monotonic() - t0 < 1  # EXISTS byl už v bufferu imaplibu
+        finally:
+            client.logout()
+
+
+def test_polls_when_server_has_no_idle(worker, app_module, monkeypatch):
+    box = Mailbox(capabilities=("IMAP4rev1",))
+    stop = threading.Event()
+    with ImapStub(box) as server:
+        monkeypatch.setattr(worker, "IMAP_PORT", server.port)
+        thread = threading.Thread(target=worker.run_loop, args=(0.1,), kwargs={"stop": stop}, daemon=True)
+        thread.start()
+        try:
+            box.append(payment_mail("poll-buyer@example.com"))
+            deadline = time.monotonic() + 5
+            while plan_of(app_module, "poll-buyer@example.com") is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            stop.set()
+            thread.join(5)
+
+    assert plan_of(app_module, "poll-buyer@example.com") == "monthly"
+    assert not any(" IDLE" in c for c in box.commands)
@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+from admission import Rejected
+from kdf_executor import KdfExecutor
+
+
+def test_hash_and_check_run_on_pool():
+    kdf = KdfExecutor(workers=1, max_pending=0)
+    pwhash = kdf.hash_password("pass1234")
+    assert kdf.check_password(pwhash, "pass1234")
+    assert not kdf.check_password(pwhash, "wrong")
+    assert not kdf.check_password("!", "pass1234")  # placeholder účet bez hesla
+
+
+def test_rejects_when_pool_and_queue_are_full():
+    kdf = KdfExecutor(workers=1, max_pending=1, timeout=5)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    running = threading.Thread(target=kdf.run, args=(slow,))
+    queued = threading.Thread(target=kdf.run, args=(lambda: "queued",))
+    running.start()
+    assert started.wait(2)
+    queued.start()
+    try:
+        with pytest.raises(Rejected) as exc:
+            kdf.run(lambda: "third")
+        assert exc.value.status == 503 and exc.value.code == "auth_busy"
+    finally:
+        release.set()
+        running.join(5)
+        queued.join(5)
+
+    assert kdf.run(lambda: "again") == "again"  # sloty se po dokončení vrátí
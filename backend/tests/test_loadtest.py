@@ -0,0 +1,34 @@
+import pytest
+
+from loadtest import Recorder, best, percentile, summarize
+
+
+def test_percentile_interpolates():
+    assert percentile([0.1, 0.2, 0.3, 0.4], 50) == pytest.approx(0.25)
+    assert percentile([1.0], 99) == 1.0
+
+
+def test_summary_rates_and_best_config():
+    rec = Recorder()
+    for s in (0.1, 0.2, 0.3):
+        rec.add("convert", 200, s)
+    rec.add("convert", 429, 0.01)
+    rec.add("me", 200, 0.02)
+    rec.add("login_idle", 200, 0.05)
+    rec.add("login", 200, 0.06)
+    rec.add("login", 503, 0.001)
+
+    row = summarize(rec, 2.0, [100 * 2 ** 20, 300 * 2 ** 20])
+
+    assert row["throughput_rps"] == 1.5
+    assert row["rate_429"] == 0.25 and row["p50_ms"] == 200.0
+    assert row["rss_peak_mb"] == 300.0
+    assert row["login_idle_p99_ms"] == 50.0 and row["login_p99_ms"] == 60.0
+    assert row["login_failed"] == 1
+
+    rows = [
+        {"throughput_rps": 5.0, "p95_ms": 900, "errors": 0, "rate_429": 0.0, "rate_503": 0.0},
+        {"throughput_rps": 9.0, "p95_ms": 800, "errors": 0, "rate_429": 0.3, "rate_503": 0.0},
+        {"throughput_rps": 5.0, "p95_ms": 700, "errors": 0, "rate_429": 0.0, "rate_503": 0.01},
+    ]
+    assert best(rows, max_error_rate=0.05) is rows[2]
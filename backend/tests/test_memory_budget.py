@@ -0,0 +1,57 @@
+import threading
+import time
+
+from PIL import Image
+
+from convert import estimate_peak_memory
+from memory_budget import BudgetedExecutor, MemoryBudget, parse_size
+
+
+def test_parse_size():
+    assert parse_size("512M") == 512 * 1024 ** 2
+    assert parse_size("1.5GiB") == int(1.5 * 1024 ** 3)
+    assert parse_size("0") == 0
+    assert parse_size(None) == 0
+
+
+def test_small_jobs_run_while_large_job_waits():
+    budget = MemoryBudget(100)
+    lock = threading.Lock()
+    running = {"mem": 0, "peak": 0}
+    order = []
+
+    def job(name, cost, hold):
+        with lock:
+            running["mem"] += cost
+            running["peak"] = max(running["peak"], running["mem"])
+            order.append(name)
+        time.sleep(hold)
+        with lock:
+            running["mem"] -= cost
+        return name
+
+    with BudgetedExecutor(4, budget) as ex:
+        futs = [ex.submit(60, job, "big1", 60, 0.5)]
+        futs.append(ex.submit(60, job, "big2", 60, 0.05))
+        futs += [ex.submit(10, job, f"small{i}", 10, 0.01) for i in range(3)]
+        assert sorted(f.result(timeout=5) for f in futs) == ["big1", "big2", "small0", "small1", "small2"]
+
+    assert running["peak"] <= 100
+    # malé joby předběhly druhý velký, který čekal na uvolnění paměti
+    assert order.index("big2") > order.index("small0")
+    assert budget.used == 0
+
+
+def test_oversized_job_runs_alone():
+    budget = MemoryBudget(10)
+    with BudgetedExecutor(2, budget) as ex:
+        assert ex.submit(50, lambda: "ok").result(timeout=5) == "ok"
+
+
+def test_estimate_peak_memory_from_header(tmp_path):
+    path = tmp_path / "big.png"
+    Image.new("RGB", (2000, 1000)).save(path)
+    full = estimate_peak_memory(path)
+    small = estimate_peak_memory(path, max_width=200)
+    assert full >= 2000 * 1000 * 8
+    assert small < full
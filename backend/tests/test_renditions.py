@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+import pytest
+
+from admission import Rejected
+from renditions import RenditionStore, parse_steps, snap_nearest, snap_up
+from result_cache import ResultCache
+
+
+def _store(tmp_path, max_bytes=10_000_000, lock_timeout=5.0):
+    (tmp_path / "originals").mkdir(exist_ok=True)
+    cache = ResultCache(tmp_path / "renditions", max_bytes, "secret")
+    return RenditionStore(tmp_path / "originals", cache, widths=(320, 640, 1280), qualities=(50, 72, 90),
+                          lock_timeout=lock_timeout)
+
+
+def test_snapping_keeps_rendition_count_finite(tmp_path):
+    assert parse_steps("1280, 320,x,,-5,640,320") == (320, 640, 1280)
+    assert [snap_up(w, (320, 640, 1280)) for w in (1, 320, 321, 800, 5000)] == [320, 320, 640, 1280, 1280]
+    assert [snap_nearest(q, (50, 72, 90)) for q in (1, 61, 62, 75, 100)] == [50, 72, 72, 72, 90]
+
+    store = _store(tmp_path)
+    assert store.snap(None, None) == (None, 72)
+    assert store.snap(799, 88) == (1280, 90)
+
+
+def test_original_id_stays_inside_root(tmp_path):
+    store = _store(tmp_path)
+    (tmp_path / "originals" / "shop").mkdir()
+    (tmp_path / "originals" / "shop" / "shoe.jpg").write_bytes(b"jpg")
+    (tmp_path / "secret.txt").write_text("x")
+    os.symlink(tmp_path / "secret.txt", tmp_path / "originals" / "link.jpg")
+
+    assert store.original("shop/shoe.jpg") == tmp_path / "originals" / "shop" / "shoe.jpg"
+    for bad in ("../secret.txt", "shop/../../secret.txt", ".hidden", "shop//shoe.jpg", "link.jpg", "shop", "nope.jpg"):
+        assert store.original(bad) is None, bad
+
+
+def test_concurrent_requests_build_once(tmp_path):
+    store = _store(tmp_path)
+    builds = []
+    gate = threading.Event()
+
+    def build(out):
+        builds.append(out)
+        gate.wait(5)
+        out.write_bytes(b"RIFF-rendition")
+        return {"mode": "lossy"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_build("ab" * 32, build)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(builds) == 1
+    assert sorted(r[2] for r in results) == ["coalesced", "coalesced", "coalesced", "miss"]
+    assert {r[0] for r in results} == {b"RIFF-rendition"}
+    assert len({r[1]["etag"] for r in results}) == 1
+    assert store.get_or_build("ab" * 32, build)[2] == "hit"
+
+
+def test_waiter_gives_up_after_lock_timeout(tmp_path):
+    store = _store(tmp_path, lock_timeout=0.2)
+    gate = threading.Event()
+
+    def slow(out):
+        gate.wait(5)
+        out.write_bytes(b"x")
+        return {}
+
+    thread = threading.Thread(target=store.get_or_build, args=("cd" * 32, slow))
+    thread.start()
+    time.sleep(0.05)
+    with pytest.raises(Rejected) as exc:
+        store.get_or_build("cd" * 32, slow)
+    gate.set()
+    thread.join(5)
+    assert exc.value.code == "rendition_busy"
+
+
+def test_works_without_cache(tmp_path):
+    store = _store(tmp_path, max_bytes=0)
+    calls = []
+
+    def build(out):
+        calls.append(out)
+        out.write_bytes(b"data")
+        return {}
+
+    assert store.get_or_build("ef" * 32, build)[:1] == (b"data",)
+    assert store.get_or_build("ef" * 32, build)[2] == "miss"
+    assert len(calls) == 2
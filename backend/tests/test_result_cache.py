@@ -0,0 +1,63 @@
+import io
+import os
+import time
+
+from result_cache import ResultCache, is_sha256, save_hashed
+
+
+def _cache(tmp_path, max_bytes=10_000, ttl=60):
+    return ResultCache(tmp_path / "cache", max_bytes, "secret", token_ttl=ttl)
+
+
+def test_save_hashed_and_round_trip(tmp_path):
+    src = tmp_path / "in.bin"
+    sha, size = save_hashed(io.BytesIO(b"x" * 3000), src)
+    assert is_sha256(sha) and size == 3000
+
+    cache = _cache(tmp_path)
+    params = {"quality": 72, "metadata": "keep"}
+    key = cache.result_key("user-1", sha, params)
+    assert cache.get_result(key) is None
+
+    cache.put_result(key, src, {"mode": "lossy"})
+    cache.put_original(cache.original_key("user-1", sha), src)
+
+    path, meta = cache.get_result(key)
+    assert path.read_bytes() == b"x" * 3000 and meta == {"mode": "lossy"}
+    assert cache.get_original(cache.original_key("user-1", sha), size=3000) is not None
+    assert cache.get_original(cache.original_key("user-1", sha), size=2999) is None
+    # jiný vlastník nebo jiné parametry = jiný klíč
+    assert cache.get_result(cache.result_key("user-2", sha, params)) is None
+    assert cache.get_result(cache.result_key("user-1", sha, {**params, "quality": 80})) is None
+
+
+def test_prune_drops_least_recently_used(tmp_path):
+    cache = _cache(tmp_path, max_bytes=2500)
+    src = tmp_path / "in.bin"
+    src.write_bytes(b"y" * 1000)
+    keys = [cache.result_key("u", f"{i:064x}", {}) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put_result(key, src, {})
+        os.utime(cache._result_path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    cache.get_result(keys[0])  # použitý → nejmladší
+
+    cache.put_result(keys[2], src, {})
+
+    assert cache.get_result(keys[1]) is None
+    assert cache.get_result(keys[0]) is not None and cache.get_result(keys[2]) is not None
+
+
+def test_download_token_is_signed_and_expires(tmp_path):
+    cache = _cache(tmp_path)
+    src = tmp_path / "in.bin"
+    src.write_bytes(b"z")
+    key = cache.result_key("u", "0" * 64, {})
+    cache.put_result(key, src, {})
+
+    token = cache.issue_token(key)
+    assert cache.resolve_token(token) is not None
+    assert cache.resolve_token(token[:-1] + ("0" if token[-1] != "0" else "1")) is None
+    assert cache.resolve_token("garbage") is None
+
+    cache.token_ttl = -1
+    assert cache.resolve_token(cache.issue_token(key)) is None
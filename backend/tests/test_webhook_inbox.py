@@ -0,0 +1,27 @@
+import threading
+
+from webhook_inbox import BackgroundApplier
+
+
+def test_kick_wakes_thread_and_drain_runs_full_batches():
+    pending = [7]
+    calls = []
+    applied = threading.Event()
+
+    def apply_batch(limit):
+        calls.append(limit)
+        done = min(limit, pending[0])
+        pending[0] -= done
+        if not pending[0]:
+            applied.set()
+        return done
+
+    applier = BackgroundApplier(apply_batch, batch_size=3, interval=60)
+    try:
+        applier.kick()
+        assert applied.wait(2)  # ne až po intervalu 60 s
+    finally:
+        applier.stop()
+
+    assert calls == [3, 3, 3]  # 3 + 3 + 1, poslední neplná dávka ukončí drain
+    assert not applier._thread.is_alive()
@@ -0,0 +1,281 @@
+import io
+import json
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+from PIL import Image
+from sqlalchemy import select
+
+import webpify_batch
+from batch_archive import read_entry
+from batch_coordinator import Coordinator, jobs_table
+
+
+def _run_batch(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["webpify_batch.py", *map(str, argv)])
+    webpify_batch.main()
+
+
+def _make_tree(root):
+    (root / "a").mkdir(parents=True)
+    Image.new("RGB", (64, 48), (200, 10, 10)).save(root / "a" / "one.jpg")
+    Image.new("RGBA", (32, 32), (0, 0, 255, 128)).save(root / "two.png")
+    (root / "broken.jpg").write_bytes(b"not an image")
+
+
+def test_report_records_files_and_summary(tmp_path, monkeypatch):
+    src = tmp_path / "in"
+    out = tmp_path / "out"
+    report = tmp_path / "run.ndjson"
+    _make_tree(src)
+
+    _run_batch(monkeypatch, "-i", src, "-o", out, "--report", report, "--report-interval", 0, "--workers", 2)
+
+    records = [json.loads(line) for line in report.read_text(encoding="utf-8").splitlines()]
+    assert records[0]["type"] == "start"
+    assert records[-1]["type"] == "summary"
+
+    files = {r["src"]: r for r in records if r["type"] == "file"}
+    assert len(files) == 3
+    ok = files[str((src / "a" / "one.jpg").resolve())]
+    assert ok["status"] == "ok"
+    assert ok["pixels"] == 64 * 48
+    assert ok["in_bytes"] > 0 and ok["out_bytes"] > 0
+    assert ok["encode_s"] >= 0
+
+    err = files[str((src / "broken.jpg").resolve())]
+    assert err["status"] == "err" and err["error"]
+    assert not (src / "broken.ERROR.txt").exists()
+
+    assert any(r["type"] == "progress" for r in records)
+    summary = records[-1]
+    assert summary["counts"] == {"ok": 2, "err": 1}
+    assert summary["bytes_saved"] == summary["bytes_in"] - summary["bytes_out"]
+
+
+def test_dedup_links_identical_sources(tmp_path, monkeypatch):
+    src = tmp_path / "in"
+    out = tmp_path / "out"
+    report = tmp_path / "run.ndjson"
+    (src / "x").mkdir(parents=True)
+    (src / "y").mkdir()
+    Image.new("RGB", (40, 30), (10, 120, 30)).save(src / "x" / "photo.jpg")
+    (src / "y" / "copy.jpg").write_bytes((src / "x" / "photo.jpg").read_bytes())
+    Image.new("RGB", (41, 30), (200, 20, 30)).save(src / "other.jpg")
+
+    _run_batch(monkeypatch, "-i", src, "-o", out, "--dedup", "--dedup-link", "copy", "--report", report)
+
+    a = out / "x" / "photo.webp"
+    b = out / "y" / "copy.webp"
+    assert a.read_bytes() == b.read_bytes()
+    assert (out / "other.webp").exists()
+
+    records = [json.loads(line) for line in report.read_text(encoding="utf-8").splitlines()]
+    statuses = sorted(r["status"] for r in records if r["type"] == "file")
+    assert statuses == ["dedup", "ok", "ok"]
+    dup = next(r for r in records if r.get("status") == "dedup")
+    assert dup["link"] == "copy"
+    assert records[-1]["counts"]["dedup"] == 1
+    assert "dedup_saved_s" in records[-1]
+
+
+@pytest.mark.parametrize("mode", [["--watch"], ["--coordinator", "work.db"]])
+def test_dedup_rejected_where_unsupported(tmp_path, monkeypatch, mode):
+    src = tmp_path / "in"
+    src.mkdir()
+    with pytest.raises(SystemExit) as exc:
+        _run_batch(monkeypatch, "-i", src, "--dedup", *mode)
+    assert exc.value.code == 2
+
+
+def test_coordinator_workers_share_sqlite_table(tmp_path):
+    src = tmp_path / "in"
+    out = tmp_path / "out"
+    db = tmp_path / "work.db"
+    src.mkdir()
+    for i in range(12):
+        Image.new("RGB", (24 + i, 16), (i * 20, 50, 90)).save(src / f"img{i:02d}.png")
+
+    script = Path(webpify_batch.__file__)
+    args = [
+        sys.executable, str(script), "-i", str(src), "-o", str(out),
+        "--coordinator", str(db), "--run-id", "t1", "--workers", "2", "--chunk-size", "2",
+    ]
+    procs = [subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) for _ in range(3)]
+    for p in procs:
+        _, err = p.communicate(timeout=120)
+        assert p.returncode == 0, err.decode()
+
+    assert sorted(p.name for p in out.iterdir()) == [f"img{i:02d}.webp" for i in range(12)]
+    coord = Coordinator(str(db), "t1")
+    try:
+        assert coord.counts() == {"done": 12}
+    finally:
+        coord.close()
+
+
+def test_coordinator_reclaims_expired_leases(tmp_path, monkeypatch):
+    src = tmp_path / "in"
+    out = tmp_path / "out"
+    db = tmp_path / "work.db"
+    src.mkdir()
+    for i in range(4):
+        Image.new("RGB", (10 + i, 10), (0, 0, 0)).save(src / f"p{i}.png")
+
+    dead = Coordinator(str(db), "t2", lease_seconds=0.01)
+    dead.seed([f"p{i}.png" for i in range(4)])
+    claimed = dead.claim(3)
+    assert len(claimed) == 3
+    dead.close()
+    time.sleep(0.05)
+
+    _run_batch(monkeypatch, "-i", src, "-o", out, "--coordinator", db, "--run-id", "t2", "--no-seed")
+
+    assert len(list(out.glob("*.webp"))) == 4
+    coord = Coordinator(str(db), "t2")
+    try:
+        assert coord.counts() == {"done": 4}
+        with coord.engine.connect() as conn:
+            attempts = sorted(conn.execute(select(jobs_table.c.attempts)).scalars())
+        assert attempts == [1, 2, 2, 2]
+    finally:
+        coord.close()
+
+
+def test_coordinator_stops_heartbeat_when_loop_fails(tmp_path, monkeypatch):
+    src = tmp_path / "in"
+    src.mkdir()
+    Image.new("RGB", (10, 10), (0, 0, 0)).save(src / "p.png")
+    events = []
+    stop, close = Coordinator.stop_heartbeat, Coordinator.close
+
+    def failing_complete(self, *a, **kw):
+        raise RuntimeError("db gone")
+
+    monkeypatch.setattr(Coordinator, "complete", failing_complete)
+    monkeypatch.setattr(Coordinator, "stop_heartbeat", lambda self: (events.append("stop"), stop(self)))
+    monkeypatch.setattr(Coordinator, "close", lambda self: (events.append("close"), close(self)))
+
+    with pytest.raises(RuntimeError):
+        _run_batch(monkeypatch, "-i", src, "-o", tmp_path / "out", "--coordinator", tmp_path / "w.db")
+    # leasy se přestanou obnovovat hned, ne až při close()
+    assert events[:2] == ["stop", "close"]
+
+
+@pytest.mark.parametrize("backend", ["poll", "inotify"])
+def test_watch_converts_dropped_files(tmp_path, backend):
+    if backend == "inotify" and not sys.platform.startswith("linux"):
+        pytest.skip("inotify is Linux only")
+    src = tmp_path / "uploads"
+    out = tmp_path / "out"
+    src.mkdir()
+    Image.new("RGB", (20, 20), (1, 2, 3)).save(src / "old.png")
+
+    args = webpify_batch.build_parser().parse_args([
+        "-i", str(src), "-o", str(out), "--watch", "--watch-backend", backend,
+        "--debounce", "0.2", "--poll-interval", "0.1", "--workers", "2",
+    ])
+    stop = threading.Event()
+    t = threading.Thread(target=webpify_batch.run_watch, args=(args, src, out, stop))
+    t.start()
+    try:
+        _wait_for(out / "old.webp")
+        (src / "sub").mkdir()
+        Image.new("RGB", (30, 10), (9, 9, 9)).save(src / "sub" / "new.png")
+        _wait_for(out / "sub" / "new.webp")
+    finally:
+        stop.set()
+        t.join(timeout=10)
+    assert not t.is_alive()
+
+
+def _wait_for(path, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        assert time.monotonic() < deadline, f"{path} not created"
+        time.sleep(0.05)
+
+
+def test_max_memory_limits_concurrency(tmp_path, monkeypatch):
+    src = tmp_path / "in"
+    out = tmp_path / "out"
+    report = tmp_path / "run.ndjson"
+    src.mkdir()
+    for i in range(6):
+        Image.new("RGB", (300, 200), (i, i, i)).save(src / f"m{i}.png")
+
+    _run_batch(monkeypatch, "-i", src, "-o", out, "--max-memory", "20M", "--workers", "4", "--report", report)
+
+    assert len(list(out.glob("*.webp"))) == 6
+    summary = json.loads(report.read_text(encoding="utf-8").splitlines()[-1])
+    assert summary["memory_limit"] == 20 * 1024 ** 2
+    assert summary["memory_peak_reserved"] <= summary["memory_limit"]
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_prefetch_pipeline_reports_stage_stats(tmp_path, monkeypatch, use_mmap):
+    src = tmp_path / "in"
+    out = tmp_path / "out"
+    report = tmp_path / "run.ndjson"
+    _make_tree(src)
+    extra = ["--mmap"] if use_mmap else []
+
+    _run_batch(monkeypatch, "-i", src, "-o", out, "--prefetch", 2, "--report", report, *extra)
+
+    assert (out / "a" / "one.webp").exists()
+    assert (out / "two.webp").exists()
+    summary = json.loads(report.read_text(encoding="utf-8").splitlines()[-1])
+    assert summary["counts"] == {"ok": 2, "err": 1}
+    stages = summary["pipeline"]
+    assert set(stages) == {"read", "cpu", "write"}
+    assert stages["read"]["items"] == 3
+    assert stages["write"]["items"] == 2
+    assert stages["cpu"]["queue_max"] <= 2
+
+
+@pytest.mark.parametrize("name", ["out.tar", "out.zip"])
+def test_output_archive_with_index(tmp_path, monkeypatch, name):
+    src = tmp_path / "in"
+    archive = tmp_path / name
+    _make_tree(src)
+    (src / "dup.png").write_bytes((src / "two.png").read_bytes())
+
+    _run_batch(monkeypatch, "-i", src, "--output-archive", archive, "--dedup")
+
+    index = [json.loads(line) for line in Path(f"{archive}.index.ndjson").read_text(encoding="utf-8").splitlines()]
+    by_name = {rec["name"]: rec for rec in index}
+    assert set(by_name) == {"a/one.webp", "two.webp", "dup.webp"}
+    assert not list(src.rglob("*.webp"))
+
+    if name.endswith(".tar"):
+        with tarfile.open(archive) as tf:
+            member = tf.extractfile("a/one.webp").read()
+    else:
+        with zipfile.ZipFile(archive) as zf:
+            member = zf.read("a/one.webp")
+    assert read_entry(str(archive), by_name["a/one.webp"]) == member
+    assert member[:4] == b"RIFF" and member[8:12] == b"WEBP"
+    dup = by_name["dup.webp"]
+    assert read_entry(str(archive), dup) == read_entry(str(archive), by_name["two.webp"])
+
+
+def test_output_archive_streams_tar_to_stdout(tmp_path):
+    src = tmp_path / "in"
+    _make_tree(src)
+    index = tmp_path / "idx.ndjson"
+    script = Path(webpify_batch.__file__)
+    proc = subprocess.run(
+        [sys.executable, str(script), "-i", str(src), "--output-archive", "-", "--archive-index", str(index)],
+        capture_output=True, timeout=60, check=True,
+    )
+    with tarfile.open(fileobj=io.BytesIO(proc.stdout)) as tf:
+        names = sorted(tf.getnames())
+    assert names == ["a/one.webp", "two.webp"]
+    rec = json.loads(index.read_text(encoding="utf-8").splitlines()[0])
+    assert proc.stdout[rec["offset"]:rec["offset"] + rec["size"]][:4] == b"RIFF"
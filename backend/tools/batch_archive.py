@@ -0,0 +1,128 @@
+from __future__ import annotations
+import io
+import json
+import tarfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+# Výstup do jednoho archivu (tar/zip) místo tisíců malých souborů. Položky
+# zapisuje sekvenčně jediný writer; vedle vzniká NDJSON index
+# {src, name, offset, size}, přes který jde položku přečíst seekem bez rozbalování.
+
+
+def archive_format(target: str, fmt: Optional[str] = None) -> str:
+    if fmt:
+        return fmt
+    if target == "-":
+        return "tar"
+    return "zip" if target.lower().endswith(".zip") else "tar"
+
+
+class ArchiveWriter:
+    def __init__(
+        self,
+        target: str,
+        fmt: Optional[str] = None,
+        index_path: Optional[str] = None,
+        stream: Optional[BinaryIO] = None,
+    ):
+        self.target = target
+        self.fmt = archive_format(target, fmt)
+        self.entries = 0
+        self.bytes = 0
+        self._names: dict = {}
+        self._lock = threading.Lock()
+        self._mtime = time.time()
+
+        if self.fmt == "zip":
+            if target == "-":
+                raise ValueError("zip nejde streamovat na stdout, použij tar")
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            self._zip = zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED)
+            self._tar = None
+        else:
+            if target == "-":
+                # stream: bez seeku, offsety se počítají z počtu zapsaných bajtů
+                self._tar = tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT)
+            else:
+                Path(target).parent.mkdir(parents=True, exist_ok=True)
+                self._tar = tarfile.open(target, "w", format=tarfile.PAX_FORMAT)
+            self._zip = None
+
+        self._index = None
+        if index_path:
+            Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+            self._index = open(index_path, "w", encoding="utf-8")
+
+    def _write_index(self, rec: dict):
+        if self._index is not None:
+            self._index.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def add(self, name: str, data: bytes, src: str = "") -> dict:
+        """Přidá položku, vrací záznam indexu (offset = začátek dat v archivu)."""
+        with self._lock:
+            if self._tar is not None:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = self._mtime
+                info.mode = 0o644
+                self._tar.addfile(info, io.BytesIO(data))
+                padded = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                offset = self._tar.offset - padded
+            else:
+                zinfo = zipfile.ZipInfo(name, date_time=time.localtime(self._mtime)[:6])
+                zinfo.compress_type = zipfile.ZIP_STORED
+                self._zip.writestr(zinfo, data)
+                try:
+                    fname = zinfo.filename.encode("ascii")
+                except UnicodeEncodeError:
+                    fname = zinfo.filename.encode("utf-8")
+                offset = zinfo.header_offset + 30 + len(fname) + len(zinfo.extra)
+            rec = {"src": src, "name": name, "offset": offset, "size": len(data)}
+            self._names[name] = rec
+            self.entries += 1
+            self.bytes += len(data)
+            self._write_index(rec)
+            return rec
+
+    def add_alias(self, name: str, target: str, src: str = "") -> dict:
+        """
+        Duplikát: v taru hardlink položka (bez dat), v zipu jen záznam indexu
+        ukazující na data cílové položky.
+        """
+        with self._lock:
+            base = self._names[target]
+            if self._tar is not None:
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.LNKTYPE
+                info.linkname = target
+                info.mtime = self._mtime
+                info.mode = 0o644
+                self._tar.addfile(info)
+            rec = {"src": src, "name": name, "offset": base["offset"], "size": base["size"], "link": target}
+            self._names[name] = rec
+            self.entries += 1
+            self._write_index(rec)
+            return rec
+
+    def close(self):
+        with self._lock:
+            if self._tar is not None:
+                self._tar.close()
+                self._tar = None
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+
+
+def read_entry(archive: str, rec: dict) -> bytes:
+    """Přečte jednu položku podle záznamu indexu (seek + read, bez rozbalování)."""
+    with open(archive, "rb") as fh:
+        fh.seek(rec["offset"])
+        return fh.read(rec["size"])
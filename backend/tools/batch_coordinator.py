@@ -0,0 +1,263 @@
+from __future__ import annotations
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from sqlalchemy import (
+    Column, Float, Index, Integer, MetaData, String, Table, Text,
+    UniqueConstraint, and_, create_engine, func, or_, select, update,
+)
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+# Sdílená tabulka práce pro více workerů (procesy/hosty) nad SQLite/Postgres.
+# Worker si atomicky zabere chunk jobů s časově omezeným leasem, průběžně ho
+# prodlužuje (heartbeat) a po dokončení job uzavře. Lease mrtvého workeru
+# vyprší a job si vezme někdo jiný.
+
+metadata = MetaData()
+
+jobs_table = Table(
+    "webpify_jobs",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("run_id", String(64), nullable=False),
+    Column("rel", Text, nullable=False),
+    Column("state", String(16), nullable=False, default="pending"),
+    Column("owner", String(128), nullable=True),
+    Column("claim", String(32), nullable=True),
+    Column("lease_until", Float, nullable=True),
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("status", String(32), nullable=True),
+    Column("error", Text, nullable=True),
+    Column("updated_at", Float, nullable=True),
+    UniqueConstraint("run_id", "rel", name="uq_webpify_jobs_run_rel"),
+    Index("ix_webpify_jobs_run_state", "run_id", "state"),
+)
+
+
+@dataclass
+class Claimed:
+    id: int
+    rel: str
+    claim: str
+    attempts: int
+
+
+def engine_url(value: str) -> str:
+    # holá cesta → SQLite soubor
+    if "://" in value:
+        return value
+    return f"sqlite:///{os.path.abspath(value)}"
+
+
+class Coordinator:
+    def __init__(
+        self,
+        url: str,
+        run_id: str,
+        lease_seconds: float = 60.0,
+        max_attempts: int = 3,
+        owner: Optional[str] = None,
+    ):
+        url = engine_url(url)
+        kwargs = {}
+        if url.startswith("sqlite"):
+            # víc procesů nad jedním souborem → čekat na zámek, ne padat
+            kwargs["connect_args"] = {"timeout": 60}
+        self.engine = create_engine(url, **kwargs)
+        self.run_id = run_id
+        self.lease_seconds = float(lease_seconds)
+        self.max_attempts = int(max_attempts)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._active: set = set()
+        self._active_lock = threading.Lock()
+        self._hb_stop = threading.Event()
+        self._hb_thread: Optional[threading.Thread] = None
+        self._create_schema()
+
+    def _create_schema(self, tries: int = 3):
+        # víc workerů startuje naráz – CREATE TABLE může prohrát souboj s jiným
+        for attempt in range(tries):
+            try:
+                metadata.create_all(self.engine)
+                return
+            except DBAPIError:
+                if attempt == tries - 1:
+                    raise
+                time.sleep(0.1 * (attempt + 1))
+
+    # ── seed ────────────────────────────────────────────────────
+    def seed(self, rels: Iterable[str], batch: int = 500) -> int:
+        """Vloží joby, které v tabulce pro tento run ještě nejsou. Vrací počet nových."""
+        rels = list(rels)
+        with self.engine.connect() as conn:
+            known = set(conn.execute(
+                select(jobs_table.c.rel).where(jobs_table.c.run_id == self.run_id)
+            ).scalars())
+        todo = [r for r in rels if r not in known]
+        added = 0
+        now = time.time()
+        for i in range(0, len(todo), batch):
+            rows = [
+                {"run_id": self.run_id, "rel": r, "state": "pending", "attempts": 0, "updated_at": now}
+                for r in todo[i:i + batch]
+            ]
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(jobs_table.insert(), rows)
+                added += len(rows)
+            except IntegrityError:
+                # souběžný seed z jiného workeru – po jednom, duplicity přeskočit
+                for row in rows:
+                    try:
+                        with self.engine.begin() as conn:
+                            conn.execute(jobs_table.insert(), row)
+                        added += 1
+                    except IntegrityError:
+                        pass
+        return added
+
+    # ── claim / complete ────────────────────────────────────────
+    def _expire_exhausted(self, conn, now: float):
+        conn.execute(
+            update(jobs_table)
+            .where(
+                jobs_table.c.run_id == self.run_id,
+                jobs_table.c.state == "leased",
+                jobs_table.c.lease_until < now,
+                jobs_table.c.attempts >= self.max_attempts,
+            )
+            .values(
+                state="failed", status="err", claim=None, lease_until=None, updated_at=now,
+                error=f"lease expired {self.max_attempts}x (worker died?)",
+            )
+        )
+
+    def claim(self, limit: int) -> List[Claimed]:
+        now = time.time()
+        token = uuid.uuid4().hex
+        claimable = and_(
+            jobs_table.c.run_id == self.run_id,
+            or_(
+                jobs_table.c.state == "pending",
+                and_(jobs_table.c.state == "leased", jobs_table.c.lease_until < now),
+            ),
+        )
+        ids = (
+            select(jobs_table.c.id)
+            .where(claimable)
+            .order_by(jobs_table.c.id)
+            .limit(int(limit))
+            .scalar_subquery()
+        )
+        with self.engine.begin() as conn:
+            self._expire_exhausted(conn, now)
+            # podmínka se opakuje i ve vnějším WHERE: v Postgresu se po čekání
+            # na zámek řádku znovu vyhodnotí, takže dva workery nezaberou totéž
+            conn.execute(
+                update(jobs_table)
+                .where(jobs_table.c.id.in_(ids), claimable)
+                .values(
+                    state="leased",
+                    owner=self.owner,
+                    claim=token,
+                    lease_until=now + self.lease_seconds,
+                    attempts=jobs_table.c.attempts + 1,
+                    updated_at=now,
+                ),
+            )
+            rows = conn.execute(
+                select(jobs_table.c.id, jobs_table.c.rel, jobs_table.c.attempts)
+                .where(jobs_table.c.claim == token)
+                .order_by(jobs_table.c.id)
+            ).all()
+        if rows:
+            with self._active_lock:
+                self._active.add(token)
+        return [Claimed(id=r.id, rel=r.rel, claim=token, attempts=r.attempts) for r in rows]
+
+    def complete(self, job: Claimed, status: str, error: Optional[str] = None) -> bool:
+        """Uzavře job. False = lease mezitím propadl a job převzal jiný worker."""
+        now = time.time()
+        state = "failed" if status == "err" else "done"
+        with self.engine.begin() as conn:
+            res = conn.execute(
+                update(jobs_table)
+                .where(
+                    jobs_table.c.id == job.id,
+                    jobs_table.c.claim == job.claim,
+                    jobs_table.c.state == "leased",
+                )
+                .values(state=state, status=status, error=error, lease_until=None, updated_at=now)
+            )
+            left = conn.execute(
+                select(func.count())
+                .select_from(jobs_table)
+                .where(jobs_table.c.claim == job.claim, jobs_table.c.state == "leased")
+            ).scalar_one()
+        if not left:
+            with self._active_lock:
+                self._active.discard(job.claim)
+        return res.rowcount == 1
+
+    # ── heartbeat ───────────────────────────────────────────────
+    def heartbeat(self):
+        with self._active_lock:
+            tokens = list(self._active)
+        if not tokens:
+            return
+        now = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(jobs_table)
+                .where(jobs_table.c.claim.in_(tokens), jobs_table.c.state == "leased")
+                .values(lease_until=now + self.lease_seconds, updated_at=now)
+            )
+
+    def _hb_loop(self):
+        interval = max(self.lease_seconds / 3.0, 0.05)
+        while not self._hb_stop.wait(interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"[WARN] heartbeat selhal: {e!r}")
+
+    def start_heartbeat(self):
+        if self._hb_thread is None:
+            self._hb_thread = threading.Thread(target=self._hb_loop, name="webpify-heartbeat", daemon=True)
+            self._hb_thread.start()
+
+    def stop_heartbeat(self):
+        self._hb_stop.set()
+        if self._hb_thread is not None:
+            self._hb_thread.join()
+            self._hb_thread = None
+
+    # ── stav ────────────────────────────────────────────────────
+    def counts(self) -> dict:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(jobs_table.c.state, func.count())
+                .where(jobs_table.c.run_id == self.run_id)
+                .group_by(jobs_table.c.state)
+            ).all()
+        return {state: n for state, n in rows}
+
+    def unfinished(self) -> int:
+        c = self.counts()
+        return c.get("pending", 0) + c.get("leased", 0)
+
+    def next_expiry(self) -> Optional[float]:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.min(jobs_table.c.lease_until))
+                .where(jobs_table.c.run_id == self.run_id, jobs_table.c.state == "leased")
+            ).scalar_one()
+
+    def close(self):
+        self.stop_heartbeat()
+        self.engine.dispose()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import errno
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+# Deduplikace zdrojů podle obsahu: velikost → částečný hash (začátek+konec)
+# → plný hash. Plný hash se počítá jen u souborů, které prošly levnějšími filtry.
+
+PARTIAL_BYTES = 64 * 1024
+CHUNK = 1024 * 1024
+FICLONE = 0x40049409  # linux/fs.h, _IOW(0x94, 9, int)
+
+
+def _partial_hash(path: Path, size: int) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fh:
+        h.update(fh.read(PARTIAL_BYTES))
+        if size > 2 * PARTIAL_BYTES:
+            fh.seek(-PARTIAL_BYTES, os.SEEK_END)
+            h.update(fh.read(PARTIAL_BYTES))
+    return h.digest()
+
+
+def _full_hash(path: Path) -> bytes:
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as fh:
+        while True:
+            buf = fh.read(CHUNK)
+            if not buf:
+                break
+            h.update(buf)
+    return h.digest()
+
+
+def _refine(groups: Sequence[List], key) -> List[List]:
+    out: List[List] = []
+    for group in groups:
+        if len(group) < 2:
+            out.append(group)
+            continue
+        buckets: Dict[object, List] = {}
+        for item in group:
+            try:
+                k = key(item)
+            except OSError:
+                k = ("unreadable", id(item))
+            buckets.setdefault(k, []).append(item)
+        out.extend(buckets.values())
+    return out
+
+
+def group_duplicates(jobs: Sequence) -> Tuple[List[List], float]:
+    """
+    Rozdělí joby na skupiny se shodným obsahem zdroje (první job = reprezentant).
+    Vrací (skupiny, čas strávený hashováním v s).
+    """
+    t0 = time.perf_counter()
+    sizes: Dict[Path, int] = {}
+    by_size: Dict[object, List] = {}
+    for job in jobs:
+        try:
+            size = job.src.stat().st_size
+        except OSError:
+            size = None
+        sizes[job.src] = size
+        key = size if size is not None else ("missing", id(job))
+        by_size.setdefault(key, []).append(job)
+
+    groups = list(by_size.values())
+    groups = _refine(groups, lambda j: _partial_hash(j.src, sizes[j.src]))
+    groups = _refine(groups, lambda j: _full_hash(j.src))
+    return groups, time.perf_counter() - t0
+
+
+def _reflink(src: Path, dst: Path):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported on this platform")
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            dst.unlink(missing_ok=True)
+            raise
+
+
+def link_output(src: Path, dst: Path, mode: str = "auto") -> str:
+    """
+    Vytvoří dst jako kopii hotového výstupu src. mode: auto/reflink/hardlink/copy,
+    auto zkouší reflink → hardlink → kopii. Vrací skutečně použitý způsob.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+
+    order = ["reflink", "hardlink", "copy"] if mode == "auto" else [mode]
+    last_exc: OSError = OSError(errno.EINVAL, f"unknown link mode {mode!r}")
+    for how in order:
+        try:
+            if how == "reflink":
+                _reflink(src, dst)
+            elif how == "hardlink":
+                os.link(src, dst)
+            elif how == "copy":
+                shutil.copyfile(src, dst)
+            else:
+                continue
+            return how
+        except OSError as e:
+            last_exc = e
+    raise last_exc
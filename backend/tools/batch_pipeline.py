@@ -0,0 +1,200 @@
+from __future__ import annotations
+import io
+import mmap
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+# Třístupňová pipeline pro --prefetch: I/O vlákna čtou dopředu K zdrojů do
+# paměti, CPU workery dekódují/enkódují z bufferů a jediný writer zapisuje
+# výstupy. Každý stupeň měří čas práce, čas nečinnosti a hloubku své fronty.
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_s = 0.0
+        self.idle_s = 0.0
+        self.depth_sum = 0
+        self.depth_samples = 0
+        self.depth_max = 0
+        self._lock = threading.Lock()
+
+    def sample_depth(self, depth: int):
+        with self._lock:
+            self.depth_sum += depth
+            self.depth_samples += 1
+            self.depth_max = max(self.depth_max, depth)
+
+    def add(self, busy: float = 0.0, idle: float = 0.0, items: int = 0):
+        with self._lock:
+            self.busy_s += busy
+            self.idle_s += idle
+            self.items += items
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy_s, 3),
+            "idle_s": round(self.idle_s, 3),
+            "queue_avg": round(self.depth_sum / self.depth_samples, 2) if self.depth_samples else 0,
+            "queue_max": self.depth_max,
+        }
+
+
+def read_source(path, use_mmap: bool = False):
+    """Celý soubor do paměti, nebo mmap s MADV_WILLNEED (jádro načte dopředu)."""
+    with open(path, "rb") as fh:
+        if use_mmap:
+            try:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # prázdný soubor
+                return io.BytesIO(b"")
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+                mm.madvise(mmap.MADV_WILLNEED)
+            return mm
+        return io.BytesIO(fh.read())
+
+
+class Pipeline:
+    """
+    read_fn(item) -> buffer | None (None = přeskočit, výsledek dodá skip_fn(item))
+    cpu_fn(item, buffer) -> (data, result)
+    write_fn(item, data, result) -> result
+    error_fn(item, exc) -> result
+    run() vrací dvojice (item, result) v pořadí dokončení.
+    """
+
+    def __init__(
+        self,
+        read_fn: Callable,
+        cpu_fn: Callable,
+        write_fn: Callable,
+        skip_fn: Callable,
+        error_fn: Callable,
+        workers: int,
+        prefetch: int,
+        io_threads: int = 2,
+    ):
+        self.read_fn = read_fn
+        self.cpu_fn = cpu_fn
+        self.write_fn = write_fn
+        self.skip_fn = skip_fn
+        self.error_fn = error_fn
+        self.workers = max(1, workers)
+        self.io_threads = max(1, io_threads)
+        self.read_q: queue.Queue = queue.Queue(maxsize=max(1, prefetch))
+        self.write_q: queue.Queue = queue.Queue(maxsize=max(2, self.workers * 2))
+        self.out_q: queue.Queue = queue.Queue()
+        self.stats = {
+            "read": StageStats("read"),
+            "cpu": StageStats("cpu"),
+            "write": StageStats("write"),
+        }
+        self._items: Optional[Iterator] = None
+        self._items_lock = threading.Lock()
+
+    def _next_item(self):
+        with self._items_lock:
+            return next(self._items, _DONE)
+
+    def _reader(self):
+        st = self.stats["read"]
+        while True:
+            item = self._next_item()
+            if item is _DONE:
+                break
+            t0 = time.perf_counter()
+            try:
+                buf = self.read_fn(item)
+            except Exception as e:
+                self.out_q.put((item, self.error_fn(item, e)))
+                st.add(busy=time.perf_counter() - t0, items=1)
+                continue
+            t1 = time.perf_counter()
+            if buf is None:
+                self.out_q.put((item, self.skip_fn(item)))
+                st.add(busy=t1 - t0)
+                continue
+            self.read_q.put((item, buf))  # blokuje, když je prefetch plný
+            st.add(busy=t1 - t0, idle=time.perf_counter() - t1, items=1)
+
+    def _cpu(self):
+        st = self.stats["cpu"]
+        while True:
+            t0 = time.perf_counter()
+            st.sample_depth(self.read_q.qsize())
+            got = self.read_q.get()
+            t1 = time.perf_counter()
+            if got is _DONE:
+                st.add(idle=t1 - t0)
+                break
+            item, buf = got
+            try:
+                data, res = self.cpu_fn(item, buf)
+            except Exception as e:
+                data, res = None, self.error_fn(item, e)
+            finally:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
+            st.add(busy=time.perf_counter() - t1, idle=t1 - t0, items=1)
+            if data is None:
+                self.out_q.put((item, res))
+            else:
+                self.write_q.put((item, data, res))
+
+    def _writer(self):
+        st = self.stats["write"]
+        while True:
+            t0 = time.perf_counter()
+            st.sample_depth(self.write_q.qsize())
+            got = self.write_q.get()
+            t1 = time.perf_counter()
+            if got is _DONE:
+                st.add(idle=t1 - t0)
+                break
+            item, data, res = got
+            try:
+                res = self.write_fn(item, data, res)
+            except Exception as e:
+                res = self.error_fn(item, e)
+            st.add(busy=time.perf_counter() - t1, idle=t1 - t0, items=1)
+            self.out_q.put((item, res))
+
+    def run(self, items: Iterable) -> Iterator:
+        """Spustí stupně a průběžně vrací výsledky; skončí, když doběhne vše."""
+        self._items = iter(items)
+        readers = [threading.Thread(target=self._reader, name=f"webpify-read-{i}", daemon=True)
+                   for i in range(self.io_threads)]
+        cpus = [threading.Thread(target=self._cpu, name=f"webpify-cpu-{i}", daemon=True)
+                for i in range(self.workers)]
+        writer = threading.Thread(target=self._writer, name="webpify-write", daemon=True)
+        for t in readers + cpus + [writer]:
+            t.start()
+
+        def shutdown():
+            for t in readers:
+                t.join()
+            for _ in cpus:
+                self.read_q.put(_DONE)
+            for t in cpus:
+                t.join()
+            self.write_q.put(_DONE)
+            writer.join()
+            self.out_q.put(_DONE)
+
+        closer = threading.Thread(target=shutdown, name="webpify-pipeline-close", daemon=True)
+        closer.start()
+        while True:
+            res = self.out_q.get()
+            if res is _DONE:
+                break
+            yield res
+        closer.join()
+
+    def stats_dict(self) -> dict:
+        return {name: st.as_dict() for name, st in self.stats.items()}
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import json
+import os
+import platform
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+# NDJSON report pro webpify_batch: jeden záznam na soubor, průběžné
+# snapshoty propustnosti a závěrečný souhrn (type = start/file/progress/summary).
+
+
+class RunReport:
+    def __init__(
+        self,
+        path: Optional[str],
+        total: int,
+        interval: float = 5.0,
+        meta: Optional[dict] = None,
+    ):
+        self.total = total
+        self.interval = max(0.0, float(interval))
+        self.run_id = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self._last_snapshot = self.started
+        self._lock = threading.Lock()
+        self._fh = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._fh = open(path, "w", encoding="utf-8")
+
+        self.counts: dict = {}
+        self.done = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.pixels = 0
+        self.t_decode = 0.0
+        self.t_resize = 0.0
+        self.t_encode = 0.0
+        self.t_write = 0.0
+        self.dedup_saved_s = 0.0
+        self.latencies: list = []
+
+        self._write({
+            "type": "start",
+            "run_id": self.run_id,
+            "host": platform.node(),
+            "pid": os.getpid(),
+            "python": platform.python_version(),
+            "pillow": _pillow_version(),
+            "total": total,
+            **(meta or {}),
+        })
+
+    @property
+    def enabled(self) -> bool:
+        return self._fh is not None
+
+    def _write(self, rec: dict):
+        if self._fh is None:
+            return
+        rec.setdefault("ts", round(time.time(), 3))
+        line = json.dumps(rec, ensure_ascii=False, default=str)
+        self._fh.write(line + "\n")
+        self._fh.flush()
+
+    def add_total(self, n: int) -> None:
+        with self._lock:
+            self.total += n
+
+    def record(self, result) -> None:
+        """Zapíše výsledek jednoho souboru (webpify_batch.Result)."""
+        with self._lock:
+            self.done += 1
+            self.counts[result.status] = self.counts.get(result.status, 0) + 1
+            if result.status == "ok":
+                self.bytes_in += result.in_bytes
+                self.bytes_out += result.out_bytes
+                self.pixels += result.pixels
+                self.t_decode += result.t_decode
+                self.t_resize += result.t_resize
+                self.t_encode += result.t_encode
+                self.t_write += result.t_write
+            elif result.status == "dedup":
+                self.dedup_saved_s += result.saved_s
+
+            rec = {
+                "type": "file",
+                "status": result.status,
+                "src": str(result.src),
+                "dst": str(result.path),
+                "in_bytes": result.in_bytes,
+                "out_bytes": result.out_bytes,
+                "pixels": result.pixels,
+                "decode_s": round(result.t_decode, 6),
+                "resize_s": round(result.t_resize, 6),
+                "encode_s": round(result.t_encode, 6),
+                "write_s": round(result.t_write, 6),
+            }
+            if result.dedup_of is not None:
+                rec["dedup_of"] = str(result.dedup_of)
+                rec["link"] = result.link
+                rec["saved_s"] = round(result.saved_s, 6)
+            if result.latency_s is not None:
+                rec["latency_s"] = round(result.latency_s, 3)
+                self.latencies.append(result.latency_s)
+            if result.error:
+                rec["error"] = result.error
+            self._write(rec)
+
+            now = time.perf_counter()
+            if now - self._last_snapshot >= self.interval:
+                self._last_snapshot = now
+                self._write(self._snapshot("progress", now))
+
+    def _snapshot(self, kind: str, now: float) -> dict:
+        elapsed = max(now - self.started, 1e-9)
+        files_per_s = self.done / elapsed
+        remaining = max(self.total - self.done, 0)
+        return {
+            "type": kind,
+            "run_id": self.run_id,
+            "done": self.done,
+            "total": self.total,
+            "elapsed_s": round(elapsed, 3),
+            "files_per_s": round(files_per_s, 3),
+            "mp_per_s": round(self.pixels / 1e6 / elapsed, 3),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+            "eta_s": round(remaining / files_per_s, 1) if files_per_s > 0 else None,
+        }
+
+    def finish(self, **extra) -> dict:
+        with self._lock:
+            rec = self._snapshot("summary", time.perf_counter())
+            rec.pop("eta_s", None)
+            rec["counts"] = dict(self.counts)
+            rec["decode_s"] = round(self.t_decode, 3)
+            rec["resize_s"] = round(self.t_resize, 3)
+            rec["encode_s"] = round(self.t_encode, 3)
+            rec["write_s"] = round(self.t_write, 3)
+            if self.latencies:
+                lat = sorted(self.latencies)
+                rec["latency_p50_s"] = round(lat[len(lat) // 2], 3)
+                rec["latency_p95_s"] = round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 3)
+                rec["latency_max_s"] = round(lat[-1], 3)
+            if self.counts.get("dedup"):
+                rec["dedup_saved_s"] = round(self.dedup_saved_s, 3)
+            rec.update(extra)
+            self._write(rec)
+            if self._fh is not None:
+                self._fh.close()
+            self._fh = None
+            return rec
+
+
+def _pillow_version() -> Optional[str]:
+    try:
+        import PIL
+        return PIL.__version__
+    except Exception:
+        return None
@@ -0,0 +1,240 @@
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Sledování složky pro --watch: inotify na Linuxu (přes libc, bez závislostí),
+# jinak polling. Události se debouncují – soubor se pošle ke konverzi až když
+# se po dobu `quiet` sekund nezměnil (velikost + mtime), tj. je dopsaný.
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")
+
+Stat = Tuple[int, int]
+
+
+def _stat(path: Path) -> Optional[Stat]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def scan(root: Path, exts: Set[str]) -> Dict[Path, Stat]:
+    out: Dict[Path, Stat] = {}
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(Path(e.path))
+                    elif e.is_file() and os.path.splitext(e.name)[1].lower() in exts:
+                        st = e.stat()
+                        out[Path(e.path)] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+    return out
+
+
+class PollingWatcher:
+    name = "poll"
+
+    def __init__(self, root: Path, exts: Set[str], interval: float = 2.0):
+        self.root = root
+        self.exts = exts
+        self.interval = interval
+        self._snap = scan(root, exts)
+        self._next = time.monotonic() + interval
+
+    def poll(self, timeout: float) -> List[Path]:
+        wait = self._next - time.monotonic()
+        if wait > timeout:
+            time.sleep(max(timeout, 0))
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._next = time.monotonic() + self.interval
+        snap = scan(self.root, self.exts)
+        changed = [p for p, st in snap.items() if self._snap.get(p) != st]
+        self._snap = snap
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    name = "inotify"
+
+    def __init__(self, root: Path, exts: Set[str]):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify není dostupné")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 selhalo")
+        self.fd = fd
+        self.root = root
+        self.exts = exts
+        self._wds: Dict[int, Path] = {}
+        self._pending_scan: List[Path] = []
+        self._add_tree(root)
+
+    def _add_watch(self, path: Path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch {path}: {os.strerror(err)}")
+        self._wds[wd] = path
+
+    def _add_tree(self, root: Path):
+        for dirpath, _dirnames, _files in os.walk(root):
+            try:
+                self._add_watch(Path(dirpath))
+            except OSError as e:
+                print(f"[WARN] {e}", file=sys.stderr)
+
+    def poll(self, timeout: float) -> List[Path]:
+        changed: List[Path] = []
+        # adresář vzniklý mezi událostí a přidáním watche → soubory v něm najít scanem
+        if self._pending_scan:
+            for d in self._pending_scan:
+                changed.extend(scan(d, self.exts))
+            self._pending_scan = []
+            timeout = 0
+
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return changed
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        off = 0
+        while off + _EVENT.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, off)
+            name = buf[off + _EVENT.size: off + _EVENT.size + length].rstrip(b"\0")
+            off += _EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # fronta jádra přetekla → nevíme co se změnilo, vrátit vše
+                changed.extend(scan(self.root, self.exts))
+                continue
+            if mask & IN_IGNORED:
+                self._wds.pop(wd, None)
+                continue
+            base = self._wds.get(wd)
+            if base is None or not name:
+                continue
+            path = base / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                    self._pending_scan.append(path)
+                continue
+            if path.suffix.lower() in self.exts:
+                changed.append(path)
+        return changed
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+def make_watcher(root: Path, exts: Iterable[str], backend: str = "auto", interval: float = 2.0):
+    exts = {e.lower() for e in exts}
+    if backend in ("auto", "inotify"):
+        try:
+            return InotifyWatcher(root, exts)
+        except OSError as e:
+            if backend == "inotify":
+                raise
+            print(f"[INFO] inotify nedostupné ({e}), používám polling po {interval}s", file=sys.stderr)
+    return PollingWatcher(root, exts, interval=interval)
+
+
+class Debouncer:
+    """Pustí cestu dál, až když se `quiet` sekund nezměnila."""
+
+    def __init__(self, quiet: float = 1.0):
+        self.quiet = quiet
+        self._seen: Dict[Path, Tuple[float, Optional[Stat]]] = {}
+
+    def touch(self, path: Path, now: float):
+        self._seen[path] = (now, _stat(path))
+
+    def next_deadline(self) -> Optional[float]:
+        if not self._seen:
+            return None
+        return min(t for t, _ in self._seen.values()) + self.quiet
+
+    def ready(self, now: float) -> List[Path]:
+        out = []
+        for path, (t, st) in list(self._seen.items()):
+            if now - t < self.quiet:
+                continue
+            cur = _stat(path)
+            if cur is None:
+                del self._seen[path]        # smazáno dřív, než se dopsalo
+            elif cur != st:
+                self._seen[path] = (now, cur)  # pořád se zapisuje
+            else:
+                del self._seen[path]
+                out.append(path)
+        return out
+
+
+def watch(
+    root: Path,
+    exts: Iterable[str],
+    on_ready: Callable[[List[Path]], None],
+    stop: threading.Event,
+    quiet: float = 1.0,
+    backend: str = "auto",
+    poll_interval: float = 2.0,
+) -> None:
+    watcher = make_watcher(root, exts, backend=backend, interval=poll_interval)
+    print(f"[INFO] Sleduji {root} ({watcher.name}, debounce {quiet}s)")
+    deb = Debouncer(quiet)
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            deadline = deb.next_deadline()
+            timeout = 1.0 if deadline is None else min(max(deadline - now, 0.0), 1.0)
+            for path in watcher.poll(timeout):
+                deb.touch(path, time.monotonic())
+            ready = deb.ready(time.monotonic())
+            if ready:
+                on_ready(ready)
+    finally:
+        watcher.close()
@@ -1,26 +1,32 @@
 #!/usr/bin/env python3
+import base64
+import binascii
 import email
 import imaplib
 import os
+import quopri
 import re
+import select
+import ssl
+import threading
 import time
-import uuid
-from datetime import timedelta
 from email.header import decode_header, make_header
 from email.utils import parseaddr
 
-from werkzeug.security import generate_password_hash
-
-from app import app, db, now_utc, User
+from app import app, db, extend_plan, placeholder_user, ImapCheckpoint, ImapMessage, User
 from config import (
   IMAP_ENABLED,
+  IMAP_FETCH_BATCH,
   IMAP_FOLDER,
   IMAP_HOST,
+  IMAP_IDLE,
+  IMAP_IDLE_SECONDS,
   IMAP_MARK_SEEN,
   IMAP_PASS,
   IMAP_POLL_SECONDS,
   IMAP_PORT,
   IMAP_SENDER_WHITELIST,
+  IMAP_SSL,
   IMAP_USER,
 )
 
@@ -113,97 +119,480 @@ def amount_matches(text):
   return True
 
 
-def pick_email(emails):
+def pick_email(emails, known):
+  """První adresa, která už má účet (known), jinak první nalezená."""
   if not emails:
     return None
-  with app.app_context():
-    for addr in emails:
-      if User.query.filter_by(email=addr).first():
-        return addr
-  return emails[0]
+  return next((addr for addr in emails if addr in known), emails[0])
 
 
-def activate_membership(user_email, dry_run=False):
-  if not user_email:
-    return False
+def apply_payments(found, uidvalidity=None, last_uid=None, dry_run=False):
+  """Zapíše výsledek jednoho průchodu v jedné transakci.
+
+  found: [(klíč zprávy, uid, nalezené e-maily)]. Zprávy, které už mají záznam
+  v ImapMessage, se přeskočí; uživatelé se dohledají jedním IN dotazem.
+  Checkpoint (uidvalidity, last_uid) se posune ve stejném commitu.
+  Vrací seznam aktivovaných adres.
+  """
   with app.app_context():
-    user = User.query.filter_by(email=user_email).first()
-    if not user:
-      user = User(
-        email=user_email,
-        password_hash=generate_password_hash(uuid.uuid4().hex),
-        plan=None,
-        plan_expires_at=None,
-        is_vip=False,
-        conversions_used=0,
-      )
-      db.session.add(user)
+    keys = {key for key, _, _ in found}
+    done = set()
+    if keys:
+      done = {k for (k,) in db.session.query(ImapMessage.key).filter(ImapMessage.key.in_(keys))}
+
+    todo = []
+    for key, uid, emails in found:
+      if key not in done:
+        done.add(key)  # stejná zpráva dvakrát v jedné dávce
+        todo.append((key, uid, emails))
+
+    addrs = {addr for _, _, emails in todo for addr in emails}
+    users = {u.email: u for u in User.query.filter(User.email.in_(addrs))} if addrs else {}
+
+    activated = []
+    for key, uid, emails in todo:
+      picked = pick_email(emails, users)
+      if picked:
+        user = users.get(picked)
+        if user is None:
+          user = users[picked] = placeholder_user(picked)
+          db.session.add(user)
+        extend_plan(user, PAYMENT_PLAN_DAYS)
+        activated.append(picked)
+      db.session.add(ImapMessage(key=key, folder=IMAP_FOLDER, uid=uid, email=picked,
+                                 result="activated" if picked else "ignored"))
+
+    if uidvalidity is not None and last_uid is not None:
+      checkpoint = db.session.get(ImapCheckpoint, IMAP_FOLDER)
+      if checkpoint is None:
+        checkpoint = ImapCheckpoint(folder=IMAP_FOLDER, uidvalidity=uidvalidity, last_uid=0)
+        db.session.add(checkpoint)
+      checkpoint.uidvalidity = uidvalidity
+      checkpoint.last_uid = last_uid
 
     if dry_run:
-      return True
+      db.session.rollback()
+    else:
+      db.session.commit()
+  return activated
 
-    base = user.plan_expires_at if user.plan_expires_at and user.plan_expires_at > now_utc() else now_utc()
-    user.plan = "monthly"
-    user.plan_expires_at = base + timedelta(days=PAYMENT_PLAN_DAYS)
-    user.is_vip = user.is_vip or False
-    db.session.commit()
-  return True
 
+def load_checkpoint():
+  with app.app_context():
+    checkpoint = db.session.get(ImapCheckpoint, IMAP_FOLDER)
+    return (checkpoint.uidvalidity, checkpoint.last_uid) if checkpoint else None
+
+
+# ── IMAP: FETCH odpovědi a BODYSTRUCTURE ──────────────────────
+# imaplib vrací FETCH jako směs bytes a (hlavička, literál) dvojic; ty se tu
+# rozloží na tokeny a složí do vnořených seznamů, ze kterých se čte UID,
+# BODYSTRUCTURE a jednotlivé BODY[sekce].
+
+HEADER_ITEM = "BODY.PEEK[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)]"
+SOCKET_TIMEOUT = 60
+
+_OPEN, _CLOSE = object(), object()
+_LEX = re.compile(
+  rb"""\s*(?:
+    (?P<open>\() | (?P<close>\)) |
+    "(?P<quoted>(?:[^"\\]|\\.)*)" |
+    \{(?P<literal>\d+)\}\s*$ |
+    (?P<atom>[^\s()"\[\]]+(?:\[[^\]]*\](?:<[\d.]+>)?)?)
+  )""",
+  re.VERBOSE,
+)
 
-def process_inbox(dry_run=False):
-  if not IMAP_ENABLED:
-    print("IMAP is disabled. Set IMAP_ENABLED=true to activate.")
-    return
-  if not IMAP_USER or not IMAP_PASS:
-    print("IMAP credentials missing. Set IMAP_USER and IMAP_PASS.")
-    return
-
-  with imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT) as client:
-    client.login(IMAP_USER, IMAP_PASS)
-    client.select(IMAP_FOLDER)
 
-    status, data = client.search(None, "UNSEEN")
-    if status != "OK":
-      print("Failed to search inbox.")
+def _lex(data):
+  pos = 0
+  while True:
+    m = _LEX.match(data, pos)
+    if not m or m.end() == pos:
       return
+    pos = m.end()
+    if m.group("open"):
+      yield _OPEN
+    elif m.group("close"):
+      yield _CLOSE
+    elif m.group("quoted") is not None:
+      yield re.sub(rb"\\(.)", rb"\1", m.group("quoted"))
+    elif m.group("atom"):
+      atom = m.group("atom")
+      yield None if atom.upper() == b"NIL" else atom
+    # {n}: literál přijde jako druhý prvek dvojice
+
+
+def _tokens(data):
+  for item in data or []:
+    if isinstance(item, tuple):
+      yield from _lex(item[0])
+      yield item[1]
+    elif item:
+      yield from _lex(item)
+
+
+def _nest(tokens):
+  out = []
+  for tok in tokens:
+    if tok is _OPEN:
+      out.append(_nest(tokens))
+    elif tok is _CLOSE:
+      return out
+    else:
+      out.append(tok)
+  return out
+
+
+def parse_fetch(data):
+  """Odpověď UID FETCH → {uid: {"BODYSTRUCTURE": [...], "BODY[1]": b"...", ...}}."""
+  result = {}
+  for entry in _nest(iter(_tokens(data))):
+    if not isinstance(entry, list):
+      continue  # pořadové číslo zprávy
+    items = {}
+    for key, value in zip(entry[::2], entry[1::2]):
+      if isinstance(key, bytes):
+        items[key.decode("ascii", "replace").upper()] = value
+    uid = items.get("UID")
+    if isinstance(uid, bytes) and uid.isdigit():
+      result[int(uid)] = items
+  return result
+
+
+def _str(value):
+  return value.decode("utf-8", "replace") if isinstance(value, bytes) else ""
+
+
+def _params(value):
+  if not isinstance(value, list):
+    return {}
+  return {_str(k).lower(): _str(v) for k, v in zip(value[::2], value[1::2])}
+
+
+def text_parts(structure, section=""):
+  """Textové části (ne přílohy) z BODYSTRUCTURE: [(sekce, "plain"|"html", charset, kódování)]."""
+  if not isinstance(structure, list) or not structure:
+    return []
+  if isinstance(structure[0], list):  # multipart: podčásti, pak podtyp
+    parts = []
+    for n, child in enumerate(structure, 1):
+      if not isinstance(child, list):
+        break  # podtyp multipartu, za ním rozšiřující data
+      parts += text_parts(child, f"{section}.{n}" if section else str(n))
+    return parts
+
+  if len(structure) < 7 or _str(structure[0]).lower() != "text":
+    return []
+  subtype = _str(structure[1]).lower()
+  if subtype not in ("plain", "html"):
+    return []
+  params = _params(structure[2])
+  disposition = structure[9] if len(structure) > 9 else None
+  if isinstance(disposition, list) and disposition:
+    if _str(disposition[0]).lower() == "attachment" or "filename" in _params(disposition[1] if len(disposition) > 1 else None):
+      return []
+  if "name" in params:
+    return []
+  return [(section or "1", subtype, params.get("charset") or "utf-8", _str(structure[5]).lower())]
 
-    ids = data[0].split()
-    for msg_id in ids:
-      status, msg_data = client.fetch(msg_id, "(RFC822)")
-      if status != "OK" or not msg_data:
-        continue
-      raw = msg_data[0][1]
-      msg = email.message_from_bytes(raw)
 
-      sender = parseaddr(msg.get("From"))[1].lower()
-      if IMAP_SENDER_WHITELIST:
-        if sender not in [s.lower() for s in IMAP_SENDER_WHITELIST if s.strip()]:
-          continue
+def decode_part(data, encoding, charset):
+  if encoding == "base64":
+    try:
+      data = base64.b64decode(data)
+    except (binascii.Error, ValueError):
+      return ""
+  elif encoding == "quoted-printable":
+    data = quopri.decodestring(data)
+  try:
+    return data.decode(charset, errors="replace")
+  except LookupError:
+    return data.decode("utf-8", errors="replace")
 
-      subject = decode_header_value(msg.get("Subject"))
-      body = extract_text(msg)
-      text = f"{subject}\n{body}".strip()
 
-      if not amount_matches(text):
-        continue
+def html_to_text(html):
+  html = re.sub(r"<[^>]+>", " ", html or "")
+  return re.sub(r"\s+", " ", html).strip()
+
+
+def uid_set(uids):
+  """[1, 2, 3, 7, 9, 10] → "1:3,7,9:10" (jeden příkaz místo N)."""
+  ranges = []
+  for uid in sorted(set(uids)):
+    if ranges and uid == ranges[-1][1] + 1:
+      ranges[-1][1] = uid
+    else:
+      ranges.append([uid, uid])
+  return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def _batches(items, size):
+  items = list(items)
+  for i in range(0, len(items), max(1, size)):
+    yield items[i:i + max(1, size)]
+
+
+def _body(items, section):
+  for key, value in items.items():
+    if key.startswith(f"BODY[{section}]") and isinstance(value, bytes):
+      return value
+  return None
+
+
+# ── zpracování schránky ───────────────────────────────────────
+def _whitelisted(sender):
+  allowed = [s.strip().lower() for s in IMAP_SENDER_WHITELIST if s.strip()]
+  return not allowed or sender in allowed
 
-      emails = extract_emails(text)
-      picked = pick_email(emails)
-      if not picked:
+
+def fetch_candidates(client, uids):
+  """1. fáze: jen hlavičky + BODYSTRUCTURE po dávkách → {uid: (subject, textové části | None, Message-ID)}."""
+  candidates = {}
+  for batch in _batches(uids, IMAP_FETCH_BATCH):
+    status, data = client.uid("FETCH", uid_set(batch), f"(UID BODYSTRUCTURE {HEADER_ITEM})")
+    if status != "OK":
+      # checkpoint by zprávy přeskočil – raději celý průchod zopakovat
+      raise imaplib.IMAP4.error(f"UID FETCH failed: {data!r}")
+    for uid, items in parse_fetch(data).items():
+      header = next((v for k, v in items.items() if k.startswith("BODY[HEADER") and isinstance(v, bytes)), b"")
+      msg = email.message_from_bytes(header)
+      if not _whitelisted(parseaddr(msg.get("From"))[1].lower()):
         continue
+      structure = items.get("BODYSTRUCTURE")
+      if isinstance(structure, list):
+        parts = text_parts(structure)
+        parts = [p for p in parts if p[1] == "plain"] or parts[:1]
+      else:
+        parts = None  # nečitelná struktura → celá zpráva
+      message_id = (msg.get("Message-ID") or "").strip()[:255] or None
+      candidates[uid] = (decode_header_value(msg.get("Subject")), parts, message_id)
+  return candidates
+
+
+def fetch_texts(client, candidates):
+  """2. fáze: BODY.PEEK jen na vybrané textové části; zprávy se stejnými sekcemi v jednom příkazu."""
+  groups = {}
+  for uid, (_, parts, _) in candidates.items():
+    if parts != []:  # bez textové části stačí předmět
+      groups.setdefault(None if parts is None else tuple(p[0] for p in parts), []).append(uid)
+
+  texts = {}
+  for sections, uids in groups.items():
+    # bez čitelné struktury (nestandardní server) → celá zpráva, ale pořád PEEK
+    spec = "BODY.PEEK[]" if sections is None else " ".join(f"BODY.PEEK[{s}]" for s in sections)
+    for batch in _batches(uids, IMAP_FETCH_BATCH):
+      status, data = client.uid("FETCH", uid_set(batch), f"(UID {spec})")
+      if status != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH failed: {data!r}")
+      for uid, items in parse_fetch(data).items():
+        if uid not in candidates:
+          continue
+        if sections is None:
+          raw = _body(items, "")
+          texts[uid] = extract_text(email.message_from_bytes(raw)) if raw else ""
+          continue
+        chunks = []
+        for section, subtype, charset, encoding in candidates[uid][1]:
+          raw = _body(items, section)
+          if raw is None:
+            continue
+          text = decode_part(raw, encoding, charset)
+          chunks.append(html_to_text(text) if subtype == "html" else text)
+        texts[uid] = "\n".join(chunks).strip()
+  return texts
+
+
+def connect():
+  cls = imaplib.IMAP4_SSL if IMAP_SSL else imaplib.IMAP4
+  client = cls(IMAP_HOST, IMAP_PORT, timeout=SOCKET_TIMEOUT)
+  try:
+    client.login(IMAP_USER, IMAP_PASS)
+  except Exception:
+    client.shutdown()
+    raise
+  return client
 
-      activated = activate_membership(picked, dry_run=dry_run)
-      if activated and IMAP_MARK_SEEN and not dry_run:
-        client.store(msg_id, "+FLAGS", "\\Seen")
 
+def select_folder(client):
+  """SELECT na začátku každého průchodu → (UIDVALIDITY, UIDNEXT); None, když je server nepošle."""
+  status, _ = client.select(IMAP_FOLDER)
+  if status != "OK":
+    raise imaplib.IMAP4.error(f"Cannot select folder {IMAP_FOLDER}")
 
-def run_loop(interval, dry_run=False):
-  while True:
+  def number(name):
+    _, data = client.response(name)
+    try:
+      return int(data[0])
+    except (TypeError, ValueError, IndexError):
+      return None
+
+  return number("UIDVALIDITY"), number("UIDNEXT")
+
+
+def new_uids(client, checkpoint, uidvalidity):
+  """UID zpráv od posledního checkpointu; bez něj (první běh, změna UIDVALIDITY) jen UNSEEN."""
+  if checkpoint and uidvalidity is not None and checkpoint[0] == uidvalidity:
+    status, data = client.uid("SEARCH", None, f"UID {checkpoint[1] + 1}:*")
+    floor = checkpoint[1]
+  else:
+    status, data = client.uid("SEARCH", None, "UNSEEN")
+    floor = 0
+  if status != "OK":
+    raise imaplib.IMAP4.error("Failed to search inbox.")
+  # "n:*" vrátí vždy aspoň poslední zprávu, i když má UID < n
+  return [u for u in (int(x) for x in (data[0] or b"").split()) if u > floor]
+
+
+def _configured():
+  if not IMAP_ENABLED:
+    print("IMAP is disabled. Set IMAP_ENABLED=true to activate.")
+    return False
+  if not IMAP_USER or not IMAP_PASS:
+    print("IMAP credentials missing. Set IMAP_USER and IMAP_PASS.")
+    return False
+  return True
+
+
+def process_inbox(dry_run=False, client=None):
+  """Zpracuje zprávy od posledního checkpointu; s client= použije otevřené spojení."""
+  if client is None:
+    if not _configured():
+      return None
+    client = connect()
+    try:
+      return process_inbox(dry_run=dry_run, client=client)
+    finally:
+      try:
+        client.logout()
+      except Exception:
+        pass
+
+  stats = {"scanned": 0, "candidates": 0, "activated": 0}
+  uidvalidity, uidnext = select_folder(client)
+  checkpoint = load_checkpoint()
+  uids = new_uids(client, checkpoint, uidvalidity)
+  stats["scanned"] = len(uids)
+
+  resumed = checkpoint is not None and checkpoint[0] == uidvalidity
+  last_uid = max(uids + [checkpoint[1] if resumed else 0, (uidnext or 1) - 1])
+  if not uids and (uidvalidity is None or resumed and last_uid == checkpoint[1]):
+    return stats
+
+  candidates = fetch_candidates(client, uids) if uids else {}
+  stats["candidates"] = len(candidates)
+  texts = fetch_texts(client, candidates) if candidates else {}
+
+  found = []
+  for uid, (subject, _, message_id) in candidates.items():
+    text = f"{subject}\n{texts.get(uid, '')}".strip()
+    emails = extract_emails(text) if amount_matches(text) else []
+    found.append((message_id or f"{IMAP_FOLDER}:{uidvalidity}:{uid}", uid, emails))
+
+  activated = apply_payments(found, uidvalidity, last_uid, dry_run=dry_run)
+  stats["activated"] = len(activated)
+  for addr in activated:
+    print(f"Activated membership for {addr}{' (dry run)' if dry_run else ''}")
+
+  # stav drží checkpoint; \Seen je jen pro člověka, který schránku čte – označí
+  # se jen zpracované platby, ostatní pošta vlastníka schránky zůstane nepřečtená
+  paid = sorted(uid for _, uid, emails in found if emails)
+  if paid and IMAP_MARK_SEEN and not dry_run:
+    for batch in _batches(paid, IMAP_FETCH_BATCH):
+      client.uid("STORE", uid_set(batch), "+FLAGS.SILENT", "(\\Seen)")
+  return stats
+
+
+def _readable(client):
+  """Je co číst bez blokování? Bere v úvahu i řádky, které imaplib už má v bufferu
+  client.file (server často pošle `+ idling` a `* N EXISTS` v jednom paketu)
+  a dešifrovaná TLS data – o obojím select nad socketem neví."""
+  sock = client.socket()
+  timeout = sock.gettimeout()
+  sock.setblocking(False)
+  try:
+    return bool(client.file.peek(1))
+  except (BlockingIOError, ssl.SSLWantReadError):
+    return False
+  finally:
+    sock.settimeout(timeout)
+
+
+def idle_wait(client, timeout, stop=None):
+  """IMAP IDLE (RFC 2177): čeká na EXISTS/RECENT, timeout nebo stop. True = přišla pošta.
+
+  imaplib IDLE neumí (až 3.14), takže se příkaz posílá ručně po stejném spojení.
+  """
+  tag = client._new_tag()
+  client.send(tag + b" IDLE\r\n")
+  line = client.readline()
+  if not line.startswith(b"+"):
+    client.tagged_commands.pop(tag, None)
+    raise imaplib.IMAP4.error(f"IDLE rejected: {line.strip()!r}")
+
+  sock = client.socket()
+  deadline = time.monotonic() + timeout
+  changed = False
+  try:
+    while not changed and not (stop is not None and stop.is_set()):
+      left = deadline - time.monotonic()
+      if left <= 0:
+        break
+      if not _readable(client):
+        ready, _, _ = select.select([sock], [], [], min(left, 1.0))
+        if not ready:
+          continue
+      line = client.readline()
+      if not line:
+        raise imaplib.IMAP4.abort("connection closed during IDLE")
+      if re.match(rb"\* \d+ (EXISTS|RECENT)", line):
+        changed = True
+
+    client.send(b"DONE\r\n")
+    while True:
+      line = client.readline()
+      if not line:
+        raise imaplib.IMAP4.abort("connection closed during IDLE")
+      if line.startswith(tag + b" "):
+        if not line[len(tag) + 1:].upper().startswith(b"OK"):
+          raise imaplib.IMAP4.error(f"IDLE failed: {line.strip()!r}")
+        return changed
+  finally:
+    client.tagged_commands.pop(tag, None)
+
+
+def run_loop(interval, dry_run=False, idle_seconds=IMAP_IDLE_SECONDS, stop=None):
+  """Jedno trvalé spojení: IDLE, pokud ho server nabízí, jinak polling po interval s.
+
+  Po chybě/odpojení se spojení naváže znovu (backoff 1 s → max. 5 min).
+  """
+  if not _configured():
+    return
+  stop = stop or threading.Event()
+  backoff = 1
+  while not stop.is_set():
+    client = None
     try:
-      process_inbox(dry_run=dry_run)
+      client = connect()
+      use_idle = IMAP_IDLE and "IDLE" in client.capabilities
+      print(f"IMAP connected to {IMAP_HOST} ({'IDLE' if use_idle else f'polling every {interval}s'})")
+      backoff = 1
+      while not stop.is_set():
+        process_inbox(dry_run=dry_run, client=client)
+        if use_idle:
+          # i bez nové pošty po idle_seconds znovu SEARCH – pojistka proti ztracené notifikaci
+          idle_wait(client, idle_seconds, stop)
+        elif stop.wait(interval):
+          break
     except Exception as exc:
       print(f"IMAP worker error: {exc}")
-    time.sleep(interval)
+    finally:
+      if client is not None:
+        try:
+          client.logout()
+        except Exception:
+          pass
+    if not stop.wait(backoff):
+      backoff = min(backoff * 2, 300)
 
 
 def main():
@@ -212,7 +601,8 @@ def main():
   parser = argparse.ArgumentParser(description="IMAP payment activation worker")
   parser.add_argument("--once", action="store_true", help="Process inbox once and exit")
   parser.add_argument("--dry-run", action="store_true", help="Parse emails without updating database")
-  parser.add_argument("--interval", type=int, default=IMAP_POLL_SECONDS, help="Polling interval in seconds")
+  parser.add_argument("--interval", type=int, default=IMAP_POLL_SECONDS,
+                      help="Polling interval in seconds (only when the server has no IDLE)")
   args = parser.parse_args()
 
   if args.once:
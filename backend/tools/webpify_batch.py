@@ -2,29 +2,61 @@
 from __future__ import annotations
 import argparse
 import concurrent.futures as futures
+import hashlib
+import io
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Iterable, List, Optional
 import sys
 import os
+import signal
+import threading
+import time
 
-from PIL import Image, ImageOps
+# sdílené moduly backendu (convert, memory_budget) i při spuštění jako skript
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
 
-HEIF_OK = False
-try:
-    from pillow_heif import register_heif_opener  # type: ignore
-    register_heif_opener()
-    HEIF_OK = True
-except Exception:
-    HEIF_OK = False
+from batch_dedup import group_duplicates, link_output  # noqa: E402
+from batch_report import RunReport  # noqa: E402
+from colorspace import COLORSPACES  # noqa: E402
+from convert import (  # noqa: E402
+    BINARY_ALPHA_QUALITY, METADATA_POLICIES, encode_animated, estimate_peak_memory,
+    is_animated, metadata_kwargs, prepare_image,
+)
+from image_analysis import alpha_usage  # noqa: E402
+from image_io import heif_available, open_image  # noqa: E402
+from memory_budget import BudgetedExecutor, MemoryBudget, parse_size  # noqa: E402
 
-SUPPORTED = {".jpg", ".jpeg", ".png", ".heic", ".heif", ".heics", ".heifs"}
+# HEIF plugin se registruje až u prvního HEIC souboru (image_io)
+HEIF_OK = heif_available()
+
+SUPPORTED = {".jpg", ".jpeg", ".png", ".gif", ".heic", ".heif", ".heics", ".heifs"}
 
 @dataclass
 class Job:
     src: Path
     dst: Path
 
+@dataclass
+class Result:
+    status: str
+    path: Path
+    src: Path
+    in_bytes: int = 0
+    out_bytes: int = 0
+    pixels: int = 0
+    t_decode: float = 0.0
+    t_resize: float = 0.0
+    t_encode: float = 0.0
+    t_write: float = 0.0
+    error: Optional[str] = None
+    dedup_of: Optional[Path] = None
+    link: Optional[str] = None
+    saved_s: float = 0.0
+    latency_s: Optional[float] = None
+
 def find_images(root: Path, exts: Iterable[str]) -> List[Path]:
     exts = {e.lower() for e in exts}
     files: List[Path] = []
@@ -41,6 +73,91 @@ def make_dst(src: Path, in_root: Path, out_root: Path) -> Path:
 def ensure_parent(path: Path):
     path.parent.mkdir(parents=True, exist_ok=True)
 
+def encode_one(
+    src,
+    res: Result,
+    quality: int,
+    lossless: bool,
+    max_w: int | None,
+    max_h: int | None,
+    metadata: str,
+    max_fps: float | None = None,
+    colorspace: str = "keep",
+) -> bytes:
+    """Dekóduje src (cesta nebo file-like buffer) a vrátí WebP bajty; časy zapíše do res."""
+    t0 = time.perf_counter()
+    with open_image(src) as im:
+        if is_animated(im):
+            # snímky se dekódují a enkódují průběžně → čas jde celý do t_encode
+            res.pixels = im.width * im.height * im.n_frames
+            t1 = time.perf_counter()
+            res.t_decode = t1 - t0
+            bio = io.BytesIO()
+            encode_animated(
+                im, bio,
+                quality=quality,
+                lossless=lossless,
+                max_width=max_w,
+                max_height=max_h,
+                max_fps=max_fps,
+                **metadata_kwargs(im, metadata),
+            )
+            res.t_encode = time.perf_counter() - t1
+            return bio.getvalue()
+
+        res.pixels = im.width * im.height
+        steps: dict = {}
+        im, reduced = prepare_image(
+            im,
+            max_width=max_w,
+            max_height=max_h,
+            metadata=metadata,
+            colorspace=colorspace,
+            info=steps,
+        )
+        res.t_decode = steps["t_decode"]
+        res.t_resize = steps["t_process"]
+
+        save_kwargs = {
+            "format": "WEBP",
+            "quality": quality,
+            "method": 6,
+            "lossless": bool(lossless),
+            "optimize": True,
+        }
+        if reduced["alpha"] == "binary" and not lossless and alpha_usage(im) == "binary":
+            save_kwargs["alpha_quality"] = BINARY_ALPHA_QUALITY
+        save_kwargs.update(metadata_kwargs(im, metadata))
+
+        t2 = time.perf_counter()
+        bio = io.BytesIO()
+        im.save(bio, **save_kwargs)
+        im.close()
+        res.t_encode = time.perf_counter() - t2
+    return bio.getvalue()
+
+def write_output(job: Job, data: bytes, res: Result) -> Result:
+    t0 = time.perf_counter()
+    ensure_parent(job.dst)
+    with open(job.dst, "wb") as fh:
+        fh.write(data)
+    res.out_bytes = len(data)
+    res.t_write = time.perf_counter() - t0
+    return res
+
+def error_result(job: Job, e: BaseException, error_files: bool = True) -> Result:
+    if not error_files:
+        return Result("err", job.dst, job.src, error=repr(e))
+    err_file = job.src.with_suffix(".ERROR.txt")
+    try:
+        err_file.write_text(
+            f"Source: {job.src}\nTarget: {job.dst}\n\n{repr(e)}\n",
+            encoding="utf-8",
+        )
+    except Exception:
+        pass
+    return Result("err", err_file, job.src, error=repr(e))
+
 def convert_one(
     job: Job,
     quality: int,
@@ -48,69 +165,370 @@ def convert_one(
     max_w: int | None,
     max_h: int | None,
     overwrite: bool,
-    strip_meta: bool,
-) -> Tuple[str, Path]:
+    metadata: str,
+    error_files: bool = True,
+    max_fps: float | None = None,
+    colorspace: str = "keep",
+) -> Result:
     try:
         if job.dst.exists() and not overwrite:
-            return ("skipped_exists", job.dst)
-
-        with Image.open(job.src) as im:
-            im = ImageOps.exif_transpose(im)
-
-            if max_w or max_h:
-                im.thumbnail(
-                    (max_w or im.width, max_h or im.height),
-                    Image.Resampling.LANCZOS,
-                )
-
-            if im.mode in ("I;16", "I", "F"):
-                im = im.convert("RGB")
-            elif im.mode in ("P", "LA"):
-                im = im.convert("RGBA")
-            elif im.mode == "CMYK":
-                im = im.convert("RGB")
-
-            ensure_parent(job.dst)
-
-            exif_bytes = None
-            icc_profile = None
-            if not strip_meta:
-                try:
-                    exif = im.getexif()
-                    if exif:
-                        exif_bytes = exif.tobytes()
-                except Exception:
-                    exif_bytes = None
-                icc_profile = im.info.get("icc_profile")
-
-            save_kwargs = {
-                "format": "WEBP",
-                "quality": quality,
-                "method": 6,
-                "lossless": bool(lossless),
-                "optimize": True,
-            }
-            if icc_profile:
-                save_kwargs["icc_profile"] = icc_profile
-            if exif_bytes:
-                save_kwargs["exif"] = exif_bytes
+            return Result("skipped_exists", job.dst, job.src)
 
-            im.save(job.dst, **save_kwargs)
+        res = Result("ok", job.dst, job.src)
+        res.in_bytes = job.src.stat().st_size
+        data = encode_one(job.src, res, quality, lossless, max_w, max_h, metadata, max_fps, colorspace)
+        return write_output(job, data, res)
 
-        return ("ok", job.dst)
+    except Exception as e:
+        return error_result(job, e, error_files)
 
+def link_duplicate(job: Job, rep: Result, overwrite: bool, link_mode: str) -> Result:
+    """Výstup pro duplikát zdroje – převezme hotový výstup reprezentanta."""
+    if rep.status not in ("ok", "skipped_exists"):
+        return Result("err", job.dst, job.src, error=f"duplicate of failed {rep.src}")
+    if job.dst == rep.path or (job.dst.exists() and not overwrite):
+        return Result("skipped_exists", job.dst, job.src)
+    try:
+        how = link_output(rep.path, job.dst, link_mode)
     except Exception as e:
-        err_file = job.src.with_suffix(".ERROR.txt")
+        return Result("err", job.dst, job.src, error=repr(e))
+    return Result(
+        "dedup", job.dst, job.src,
+        in_bytes=rep.in_bytes,
+        out_bytes=rep.out_bytes,
+        pixels=rep.pixels,
+        dedup_of=rep.src,
+        link=how,
+        saved_s=rep.t_decode + rep.t_resize + rep.t_encode,
+    )
+
+def make_executor(args) -> BudgetedExecutor:
+    return BudgetedExecutor(args.workers, MemoryBudget(parse_size(args.max_memory)))
+
+def job_cost(ex: BudgetedExecutor, job: Job, args) -> int:
+    """Odhad špičkové RAM jobu z hlavičky; bez --max-memory se nic nečte."""
+    if not ex.budget.enabled:
+        return 0
+    try:
+        return estimate_peak_memory(job.src, args.max_width, args.max_height)
+    except Exception:
+        return 0  # nečitelná hlavička – chybu ohlásí až samotná konverze
+
+def _memory_stats(ex: BudgetedExecutor) -> dict:
+    if not ex.budget.enabled:
+        return {}
+    return {
+        "memory_limit": ex.budget.limit,
+        "memory_peak_reserved": ex.peak_used,
+        "memory_wait_s": round(ex.wait_s, 3),
+    }
+
+def _report_meta(args, in_root: Path, out_root: Path) -> dict:
+    return {
+        "input": str(in_root),
+        "output": str(out_root),
+        "workers": args.workers,
+        "quality": args.quality,
+        "lossless": args.lossless,
+        "max_width": args.max_width,
+        "max_height": args.max_height,
+        "metadata": args.metadata,
+        "colorspace": args.colorspace,
+        "dedup": args.dedup,
+        "coordinator": bool(args.coordinator),
+        "max_memory": args.max_memory,
+        "prefetch": args.prefetch,
+        "output_archive": args.output_archive,
+    }
+
+def _record(report: RunReport, res: Result):
+    report.record(res)
+    if report.done % 50 == 0 or report.done == report.total:
+        c = report.counts
+        print(
+            f"[{report.done}/{report.total}] hotovo… (ok={c.get('ok', 0)}, dedup={c.get('dedup', 0)}, "
+            f"skip={c.get('skipped_exists', 0)}, err={c.get('err', 0)})"
+        )
+
+def delete_originals(jobs: Iterable[Job]):
+    for j in jobs:
+        if j.dst.exists():
+            try:
+                j.src.unlink(missing_ok=True)
+            except Exception:
+                pass
+
+def print_summary(report: RunReport, out_root: Path):
+    c = report.counts
+    print("\n=== Souhrn ===")
+    print(f"OK:     {c.get('ok', 0)}")
+    if c.get("dedup"):
+        print(f"DEDUP:  {c['dedup']} (ušetřeno ~{report.dedup_saved_s:.1f}s enkódování)")
+    print(f"SKIP:   {c.get('skipped_exists', 0)} (existoval .webp a --overwrite nebyl zapnut)")
+    print(f"ERROR:  {c.get('err', 0)}")
+    print(f"Výstup: {out_root}")
+
+def run_pipelined(
+    args,
+    groups: List[List[Job]],
+    report: RunReport,
+    error_files: bool,
+    archive=None,
+    out_root: Optional[Path] = None,
+) -> dict:
+    """
+    --prefetch: čtení zdrojů dopředu (I/O vlákna), dekódování+enkódování
+    z paměťových bufferů (CPU workery) a zápis výstupů jedním writerem –
+    do souborů, nebo s `archive` sekvenčně do jednoho tar/zip archivu.
+    """
+    from batch_pipeline import Pipeline, read_source
+
+    budget = MemoryBudget(parse_size(args.max_memory))
+
+    def arc_name(job: Job) -> str:
+        return job.dst.relative_to(out_root).as_posix()
+
+    def write_fn(g, data, res):
+        job = g[0]
+        if archive is None:
+            return write_output(job, data, res)
+        t0 = time.perf_counter()
+        archive.add(arc_name(job), data, src=str(job.src))
+        res.path = Path(arc_name(job))
+        res.out_bytes = len(data)
+        res.t_write = time.perf_counter() - t0
+        return res
+
+    def link_fn(job: Job, rep: Result) -> Result:
+        if archive is None:
+            return link_duplicate(job, rep, args.overwrite, args.dedup_link)
+        if rep.status != "ok":
+            return Result("err", job.dst, job.src, error=f"duplicate of failed {rep.src}")
+        archive.add_alias(arc_name(job), rep.path.as_posix(), src=str(job.src))
+        return Result(
+            "dedup", Path(arc_name(job)), job.src,
+            in_bytes=rep.in_bytes, out_bytes=rep.out_bytes, pixels=rep.pixels,
+            dedup_of=rep.src, link="archive",
+            saved_s=rep.t_decode + rep.t_resize + rep.t_encode,
+        )
+
+    def read_fn(g):
+        job = g[0]
+        if archive is None and job.dst.exists() and not args.overwrite:
+            return None
+        return read_source(job.src, use_mmap=args.mmap)
+
+    def cpu_fn(g, buf):
+        job = g[0]
+        res = Result("ok", job.dst, job.src)
+        buf.seek(0, os.SEEK_END)
+        res.in_bytes = buf.tell()
+        buf.seek(0)
+        cost = 0
+        if budget.enabled:
+            try:
+                cost = estimate_peak_memory(buf, args.max_width, args.max_height)
+            except Exception:
+                cost = 0
+            buf.seek(0)
+        budget.acquire(cost)
         try:
-            err_file.write_text(
-                f"Source: {job.src}\nTarget: {job.dst}\n\n{repr(e)}\n",
-                encoding="utf-8",
+            data = encode_one(buf, res, args.quality, args.lossless, args.max_width, args.max_height,
+                              args.metadata, args.max_fps, args.colorspace)
+        finally:
+            budget.release(cost)
+        return data, res
+
+    pipe = Pipeline(
+        read_fn=read_fn,
+        cpu_fn=cpu_fn,
+        write_fn=write_fn,
+        skip_fn=lambda g: Result("skipped_exists", g[0].dst, g[0].src),
+        error_fn=lambda g, e: error_result(g[0], e, error_files),
+        workers=args.workers,
+        prefetch=args.prefetch,
+        io_threads=args.io_threads,
+    )
+    for g, rep in pipe.run(groups):
+        _record(report, rep)
+        for j in g[1:]:
+            _record(report, link_fn(j, rep))
+    return pipe.stats_dict()
+
+def print_pipeline_stats(stats: dict):
+    print("\n=== Pipeline ===")
+    for name, st in stats.items():
+        print(
+            f"{name:6s} položek={st['items']:<6d} práce={st['busy_s']:.2f}s nečinnost={st['idle_s']:.2f}s "
+            f"fronta prům={st['queue_avg']} max={st['queue_max']}"
+        )
+
+def needs_update(job: Job) -> bool:
+    """True, když výstup chybí nebo je starší než zdroj."""
+    try:
+        src_mtime = job.src.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return job.dst.stat().st_mtime_ns < src_mtime
+    except FileNotFoundError:
+        return True
+
+def run_watch(args, in_root: Path, out_root: Path, stop: Optional[threading.Event] = None):
+    """
+    Daemon (--watch): nejdřív dožene, co ve výstupu chybí nebo je zastaralé,
+    pak sleduje vstupní složku a nové/změněné soubory převádí stejným poolem.
+    """
+    from batch_watch import scan, watch
+
+    exts = {e.lower() for e in args.ext}
+    report = RunReport(args.report, total=0, interval=args.report_interval, meta={
+        **_report_meta(args, in_root, out_root),
+        "watch": True,
+    })
+    error_files = not report.enabled
+    if stop is None:
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    lock = threading.Lock()
+    inflight: dict = {}
+    ex = make_executor(args)
+
+    def submit(paths: Iterable[Path]):
+        todo = []
+        with lock:
+            for p in paths:
+                job = Job(src=p, dst=make_dst(p, in_root, out_root))
+                if p in inflight or not needs_update(job):
+                    continue
+                inflight[p] = job.src.stat().st_mtime_ns if job.src.exists() else None
+                todo.append(job)
+        report.add_total(len(todo))
+        for job in todo:
+            fut = ex.submit(
+                job_cost(ex, job, args), convert_one, job, args.quality, args.lossless,
+                args.max_width, args.max_height, True,
+                args.metadata, error_files, args.max_fps, args.colorspace,
             )
-        except Exception:
-            pass
-        return ("err", err_file)
+            fut.add_done_callback(lambda f, job=job: finished(job, f))
 
-def main():
+    def finished(job: Job, fut):
+        res = fut.result()
+        try:
+            mtime = job.src.stat().st_mtime_ns
+            res.latency_s = max(time.time() - mtime / 1e9, 0.0)
+        except OSError:
+            mtime = None
+        _record(report, res)
+        with lock:
+            started = inflight.pop(job.src, None)
+        # zdroj se změnil během konverze → znovu
+        if mtime is not None and started != mtime and not stop.is_set():
+            try:
+                submit([job.src])
+            except RuntimeError:
+                pass  # pool se už vypíná
+
+    submit(sorted(scan(in_root, exts)))
+    try:
+        watch(
+            in_root, exts, submit, stop,
+            quiet=args.debounce,
+            backend=args.watch_backend,
+            poll_interval=args.poll_interval,
+        )
+    finally:
+        ex.shutdown(wait=True)
+        report.finish(**_memory_stats(ex))
+        print_summary(report, out_root)
+
+def default_run_id(in_root: Path, out_root: Path) -> str:
+    return hashlib.sha1(f"{in_root}\n{out_root}".encode("utf-8")).hexdigest()[:16]
+
+def run_coordinated(args, in_root: Path, out_root: Path):
+    """
+    Worker nad sdílenou tabulkou jobů (--coordinator). Kolik workerů běží
+    (lokálně i na jiných hostech), tolik si jich bere chunky s leasem.
+    """
+    from batch_coordinator import Coordinator
+
+    coord = Coordinator(
+        args.coordinator,
+        args.run_id or default_run_id(in_root, out_root),
+        lease_seconds=args.lease,
+        max_attempts=args.max_attempts,
+    )
+    try:
+        if not args.no_seed:
+            rels = [p.relative_to(in_root).as_posix() for p in find_images(in_root, args.ext)]
+            added = coord.seed(rels)
+            print(f"[INFO] Coordinator {coord.run_id}: přidáno {added} jobů, worker {coord.owner}")
+
+        total = sum(coord.counts().values())
+        report = RunReport(args.report, total=total, interval=args.report_interval, meta={
+            **_report_meta(args, in_root, out_root),
+            "coordinator_run": coord.run_id,
+            "owner": coord.owner,
+        })
+        error_files = not report.enabled
+        chunk = max(1, args.chunk_size)
+        done_jobs: List[Job] = []
+
+        coord.start_heartbeat()
+        # heartbeat končí i při výjimce – jinak by dál obnovoval leasy a ostatní
+        # workery by joby převzaly až po close()
+        try:
+            with make_executor(args) as ex:
+                inflight: dict = {}
+                while True:
+                    # dokud má pool volno, bereme další chunk
+                    claimed = []
+                    if len(inflight) < args.workers:
+                        claimed = coord.claim(chunk)
+                        for c in claimed:
+                            src = in_root / c.rel
+                            job = Job(src=src, dst=make_dst(src, in_root, out_root))
+                            fut = ex.submit(
+                                job_cost(ex, job, args), convert_one, job, args.quality, args.lossless,
+                                args.max_width, args.max_height, args.overwrite,
+                                args.metadata, error_files, args.max_fps, args.colorspace,
+                            )
+                            inflight[fut] = (c, job)
+
+                    if not inflight:
+                        if not coord.unfinished():
+                            break
+                        # zbývají jen joby s leasem jiných workerů – počkat, až doběhnou/vyprší
+                        expiry = coord.next_expiry()
+                        wait_s = min(max((expiry or 0) - time.time(), 0.2), 1.0)
+                        time.sleep(wait_s)
+                        continue
+
+                    if claimed and len(inflight) < args.workers:
+                        continue
+                    finished, _ = futures.wait(inflight, timeout=1.0, return_when=futures.FIRST_COMPLETED)
+                    for f in finished:
+                        c, job = inflight.pop(f)
+                        res = f.result()
+                        if not coord.complete(c, res.status, res.error):
+                            print(f"[WARN] lease propadl, job převzal jiný worker: {c.rel}", file=sys.stderr)
+                        _record(report, res)
+                        done_jobs.append(job)
+        finally:
+            coord.stop_heartbeat()
+
+        counts = coord.counts()
+        report.finish(coordinator_counts=counts, **_memory_stats(ex))
+        if args.delete_originals:
+            delete_originals(done_jobs)
+        print_summary(report, out_root)
+        print(f"Run {coord.run_id}: {counts}")
+    finally:
+        coord.close()
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Rekurzivní převod JPG/PNG/HEIC → WEBP (rychle, paralelně)."
     )
@@ -126,19 +544,97 @@ def main():
                         help="Maximální šířka (poměr zachován).")
     parser.add_argument("--max-height", type=int, default=None,
                         help="Maximální výška (poměr zachován).")
+    parser.add_argument("--max-fps", type=float, default=None,
+                        help="Animace: omezit snímkovou frekvenci (rychlejší snímky se slijí).")
     parser.add_argument("--ext", nargs="*", default=list(SUPPORTED),
-                        help="Přípony ke konverzi (default: .jpg .jpeg .png .heic .heif).")
+                        help="Přípony ke konverzi (default: .jpg .jpeg .png .gif .heic .heif).")
     parser.add_argument("--overwrite", action="store_true",
                         help="Přepsat existující .webp (jinak se skipne).")
     parser.add_argument("--delete-originals", action="store_true",
                         help="Po úspěšné konverzi smazat původní soubor.")
     parser.add_argument("--workers", type=int, default=os.cpu_count() or 4,
                         help="Počet paralelních vláken (default = počet CPU).")
+    parser.add_argument("--max-memory", type=str, default=None,
+                        help="Paměťový rozpočet pro souběžné konverze, např. 4G nebo 'auto' (75 %% volné RAM). "
+                             "Joby se pouští podle odhadu z hlavičky obrázku; velké čekají, malé jedou dál.")
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="Pipeline: kolik zdrojů číst dopředu do paměti (0 = vypnuto). Pomáhá na NFS/HDD.")
+    parser.add_argument("--io-threads", type=int, default=2,
+                        help="Počet čtecích vláken pro --prefetch (default 2).")
+    parser.add_argument("--mmap", action="store_true",
+                        help="S --prefetch zdroje mmapovat (MADV_WILLNEED) místo načtení do paměti.")
+    parser.add_argument("--output-archive", type=str, default=None,
+                        help="Zapsat výstupy do jednoho archivu (.tar / .zip, '-' = tar stream na stdout) "
+                             "místo stromu souborů.")
+    parser.add_argument("--archive-format", choices=["tar", "zip"], default=None,
+                        help="Formát archivu (default podle přípony, pro stdout tar).")
+    parser.add_argument("--archive-index", type=str, default=None,
+                        help="NDJSON index src → offset/size v archivu (default <archiv>.index.ndjson).")
     parser.add_argument("--dry-run", action="store_true",
                         help="Zkušební běh – jen vypíše, co by dělal.")
-    parser.add_argument("--strip", action="store_true",
-                        help="NEukládat EXIF/ICC (menší soubory, ale ztratíš metadata).")
-    args = parser.parse_args()
+    parser.add_argument("--metadata", choices=METADATA_POLICIES, default="keep",
+                        help="Metadata: keep = EXIF+ICC, minimal = jen ICC a autor/copyright, "
+                             "strip = nic (EXIF se ani neparsuje).")
+    parser.add_argument("--colorspace", choices=COLORSPACES, default="keep",
+                        help="srgb = převést wide-gamut vstupy (P3, Adobe RGB, CMYK s profilem) do sRGB.")
+    parser.add_argument("--strip", action="store_const", const="strip", dest="metadata",
+                        help="Alias pro --metadata strip.")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Shodné zdroje (podle obsahu) převést jen jednou, ostatní výstupy nalinkovat.")
+    parser.add_argument("--dedup-link", choices=["auto", "reflink", "hardlink", "copy"], default="auto",
+                        help="Jak vytvořit výstupy duplikátů (auto = reflink → hardlink → kopie).")
+    parser.add_argument("--coordinator", type=str, default=None,
+                        help="Sdílená tabulka jobů (SQLAlchemy URL nebo cesta k SQLite souboru). "
+                             "Pro více hostů doporučen Postgres.")
+    parser.add_argument("--run-id", type=str, default=None,
+                        help="ID běhu v coordinatoru (default = hash vstupní+výstupní složky; "
+                             "na více hostech nastav stejné explicitně).")
+    parser.add_argument("--chunk-size", type=int, default=16,
+                        help="Kolik jobů si worker zabere najednou (default 16).")
+    parser.add_argument("--lease", type=float, default=60.0,
+                        help="Délka leasu v sekundách, heartbeat ho obnovuje každou třetinu (default 60).")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="Po kolika propadlých leasech job označit za chybný (default 3).")
+    parser.add_argument("--no-seed", action="store_true",
+                        help="Nezakládat joby ze vstupní složky, jen zpracovávat existující.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Daemon: dohnat chybějící výstupy a pak sledovat vstupní složku (inotify/polling).")
+    parser.add_argument("--watch-backend", choices=["auto", "inotify", "poll"], default="auto",
+                        help="Jak sledovat změny (auto = inotify na Linuxu, jinak polling).")
+    parser.add_argument("--debounce", type=float, default=1.0,
+                        help="Soubor převést až po tolika sekundách bez změny (default 1.0).")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="Interval skenování při pollingu v sekundách (default 2.0).")
+    parser.add_argument("--report", type=str, default=None,
+                        help="NDJSON report běhu (záznam na soubor, průběžná propustnost, souhrn).")
+    parser.add_argument("--report-interval", type=float, default=5.0,
+                        help="Interval průběžných snapshotů v reportu v sekundách (default 5).")
+    return parser
+
+def open_archive(args, stream=None):
+    from batch_archive import ArchiveWriter
+
+    index = args.archive_index
+    if index is None and args.output_archive != "-":
+        index = args.output_archive + ".index.ndjson"
+    return ArchiveWriter(args.output_archive, fmt=args.archive_format, index_path=index, stream=stream)
+
+def main():
+    args = build_parser().parse_args()
+
+    archive_stream = None
+    if args.output_archive == "-":
+        # archiv jde na stdout → veškerý textový výstup na stderr
+        archive_stream = sys.stdout.buffer
+        sys.stdout = sys.stderr
+    if args.output_archive and (args.watch or args.coordinator):
+        print("[ERR] --output-archive nejde kombinovat s --watch ani --coordinator.", file=sys.stderr)
+        sys.exit(2)
+    if args.dedup and (args.watch or args.coordinator):
+        print("[ERR] --dedup nejde kombinovat s --watch ani --coordinator.", file=sys.stderr)
+        sys.exit(2)
+    if args.output_archive and args.prefetch <= 0:
+        args.prefetch = max(2, args.workers * 2)
 
     in_root = Path(args.input).resolve()
     if not in_root.exists() or not in_root.is_dir():
@@ -153,6 +649,14 @@ def main():
     out_root = Path(args.output).resolve() if args.output else in_root
     out_root.mkdir(parents=True, exist_ok=True)
 
+    if args.watch and not args.dry_run:
+        run_watch(args, in_root, out_root)
+        return
+
+    if args.coordinator and not args.dry_run:
+        run_coordinated(args, in_root, out_root)
+        return
+
     imgs = find_images(in_root, args.ext)
     if not imgs:
         print("[INFO] Nenalezeny žádné obrázky.")
@@ -169,41 +673,59 @@ def main():
         print("[DRY-RUN] Konec.")
         sys.exit(0)
 
-    ok = skipped = errs = 0
+    report = RunReport(args.report, total=len(jobs), interval=args.report_interval, meta=_report_meta(args, in_root, out_root))
+    # s reportem jdou chyby do NDJSON místo .ERROR.txt vedle zdrojů
+    error_files = not report.enabled
+
+    hash_s = 0.0
+    if args.dedup:
+        groups, hash_s = group_duplicates(jobs)
+        dupes = sum(len(g) - 1 for g in groups)
+        print(f"[INFO] Dedup: {len(groups)} unikátních, {dupes} duplikátů (hash {hash_s:.2f}s)")
+    else:
+        groups = [[j] for j in jobs]
 
-    with futures.ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futs = [
-            ex.submit(
-                convert_one, j, args.quality, args.lossless,
-                args.max_width, args.max_height, args.overwrite,
-                args.strip,
+    if args.output_archive:
+        # do archivu zapisuje vždy jediný writer pipeline
+        archive = open_archive(args, stream=archive_stream)
+        try:
+            stats = run_pipelined(
+                args, groups, report, error_files,
+                archive=archive, out_root=out_root,
             )
-            for j in jobs
-        ]
-        for i, f in enumerate(futs, 1):
-            status, path = f.result()
-            if status == "ok":
-                ok += 1
-            elif status == "skipped_exists":
-                skipped += 1
-            else:
-                errs += 1
-            if i % 50 == 0 or i == len(futs):
-                print(f"[{i}/{len(futs)}] hotovo… (ok={ok}, skip={skipped}, err={errs})")
-
-    if args.delete_originals:
-        for j in jobs:
-            if j.dst.exists():
-                try:
-                    j.src.unlink(missing_ok=True)
-                except Exception:
-                    pass
+        finally:
+            archive.close()
+        report.finish(
+            hash_s=round(hash_s, 3), pipeline=stats,
+            archive={"path": args.output_archive, "format": archive.fmt, "entries": archive.entries, "bytes": archive.bytes},
+        )
+        print_pipeline_stats(stats)
+    elif args.prefetch > 0:
+        stats = run_pipelined(args, groups, report, error_files)
+        report.finish(hash_s=round(hash_s, 3), pipeline=stats)
+        print_pipeline_stats(stats)
+    else:
+        with make_executor(args) as ex:
+            futs = {
+                ex.submit(
+                    job_cost(ex, g[0], args), convert_one, g[0], args.quality, args.lossless,
+                    args.max_width, args.max_height, args.overwrite,
+                    args.metadata, error_files, args.max_fps, args.colorspace,
+                ): g
+                for g in groups
+            }
+            for f in futures.as_completed(futs):
+                rep = f.result()
+                _record(report, rep)
+                for j in futs[f][1:]:
+                    _record(report, link_duplicate(j, rep, args.overwrite, args.dedup_link))
 
-    print("\n=== Souhrn ===")
-    print(f"OK:     {ok}")
-    print(f"SKIP:   {skipped} (existoval .webp a --overwrite nebyl zapnut)")
-    print(f"ERROR:  {errs}")
-    print(f"Výstup: {out_root}")
+        report.finish(hash_s=round(hash_s, 3), **_memory_stats(ex))
+
+    if args.delete_originals and not args.output_archive:
+        delete_originals(jobs)
+
+    print_summary(report, Path(args.output_archive) if args.output_archive else out_root)
 
 if __name__ == "__main__":
     main()
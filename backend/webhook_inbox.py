@@ -0,0 +1,65 @@
+from __future__ import annotations
+import logging
+import threading
+from typing import Callable, Optional
+
+# Aplikace webhooků mimo request: endpoint event jen ověří, uloží do inboxu
+# (tabulka webhook_events, klíč = event id) a hned odpoví. Tohle vlákno pak
+# inbox po dávkách zpracuje. Vlastní DB logika je v app.py (apply_webhook_events);
+# tady je jen plánování – probuzení po uložení + pravidelný průchod, který
+# sebere eventy přijaté jiným workerem nebo nedokončené před restartem.
+
+log = logging.getLogger(__name__)
+
+
+class BackgroundApplier:
+    def __init__(self, apply_batch: Callable[[int], int], batch_size: int = 50, interval: float = 5.0,
+                 name: str = "webhook-applier"):
+        self.apply_batch = apply_batch
+        self.batch_size = max(1, int(batch_size))
+        self.interval = interval
+        self.name = name
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Spustí vlákno (jednou na proces; po forku gunicornu v každém workeru zvlášť)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def kick(self):
+        """Nový event v inboxu – zpracovat hned, ne až po `interval`."""
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def drain(self) -> int:
+        """Zpracuje dávky, dokud inbox nevrací plné dávky; vrací počet eventů."""
+        total = 0
+        while True:
+            done = self.apply_batch(self.batch_size)
+            total += done
+            if done < self.batch_size or self._stop.is_set():
+                return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.drain()
+            except Exception:
+                log.exception("webhook applier failed")
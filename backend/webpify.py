@@ -9,17 +9,14 @@ import sys
 import os
 
 # ── Pillow + HEIF (iPhone) ───────────────────────────────────────
-from PIL import Image, ImageOps
-
-HEIF_OK = False
-try:
-    # HEIC/HEIF podpora (iPhone)
-    from pillow_heif import register_heif_opener  # type: ignore
-    register_heif_opener()
-    HEIF_OK = True
-except Exception:
-    # HEIF plugin není – i tak poběží pro JPG/PNG
-    HEIF_OK = False
+from PIL import Image
+
+# metadata politika sdílená s API (convert.py leží vedle)
+from convert import METADATA_POLICIES, apply_orientation, metadata_kwargs
+# HEIC/HEIF podpora (iPhone) – plugin se registruje až u prvního HEIC souboru
+from image_io import heif_available, open_image
+
+HEIF_OK = heif_available()
 
 # iPhone fotky: .heic/.heif (plus standardní)
 SUPPORTED = {".jpg", ".jpeg", ".png", ".heic", ".heif", ".heics", ".heifs"}
@@ -52,7 +49,7 @@ def convert_one(
     max_w: int | None,
     max_h: int | None,
     overwrite: bool,
-    strip_meta: bool,
+    metadata: str,
 ) -> Tuple[str, Path]:
     """
     Return tuple(status, path). status ∈ {"ok", "skipped_exists", "err"}.
@@ -61,9 +58,9 @@ def convert_one(
         if job.dst.exists() and not overwrite:
             return ("skipped_exists", job.dst)
 
-        with Image.open(job.src) as im:
+        with open_image(job.src) as im:
             # 1) Respektuj EXIF rotaci (iPhone ji používá)
-            im = ImageOps.exif_transpose(im)
+            im = apply_orientation(im, metadata)
 
             # 2) Volitelné zmenšení (poměr zachován)
             if max_w or max_h:
@@ -85,19 +82,7 @@ def convert_one(
 
             ensure_parent(job.dst)
 
-            # 4) Metadata (EXIF/ICC)
-            exif_bytes = None
-            icc_profile = None
-            if not strip_meta:
-                try:
-                    exif = im.getexif()
-                    if exif:
-                        exif_bytes = exif.tobytes()
-                except Exception:
-                    exif_bytes = None
-                icc_profile = im.info.get("icc_profile")
-
-            # 5) Uložení do WebP
+            # 4) Uložení do WebP
             save_kwargs = {
                 "format": "WEBP",
                 "quality": quality,
@@ -105,11 +90,8 @@ def convert_one(
                 "lossless": bool(lossless),
                 "optimize": True,
             }
-            if icc_profile:
-                save_kwargs["icc_profile"] = icc_profile
-            if exif_bytes:
-                # Pillow umí přibalit EXIF i do WebP (novější verze)
-                save_kwargs["exif"] = exif_bytes
+            # 5) Metadata (EXIF/ICC) podle politiky keep / minimal / strip
+            save_kwargs.update(metadata_kwargs(im, metadata))
 
             im.save(job.dst, **save_kwargs)
 
@@ -153,8 +135,11 @@ def main():
                         help="Počet paralelních vláken (default = počet CPU).")
     parser.add_argument("--dry-run", action="store_true",
                         help="Zkušební běh – jen vypíše, co by dělal.")
-    parser.add_argument("--strip", action="store_true",
-                        help="NEukládat EXIF/ICC (menší soubory, ale ztratíš metadata).")
+    parser.add_argument("--metadata", choices=METADATA_POLICIES, default="keep",
+                        help="Metadata: keep = EXIF+ICC, minimal = jen ICC a autor/copyright, "
+                             "strip = nic (EXIF se ani neparsuje).")
+    parser.add_argument("--strip", action="store_const", const="strip", dest="metadata",
+                        help="Alias pro --metadata strip.")
     args = parser.parse_args()
 
     in_root = Path(args.input).resolve()
@@ -194,7 +179,7 @@ def main():
             ex.submit(
                 convert_one, j, args.quality, args.lossless,
                 args.max_width, args.max_height, args.overwrite,
-                args.strip,
+                args.metadata,
             )
             for j in jobs
         ]
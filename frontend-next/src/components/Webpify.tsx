@@ -13,6 +13,10 @@ const FREE_LIMIT = 3;
 const API_BASE = process.env.NEXT_PUBLIC_API_BASE || "/api";
 const DEFAULT_LANG = process.env.NEXT_PUBLIC_DEFAULT_LANG || "en";
 const COOKIE_CONSENT_KEY = "webpify_cookie_consent";
+// nad touto velikostí se nahrává po částech (/api/uploads), viz chunkedUpload
+const CHUNKED_UPLOAD_MIN = 32 * 1024 * 1024;
+const CHUNK_PARALLEL = 3;
+const CHUNK_RETRIES = 4;
 
 type QueueStatus = "pending" | "waiting" | "processing" | "done" | "error";
 type CookieConsent = "unknown" | "essential" | "all";
@@ -361,15 +365,90 @@ export default function Webpify() {
     setItems((prev) => prev.filter((i) => i.status !== "done"));
   }
 
+  // Preflight: server dostane jen SHA-256 souboru; když výsledek (nebo originál) už má,
+  // vrátí rovnou WebP a upload odpadá. 204 / chyba / bez WebCrypto → normální upload.
+  async function preflight(item: QueueItem, q: number, maxW: number, headers: HeadersInit | undefined) {
+    if (typeof crypto === "undefined" || !crypto.subtle) return null;
+    try {
+      const digest = await crypto.subtle.digest("SHA-256", await item.file.arrayBuffer());
+      const sha256 = Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+      const res = await fetch(`${API_BASE}/convert/preflight`, {
+        method: "POST",
+        headers: { ...(headers || {}), "Content-Type": "application/json" },
+        body: JSON.stringify({
+          sha256,
+          size: item.file.size,
+          filename: item.name,
+          quality: q,
+          ...(maxW ? { max_width: maxW } : {}),
+        }),
+      });
+      return res.status === 200 ? res : null;
+    } catch {
+      return null;
+    }
+  }
+
+  // Velké soubory po částech: výpadek spojení znamená opakovat jen jednu část, ne celý upload.
+  // Vyčerpaný free limit hlásí už založení session – 402 se vrací volajícímu jako odpověď konverze.
+  async function chunkedUpload(item: QueueItem, headers: HeadersInit | undefined): Promise<string | Response> {
+    const jsonHeaders = { ...(headers || {}), "Content-Type": "application/json" };
+    const created = await fetch(`${API_BASE}/uploads`, {
+      method: "POST",
+      headers: jsonHeaders,
+      body: JSON.stringify({ filename: item.name, size: item.file.size }),
+    });
+    if (created.status === 402) return created;
+    if (!created.ok) throw new Error(`API ${created.status}: upload session failed`);
+    const { upload_id: uploadId, chunk_size: chunkSize, chunks } = await created.json();
+
+    let next = 0;
+    async function sender() {
+      while (next < chunks) {
+        const index = next++;
+        const body = item.file.slice(index * chunkSize, (index + 1) * chunkSize);
+        for (let attempt = 1; ; attempt++) {
+          try {
+            const res = await fetch(`${API_BASE}/uploads/${uploadId}/chunks/${index}`, { method: "PUT", body, headers });
+            if (res.ok) break;
+            if (res.status < 500 || attempt >= CHUNK_RETRIES) throw new Error(`API ${res.status}: chunk ${index} failed`);
+          } catch (e) {
+            if (attempt >= CHUNK_RETRIES) throw e;
+          }
+          await new Promise((r) => setTimeout(r, 500 * attempt));
+        }
+      }
+    }
+    await Promise.all(Array.from({ length: Math.min(CHUNK_PARALLEL, chunks) }, sender));
+
+    const committed = await fetch(`${API_BASE}/uploads/${uploadId}/commit`, { method: "POST", headers });
+    if (!committed.ok) throw new Error(`API ${committed.status}: upload commit failed`);
+    return uploadId as string;
+  }
+
   async function convertOne(item: QueueItem, opts: { quality: number; maxWidth: number }) {
     const { quality: q, maxWidth: maxW } = opts;
-    const fd = new FormData();
-    fd.append("image", item.file);
-    fd.append("quality", String(q));
-    if (maxW) fd.append("max_width", String(maxW));
-
     const headers: HeadersInit | undefined = authToken ? { Authorization: `Bearer ${authToken}` } : undefined;
-    const res = await fetch(`${API_BASE}/convert`, { method: "POST", body: fd, headers });
+
+    let res = await preflight(item, q, maxW, headers);
+    if (!res && item.file.size > CHUNKED_UPLOAD_MIN) {
+      const uploadId = await chunkedUpload(item, headers);
+      if (uploadId instanceof Response) {
+        res = uploadId;
+      } else {
+        const fd = new FormData();
+        fd.append("upload_id", uploadId);
+        fd.append("quality", String(q));
+        if (maxW) fd.append("max_width", String(maxW));
+        res = await fetch(`${API_BASE}/convert`, { method: "POST", body: fd, headers });
+      }
+    } else if (!res) {
+      const fd = new FormData();
+      fd.append("image", item.file);
+      fd.append("quality", String(q));
+      if (maxW) fd.append("max_width", String(maxW));
+      res = await fetch(`${API_BASE}/convert`, { method: "POST", body: fd, headers });
+    }
     if (res.status === 401) {
       throw new Error(t.needLoginConvert || FALLBACK_TEXTS.needLoginConvert);
     }